@@ -0,0 +1,40 @@
+"""Run time of the Euler benchmark programs under each execution backend.
+
+Programs are parsed and resolved once; compiling and transpiling count towards run time.
+
+Usage: python benchmarks/backend_bench.py [repeats]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from evaluator import BACKENDS, parse, resolve
+from programs import EULER, RECURSIVE
+
+
+def best_time(run, program, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(program)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':>10}  " + "  ".join(f"{name:>10}" for name in BACKENDS) + "   speedup over tree")
+    for name, src in {**EULER, **RECURSIVE}.items():
+        program = resolve(parse(src))
+        times = [best_time(run, program, repeats) for run in BACKENDS.values()]
+        cells = "  ".join(f"{t * 1000:7.1f} ms" for t in times)
+        speedups = " ".join(f"{times[0] / t:6.1f}x" for t in times[1:])
+        print(f"{name:>10}: {cells}   {speedups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Function-call cost under the tree-walk evaluator, with call frames copied from each
+function's template and with frames built by new_frame, as before templates.
+
+Usage: python benchmarks/call_bench.py [repeats]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import evaluator
+import runtime
+from programs import RECURSIVE
+
+
+def built_frame(func):
+    return runtime.new_frame(func.node.frame_size, func.env, func.node.hoisted)
+
+
+def measure(src, repeats):
+    """Best run time of `src`."""
+    program = evaluator.resolve(evaluator.parse(src))
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            evaluator.run(program)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    template_frame = runtime.Function.call_frame
+    for name, src in RECURSIVE.items():
+        runtime.Function.call_frame = built_frame
+        try:
+            built = measure(src, repeats)
+        finally:
+            runtime.Function.call_frame = template_frame
+        copied = measure(src, repeats)
+        print(f"{name:>10}: new_frame {built * 1000:8.1f} ms | template {copied * 1000:8.1f} ms  "
+              f"{built / copied:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Instructions per second of the bytecode VM under each dispatch strategy.
+
+"if/elif chain" is the loop the VM had before its handler table: every instruction is
+compared against the opcodes in turn and the stack is used through push/pop closures.
+"handler table" is bytecode_eval.execute_bytecode. Both run the same code objects with the
+same semantics; each program is first run once under each, and the bench stops unless
+they print the same, return the same and execute the same number of instructions.
+
+Usage: python benchmarks/dispatch_bench.py [repeats]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import bytecode_eval
+from bytecode_gen import *
+from evaluator import parse, resolve
+from runtime import *
+from programs import EULER, RECURSIVE
+
+
+def execute_chain(code_object, frame):
+    """The VM as it dispatched before the handler table: one if/elif chain over the opcode."""
+    code, consts = code_object.code, code_object.consts
+    ip = 0
+    operand = []
+    
+    def push(x):
+        operand.append(x)
+    
+    def pop():
+        return operand.pop()
+    
+    while True:
+        opcode = code[ip]
+        arg = code[ip + 1]
+        ip += 2
+        if opcode == HALT or opcode == RETURN:
+            return pop() if operand else None
+        elif opcode == NOP:
+            pass
+        elif opcode == PUSH_CONST:
+            push(consts[arg])
+        elif opcode == POP:
+            pop()
+        elif opcode == DUP:
+            push(operand[-1])
+        elif opcode == LOAD:
+            push(frame[arg])
+        elif opcode == LOAD_OUTER:
+            push(outer(frame, arg >> SLOT_BITS)[arg & SLOT_MASK])
+        elif opcode == ADD:
+            r = pop()
+            l = pop()
+            push(l + r)
+        elif opcode == SUB:
+            r = pop()
+            l = pop()
+            push(l - r)
+        elif opcode == MUL:
+            r = pop()
+            l = pop()
+            push(l * r)
+        elif opcode == NEG:
+            l = pop()
+            push(-l)
+        elif opcode == DIV:
+            r = pop()
+            l = pop()
+            push(l / r)
+        elif opcode == MOD:
+            r = pop()
+            l = pop()
+            push(l % r)
+        elif opcode == POW:
+            r = pop()
+            l = pop()
+            push(nexus_pow(l, r))
+        elif opcode == LT:
+            r = pop()
+            l = pop()
+            push(l < r)
+        elif opcode == GT:
+            r = pop()
+            l = pop()
+            push(l > r)
+        elif opcode == EQ:
+            r = pop()
+            l = pop()
+            push(l == r)
+        elif opcode == NEQ:
+            r = pop()
+            l = pop()
+            push(l != r)
+        elif opcode == LE:
+            r = pop()
+            l = pop()
+            push(l <= r)
+        elif opcode == GE:
+            r = pop()
+            l = pop()
+            push(l >= r)
+        elif opcode == AND:
+            r = pop()
+            l = pop()
+            push(l and r)
+        elif opcode == OR:
+            r = pop()
+            l = pop()
+            push(l or r)
+        elif opcode == BAND:
+            r = pop()
+            l = pop()
+            push(l & r)
+        elif opcode == BOR:
+            r = pop()
+            l = pop()
+            push(l | r)
+        elif opcode == BXOR:
+            r = pop()
+            l = pop()
+            push(l ^ r)
+        elif opcode == SHL:
+            r = pop()
+            l = pop()
+            push(l << r)
+        elif opcode == SHR:
+            r = pop()
+            l = pop()
+            push(l >> r)
+        elif opcode == NOT:
+            l = pop()
+            push(not l)
+        elif opcode == BNOT:
+            l = pop()
+            push(~l)
+        elif opcode == ASCII:
+            l = pop()
+            push(ord(l))
+        elif opcode == CHAR:
+            l = pop()
+            push(chr(l))
+        elif opcode == VARBIND:
+            frame[arg] = pop()  # binds in the current frame
+        elif opcode == ASSIGN:
+            frame[arg] = pop()
+        elif opcode == ASSIGN_OUTER:
+            outer(frame, arg >> SLOT_BITS)[arg & SLOT_MASK] = pop()
+        elif opcode == DISPLAY:
+            value = pop()
+            print(value, end="")
+        elif opcode == DISPLAYL:
+            value = pop()
+            print(value)
+        elif opcode == FEED:
+            push(input(pop()))
+        elif opcode == JUMP:
+            ip = arg
+        elif opcode == JUMP_IF_FALSE:
+            if not pop():
+                ip = arg
+        elif opcode == JUMP_IF_TRUE:
+            if pop():
+                ip = arg
+        elif opcode == BREAK:  # leaves the value for MOVEON unless it is BREAKOUT_SIGNAL
+            if operand[-1] is BREAKOUT_SIGNAL:
+                pop()
+                ip = arg
+        elif opcode == MOVEON:
+            if pop() is MOVEON_SIGNAL:
+                ip = arg
+        elif opcode == FUNC_DEF:
+            funcDef = consts[arg]
+            frame[funcDef.slot] = Function(funcDef, frame)
+        elif opcode == FUNC_CALL or opcode == TAIL_CALL:
+            argc = arg & ARGC_MASK
+            func = operand[-1 - argc]
+            if (opcode == TAIL_CALL and isinstance(func, Function) and func.env is frame[0]
+                    and func.template is not None and func.node.bytecode.consts is consts
+                    and argc >= len(func.node.funcParams)):  # same frame, code started over
+                args = operand[len(operand) - argc:len(operand) - argc + len(func.node.funcParams)]
+                del operand[len(operand) - argc - 1:]
+                frame[:] = func.template
+                frame[1:len(args) + 1] = args
+                ip = 0
+            else:
+                args = operand[len(operand) - argc:]
+                del operand[len(operand) - argc:]
+                func = pop()
+                if not isinstance(func, Function):
+                    raise ValueError(f"Function {consts[arg >> ARGC_BITS]} is not defined correctly.")
+                funcDef = func.node
+                if func.memo is not None:
+                    push(memoized_call(func, args[:len(funcDef.funcParams)], invoke_chain))
+                else:
+                    funcFrame = func.call_frame()
+                    for i in range(len(funcDef.funcParams)):  # parameters are slots 1..n
+                        funcFrame[i + 1] = args[i]
+                    push(execute_chain(funcDef.bytecode, funcFrame))
+        elif opcode == BUILD_ARRAY:
+            items = operand[len(operand) - arg:]
+            del operand[len(operand) - arg:]
+            push(items)
+        elif opcode == BUILD_HASH:
+            items = operand[len(operand) - 2 * arg:]
+            del operand[len(operand) - 2 * arg:]
+            push(dict(zip(items[::2], items[1::2])))
+        elif opcode == GET_ITEM:
+            index = pop()
+            container = pop()
+            push(container[index])
+        elif opcode == SET_ITEM:
+            index = pop()
+            container = pop()
+            container[index] = operand[-1]
+        elif opcode == PUSH_FRONT:
+            value = pop()
+            operand[-1].insert(0, value)
+        elif opcode == PUSH_BACK:
+            value = pop()
+            operand[-1].append(value)
+        elif opcode == POP_FRONT:
+            push(pop_front(pop(), consts[arg]))
+        elif opcode == POP_BACK:
+            push(pop_back(pop(), consts[arg]))
+        elif opcode == LENGTH:
+            push(len(pop()))
+        elif opcode == CLEAR:
+            operand[-1].clear()
+        elif opcode == INSERT:
+            value = pop()
+            index = pop()
+            operand[-1].insert(index, value)
+        elif opcode == REMOVE_AT:
+            index = pop()
+            push(remove_at(pop(), index, consts[arg]))
+        elif opcode == REMOVE_KEY:
+            key = pop()
+            push(remove_key(pop(), key, consts[arg]))
+        else:
+            raise ValueError(f"Invalid opcode {OPNAMES[opcode]} in bytecode.")
+
+
+def invoke_chain(func, args):
+    funcFrame = func.call_frame()
+    for i in range(len(func.node.funcParams)):
+        funcFrame[i + 1] = args[i]
+    return execute_chain(func.node.bytecode, funcFrame)
+
+
+STRATEGIES = {"if/elif chain": execute_chain, "handler table": bytecode_eval.execute_bytecode}
+
+
+def function_code(hoisted):
+    """The code objects of the functions among `hoisted` and the functions in them."""
+    for funcDef in hoisted:
+        yield funcDef.bytecode
+        yield from function_code(funcDef.hoisted)
+
+
+def counted_run(execute, code, program):
+    """(output, result, instructions executed) of one run of `code` under `execute`. The
+    table counts handler calls; the chain counts the opcodes it reads from the code."""
+    count = 0
+    handlers = list(bytecode_eval.HANDLERS)
+    arrays = [(code_object, code_object.code) for code_object in [code, *function_code(program[0].hoisted)]]
+
+    def counting(handler):
+        def counted(*args):
+            nonlocal count
+            count += 1
+            return handler(*args)
+        return counted
+
+    class Counted(list):
+        def __getitem__(self, ip):
+            nonlocal count
+            count += not ip & 1
+            return list.__getitem__(self, ip)
+
+    if execute is execute_chain:
+        for code_object, instructions in arrays:
+            code_object.code = Counted(instructions)
+    else:
+        bytecode_eval.HANDLERS[:] = [counting(handler) for handler in handlers]
+    try:
+        output, result, _ = run(execute, code, program)
+    finally:
+        bytecode_eval.HANDLERS[:] = handlers
+        for code_object, instructions in arrays:
+            code_object.code = instructions
+    return output, result, count
+
+
+def run(execute, code, program):
+    """(output, result, seconds) of one run of `code` under `execute`."""
+    lines, _ = program
+    frame = new_frame(lines.frame_size, None, lines.hoisted)
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        result = execute(code, frame)
+    return out.getvalue(), result, time.perf_counter() - start
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':>10}  {'instructions':>12}  " + "  ".join(f"{name:>16}" for name in STRATEGIES) + "   speedup")
+    for name, src in {**EULER, **RECURSIVE}.items():
+        program = resolve(parse(src))
+        code = codegen(program)  # also sets the functions' code objects, which both strategies share
+        runs = [counted_run(execute, code, program) for execute in STRATEGIES.values()]
+        assert runs[0] == runs[-1], f"{name}: the strategies disagree on output, result or instructions"
+        count = runs[0][-1]
+        times = [min(run(execute, code, program)[-1] for _ in range(repeats)) for execute in STRATEGIES.values()]
+        cells = "  ".join(f"{count / t / 1e6:8.2f} Minsn/s" for t in times)
+        print(f"{name:>10}: {count:>12}  {cells}   {times[0] / times[-1]:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
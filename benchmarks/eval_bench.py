@@ -0,0 +1,33 @@
+"""Run time of the Euler benchmark programs under the tree-walk evaluator.
+
+Usage: python benchmarks/eval_bench.py [repeats]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from evaluator import execute
+from programs import EULER
+
+
+def best_time(src, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            execute(src)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, src in EULER.items():
+        print(f"{name:>8}: {best_time(src, repeats) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
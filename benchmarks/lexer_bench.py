@@ -0,0 +1,30 @@
+"""Lexer throughput: the master-pattern `lex` against the old `lex_legacy` loop.
+
+Usage: python benchmarks/lexer_bench.py [megabytes]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from lexer import lex, lex_legacy
+from programs import generated_source
+
+
+def throughput(lexer, src):
+    start = time.perf_counter()
+    count = sum(1 for _ in lexer(src))
+    return count, count / (time.perf_counter() - start)
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    src = generated_source(int(megabytes * 1024 * 1024))
+    print(f"input: {len(src) / 1024 / 1024:.2f} MB")
+    for name, lexer in (("lex_legacy", lex_legacy), ("lex", lex)):
+        count, rate = throughput(lexer, src)
+        print(f"{name:>12}: {count} tokens, {rate:,.0f} tokens/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Run time of recursive programs with `fnmemo` and with their functions as plain `fn`,
+per backend, and the memo hits and misses of a run.
+
+Usage: python benchmarks/memo_bench.py [repeats]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from backend_bench import best_time
+from evaluator import BACKENDS, parse, resolve
+from programs import MEMO
+from runtime import memo_stats
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'':>10}  {'backend':>8}  {'fn':>10}  {'fnmemo':>10}  speedup  hits/misses per run")
+    for name, src in MEMO.items():
+        for backend, run in BACKENDS.items():
+            plain = best_time(run, resolve(parse(src.replace("fnmemo", "fn"))), repeats)
+            program = resolve(parse(src))
+            memo = best_time(run, program, repeats)
+            lookups = ", ".join(f"{stats.hits // repeats}/{stats.misses // repeats}"
+                                for stats in memo_stats(program[0].hoisted))
+            print(f"{name:>10}  {backend:>8}  {plain * 1000:7.1f} ms  {memo * 1000:7.1f} ms  {plain / memo:6.1f}x  {lookups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Start-up time of growing programs: parsing and compiling the source vs loading .nxb.
+
+Each program is the Euler programs wrapped in `copies` functions apiece, so the amount of
+code grows while nothing runs. "front end" is lex + parse + resolve + codegen and the
+optimizer passes; "load" is `nxb.load` of the file `--compile` writes.
+
+Usage: python benchmarks/nxb_bench.py [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import nxb
+from bytecode_eval import compile_program
+from evaluator import parse, resolve
+from programs import EULER
+
+
+def name(i):
+    """A distinct identifier per function; identifiers are letters only."""
+    letters = ""
+    while True:
+        i, digit = divmod(i, 26)
+        letters += chr(ord("a") + digit)
+        if not i:
+            return "program" + letters
+
+
+def source(copies):
+    return "".join(f"fn {name(i)}() {{ {src} }};\n" for i, src in enumerate(list(EULER.values()) * copies))
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'copies':>8}  {'bytes':>9}  {'front end':>10}  {'load':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "program.nxb")
+        for copies in (1, 10, 100, 500):
+            src = source(copies)
+            front_end = best_time(lambda: compile_program(resolve(parse(src, buffered=True))), repeats)
+            size = nxb.compile_file(resolve(parse(src, buffered=True)), path)
+            load = best_time(lambda: nxb.load(path), repeats)
+            print(f"{copies:>8}  {size:>9}  {front_end * 1000:7.1f} ms  {load * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Run time of the benchmark programs with and without the AST optimizer, per backend.
+
+"plain" runs `resolve(program, optimized=False)`, "optimized" the tree `resolve` gives by
+default (see src/optimizer.py). Programs are parsed and resolved once per variant.
+
+Usage: python benchmarks/optimizer_bench.py [repeats]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from backend_bench import best_time
+from evaluator import BACKENDS, parse, resolve
+from programs import ARITHMETIC, CALLS, EULER, RECURSIVE
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':>12}  {'backend':>8}  {'plain':>10}  {'optimized':>10}  speedup")
+    for name, src in {**ARITHMETIC, **CALLS, **EULER, **RECURSIVE}.items():
+        for backend, run in BACKENDS.items():
+            plain = best_time(run, resolve(parse(src), optimized=False), repeats)
+            optimized = best_time(run, resolve(parse(src)), repeats)
+            print(f"{name:>12}  {backend:>8}  {plain * 1000:7.1f} ms  {optimized * 1000:7.1f} ms  {plain / optimized:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
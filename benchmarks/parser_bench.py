@@ -0,0 +1,51 @@
+"""Parse time: the descent chain against the Pratt expression parser.
+
+Usage: python benchmarks/parser_bench.py [kilobytes]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from parser import parse
+from programs import generated_source
+
+
+def expression_source(size_bytes):
+    """Arithmetic- and comparison-heavy statements over a handful of variables."""
+    lines = ["var a = 1;", "var b = 2;", "var c = 3;"]
+    exprs = [
+        "a = (a + b * c - 4) % 7 + b / 2;",
+        "b = a * a + b * b - 2 * a * b + (c << 1) - (c >> 1);",
+        "c = a < b and b <= c or not (a == c) and (a & b | c ^ 1) != 0;",
+        "displayl a + b + c + 10 * 3 ** 2 - 1;",
+    ]
+    size = sum(len(line) for line in lines)
+    while size < size_bytes:
+        line = exprs[len(lines) % len(exprs)]
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def best_time(src, repeats, **kwargs):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse(src, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    kilobytes = float(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, src in (("expressions", expression_source(int(kilobytes * 1024))),
+                      ("euler", generated_source(int(kilobytes * 1024)))):
+        chain = best_time(src, 5)
+        pratt = best_time(src, 5, pratt=True)
+        print(f"{name:>12}: chain {chain * 1000:8.1f} ms, pratt {pratt * 1000:8.1f} ms, "
+              f"{chain / pratt:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Nexus programs shared by the benchmarks in this directory.
+
+The Euler programs are the ones from `tests/project_euler_codes.py`, rewritten
+where needed so they lex and run today (identifiers are letters only).
+"""
+
+EULER_1 = """
+var x = 999;
+var res = 0;
+while (x > 0) {
+    if (x % 3 == 0 or x % 5 == 0) then {
+        res += x;
+    } end;
+    x -= 1;
+};
+displayl res;
+"""
+
+EULER_2 = """
+var limit = 4000000;
+var a = 1;
+var b = 2;
+var sum = 0;
+while (b < limit) {
+    if (b % 2 == 0) then {
+        sum += b;
+    } end;
+    var temp = a + b;
+    a = b;
+    b = temp;
+};
+displayl sum;
+"""
+
+EULER_6 = """
+var sumsq = 0;
+var sqsum = 0;
+var i = 1;
+while (i <= 100) {
+    sumsq += i * i;
+    sqsum += i;
+    i += 1;
+};
+sqsum *= sqsum;
+displayl sqsum - sumsq;
+"""
+
+EULER_14 = """
+fn collatz(n) {
+    var length = 1;
+    while (n != 1) {
+        if (n % 2 == 0) then {
+            n = n >> 1;
+        } else {
+            n = 3 * n + 1;
+        } end;
+        length += 1;
+    };
+    length;
+}
+
+var best = 0;
+var start = 0;
+var i = 1;
+while (i < 3000) {
+    var length = collatz(i);
+    if (length > best) then {
+        best = length;
+        start = i;
+    } end;
+    i += 1;
+};
+displayl start;
+"""
+
+EULER = {"euler1": EULER_1, "euler2": EULER_2, "euler6": EULER_6, "euler14": EULER_14}
+
+# EULER_14 up to 1000 instead of 3000, the size the collatz entry has been timed at
+COLLATZ = EULER_14.replace("while (i < 3000)", "while (i < 1000)")
+
+FACTORIAL = """
+fnrec fact(n) {
+    if n <= 1 then 1 else n * fact(n - 1) end;
+};
+var i = 0;
+var total = 0;
+while (i < 300) {
+    total += fact(40);
+    i += 1;
+};
+displayl total;
+"""
+
+GCD = """
+fnrec gcd(a, b) {
+    if b == 0 then a else gcd(b, a % b) end;
+};
+var total = 0;
+for (var i = 1; i < 3000; i += 1) {
+    total += gcd(i * 7919, 104729 + i);
+};
+displayl total;
+"""
+
+FIB = """
+fn fib(n) {
+    if n < 2 then n else fib(n - 1) + fib(n - 2) end;
+};
+displayl fib(18);
+"""
+
+RECURSIVE = {"factorial": FACTORIAL, "gcd": GCD, "fib": FIB, "collatz": COLLATZ}
+
+PYTHAGOREAN = """
+fn right(a, b, c) {
+    a ** 2 + b ** 2 == c ** 2;
+};
+var count = 0;
+for (var a = 1; a < 100; a += 1) {
+    for (var b = a; b < 100; b += 1) {
+        if right(a, b, 200 - a - b) then count += 1 end;
+    };
+};
+displayl count;
+"""
+
+LATTICE = """
+var radius = 50;
+var inside = 0;
+for (var x = 0 - radius; x <= radius; x += 1) {
+    for (var y = 0 - radius; y <= radius; y += 1) {
+        if x * x + y * y <= radius * radius then inside += 1 end;
+    };
+};
+displayl inside;
+"""
+
+ARITHMETIC = {"pythagorean": PYTHAGOREAN, "lattice": LATTICE}
+
+CLAMP = """
+fn clamp(x, lo, hi) {
+    if x < lo then lo else (if x > hi then hi else x end) end;
+};
+fn mix(a, b) {
+    clamp(a * 7 - b * 3, 0, 255);
+};
+var total = 0;
+for (var i = 0; i < 20000; i += 1) {
+    total += mix(i % 300, i % 17);
+};
+displayl total;
+"""
+
+CALLS = {"clamp": CLAMP}
+
+COLLATZ_MEMO = """
+fnmemo steps(n) {
+    if n == 1 then 0 else (if n % 2 == 0 then 1 + steps(n >> 1) else 1 + steps(3 * n + 1) end) end;
+};
+var best = 1;
+for (var i = 2; i < 1000; i += 1) {
+    if steps(i) > steps(best) then best = i end;
+};
+displayl best;
+"""
+
+FIB_MEMO = """
+fnmemo fib(n) {
+    if n < 2 then n else fib(n - 1) + fib(n - 2) end;
+};
+displayl fib(20);
+"""
+
+PATHS_MEMO = """
+fnmemo paths(r, c) {
+    if r == 0 or c == 0 then 1 else paths(r - 1, c) + paths(r, c - 1) end;
+};
+displayl paths(9, 9);
+"""
+
+MEMO = {"collatz": COLLATZ_MEMO, "fib": FIB_MEMO, "paths": PATHS_MEMO}
+
+
+def _letters(n: int) -> str:
+    name = ""
+    while True:
+        n, r = divmod(n, 26)
+        name += chr(ord("a") + r)
+        if n == 0:
+            return name
+
+
+def generated_source(size_bytes: int) -> str:
+    """Copies of the Euler programs, each wrapped in its own `fn`, up to `size_bytes`.
+
+    Wrapping keeps every copy in a scope of its own so the result also parses.
+    """
+    programs = list(EULER.values())
+    chunks = []
+    size = 0
+    while size < size_bytes:
+        body = programs[len(chunks) % len(programs)]
+        chunk = f"fn gen{_letters(len(chunks))}() {{\n{body}\n}};\n"
+        chunks.append(chunk)
+        size += len(chunk)
+    return "".join(chunks)
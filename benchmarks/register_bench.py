@@ -0,0 +1,68 @@
+"""Instructions executed and run time of the Euler programs on the stack and register VMs.
+
+Programs are parsed and resolved once; code generation counts towards run time.
+
+Usage: python benchmarks/register_bench.py [repeats]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import bytecode_eval
+from evaluator import parse, resolve
+from programs import EULER, RECURSIVE
+
+VMS = {
+    "stack": (bytecode_eval.run, bytecode_eval.HANDLERS),
+    "register": (bytecode_eval.run_registers, bytecode_eval.REG_HANDLERS),
+}
+
+
+def count_instructions(run, handlers, program):
+    """Instructions one run of `program` executes, counted through the VM's handler table."""
+    count = 0
+    original = list(handlers)
+
+    def counting(handler):
+        def counted(*args):
+            nonlocal count
+            count += 1
+            return handler(*args)
+        return counted
+
+    handlers[:] = [counting(handler) for handler in original]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(program)
+    finally:
+        handlers[:] = original
+    return count
+
+
+def best_time(run, program, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(program)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':>10}  " + "  ".join(f"{name + ' insns':>14}  {'time':>9}" for name in VMS)
+          + "   fewer insns  speedup")
+    for name, src in {**EULER, **RECURSIVE}.items():
+        program = resolve(parse(src))
+        counts = [count_instructions(run, handlers, program) for run, handlers in VMS.values()]
+        times = [best_time(run, program, repeats) for run, _ in VMS.values()]
+        cells = "  ".join(f"{count:>14}  {t * 1000:6.1f} ms" for count, t in zip(counts, times))
+        print(f"{name:>10}: {cells}   {counts[0] / counts[1]:10.2f}x  {times[0] / times[1]:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
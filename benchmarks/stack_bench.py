@@ -0,0 +1,41 @@
+"""Run time of the recursive programs on the tree-walker and the stack evaluator, and the
+deepest non-tail recursion each of them runs.
+
+Usage: python benchmarks/stack_bench.py [repeats]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from backend_bench import best_time
+from evaluator import BACKENDS, parse, resolve
+from programs import RECURSIVE
+
+DEPTH = "fn depth(n) { if n == 0 then 0 else 1 + depth(n - 1) end; }; displayl depth(%d);"
+
+
+def deepest(run, limit=1 << 20):
+    """The largest power of two up to `limit` that depth(n) runs to."""
+    n = 1
+    while n < limit:
+        try:
+            best_time(run, resolve(parse(DEPTH % (n * 2))), 1)
+        except RecursionError:
+            break
+        n *= 2
+    return n
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    backends = {name: BACKENDS[name] for name in ("tree", "stack")}
+    print(f"{'':>10}  {'tree':>10}  {'stack':>10}  speedup")
+    for name, src in RECURSIVE.items():
+        program = resolve(parse(src))
+        tree, stack = (best_time(run, program, repeats) for run in backends.values())
+        print(f"{name:>10}  {tree * 1000:7.1f} ms  {stack * 1000:7.1f} ms  {tree / stack:6.1f}x")
+    print("deepest recursion: " + ", ".join(f"{name} {deepest(run)}" for name, run in backends.items()))
+
+
+if __name__ == "__main__":
+    main()
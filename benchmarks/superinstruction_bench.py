@@ -0,0 +1,42 @@
+"""Instructions executed and run time of the Euler programs on the stack VM, with and
+without the superinstructions of src/superinstructions.py.
+
+Programs are parsed and resolved once; code generation counts towards run time.
+
+Usage: python benchmarks/superinstruction_bench.py [repeats]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import bytecode_eval
+from evaluator import parse, resolve
+from peephole import optimize_program
+from programs import EULER, RECURSIVE
+from register_bench import best_time, count_instructions
+
+
+def run_unfused(program):
+    lines, _ = program
+    code = bytecode_eval.codegen(program)
+    optimize_program(program, code)
+    bytecode_eval.execute_bytecode(code, bytecode_eval.new_frame(lines.frame_size, None, lines.hoisted))
+
+
+RUNS = {"unfused": run_unfused, "fused": bytecode_eval.run}
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':>10}  " + "  ".join(f"{name + ' insns':>14}  {'time':>9}" for name in RUNS)
+          + "   fewer insns  speedup")
+    for name, src in {**EULER, **RECURSIVE}.items():
+        program = resolve(parse(src))
+        counts = [count_instructions(run, bytecode_eval.HANDLERS, program) for run in RUNS.values()]
+        times = [best_time(run, program, repeats) for run in RUNS.values()]
+        cells = "  ".join(f"{count:>14}  {t * 1000:6.1f} ms" for count, t in zip(counts, times))
+        print(f"{name:>10}: {cells}   {counts[0] / counts[1]:10.2f}x  {times[0] / times[1]:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
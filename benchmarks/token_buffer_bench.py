@@ -0,0 +1,55 @@
+"""Token storage and parse time: `peekable(lex(s))` against `TokenBuffer` + `TokenCursor`,
+with the descent chain and with the Pratt parser.
+
+Usage: python benchmarks/token_buffer_bench.py [tokens]   (default: 1,000,000)
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from lexer import lex, lex_buffer, lex_legacy
+from parser import parse
+from programs import generated_source
+
+sys.setrecursionlimit(10000)
+
+
+def allocated(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    src = generated_source(target * 33 // 10)  # ~3.3 bytes of source per token
+    buf, buf_bytes = allocated(lambda: lex_buffer(src))
+    n = len(buf)
+    print(f"{n} tokens, {len(src) / 1024 / 1024:.2f} MB of source")
+    print("memory/token:")
+    for name, lexer in (("lex_legacy", lex_legacy), ("lex", lex)):
+        tokens, list_bytes = allocated(lambda: list(lexer(src)))
+        del tokens
+        print(f"  list({name}(s)): {list_bytes / n:.1f} B")
+    print(f"  TokenBuffer: {buf_bytes / n:.1f} B")
+    for name, pratt in (("descent chain", False), ("pratt", True)):
+        peekable_time = cursor_time = float("inf")
+        for _ in range(3):  # alternated, so both see the same machine
+            peekable_time = min(peekable_time, timed(lambda: parse(src, pratt=pratt)))
+            cursor_time = min(cursor_time, timed(lambda: parse(src, buffered=True, pratt=pratt)))
+        print(f"parse, {name}: peekable {peekable_time:.3f}s, cursor {cursor_time:.3f}s "
+              f"({peekable_time / cursor_time:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,44 +3,191 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 from evaluator import *  # Adjust with your actual module
+from program_cache import CACHE_DIR_NAME, load_program
+import nxb
+import bytecode_eval
+from disassembler import dis, format_opstats
+import optimizer
+import runtime
+from optimizer import optimize, explain
+import argparse
 import time
 from tqdm import tqdm
 from pprint import pprint
 
-def run_nexus_file(file_path,display_ast=False):
+def run_nexus_file(file_path,display_ast=False,pratt=False,use_cache=True,backend=None,memostats=False):
     """Runs the given Nexus file and tracks execution time."""
     start_time = time.time()
     try:
         with open(file_path, 'r') as file:
             code = file.read()
+        start_time = time.perf_counter_ns()
+        if use_cache:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+            program, hit = load_program(code, cache_dir, pratt=pratt)
+            load_time_us = (time.perf_counter_ns() - start_time) / 1000
+            print(f"Cache {'hit' if hit else 'miss'} for {file_path} ({load_time_us:.2f} microseconds)")
+        else:
+            program = resolve(parse(code, pratt=pratt))
         if display_ast:
             print(f"Displaying AST for {file_path}:\n")
-            tree = parse(code)
-            pprint(tree)
+            pprint(program)
             print('\n')
         print(f"Running {file_path}...\n")
-        start_time = time.perf_counter_ns()
-        execute(code)
+        backend_runner(backend)(program)
         end_time = time.perf_counter_ns()
         execution_time_us = (end_time - start_time) / 1000  # Convert nanoseconds to microseconds
         print(f"\nProgram execution completed in {execution_time_us:.2f} microseconds.")
+        if memostats:
+            print(f"\n{format_memo_stats(program[0].hoisted)}")
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+    except Exception as e:
+        print(f"Error while executing the code: {e}")
+
+def run_nxb_file(file_path, memostats=False):
+    """Runs a compiled .nxb file on the stack VM and tracks execution time."""
+    start_time = time.perf_counter_ns()
+    try:
+        compiled = nxb.load(file_path)
+        load_time_us = (time.perf_counter_ns() - start_time) / 1000
+        print(f"Loaded {file_path} ({load_time_us:.2f} microseconds)")
+        print(f"Running {file_path}...\n")
+        nxb.run(compiled)
+        execution_time_us = (time.perf_counter_ns() - start_time) / 1000
+        print(f"\nProgram execution completed in {execution_time_us:.2f} microseconds.")
+        if memostats:
+            print(f"\n{format_memo_stats(compiled.hoisted)}")
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+    except Exception as e:
+        print(f"Error while executing the code: {e}")
+
+def compile_nexus_file(file_path, output=None, pratt=False):
+    """Compiles the given Nexus file to a .nxb file next to it (or at `output`)."""
+    output = output or os.path.splitext(file_path)[0] + nxb.NXB_SUFFIX
+    try:
+        with open(file_path, 'r') as file:
+            code = file.read()
+        size = nxb.compile_file(resolve(parse(code, buffered=True, pratt=pratt)), output)
+        print(f"Compiled {file_path} to {output} ({size} bytes)")
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+    except Exception as e:
+        print(f"Error while compiling the code: {e}")
+
+def load_compiled(file_path, pratt=False):
+    """(Compiled program, source or None) of a .nx or .nxb file, for --dis and --opstats."""
+    if file_path.endswith(nxb.NXB_SUFFIX):
+        return nxb.load(file_path), None
+    with open(file_path, 'r') as file:
+        code = file.read()
+    return nxb.build(resolve(parse(code, buffered=True, pratt=pratt))), code
+
+def disassemble_file(file_path, pratt=False):
+    """Prints the bytecode of the given Nexus or .nxb file."""
+    try:
+        compiled, code = load_compiled(file_path, pratt)
+        print(dis(compiled, code))
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+    except Exception as e:
+        print(f"Error while compiling the code: {e}")
+
+def profile_file(file_path, pratt=False):
+    """Runs the given Nexus or .nxb file on the stack VM and prints what each opcode and instruction cost."""
+    try:
+        compiled, _ = load_compiled(file_path, pratt)
+        print(f"Running {file_path} with --opstats...\n")
+        stats = bytecode_eval.OpStats()
+        bytecode_eval.run_profiled(compiled.code, new_frame(compiled.frame_size, None, compiled.hoisted), stats)
+        print()
+        print(format_opstats(stats))
     except FileNotFoundError:
         print(f"Error: File '{file_path}' not found.")
     except Exception as e:
         print(f"Error while executing the code: {e}")
-   
+
+def explain_file(file_path, pratt=False):
+    """Prints the calls the AST optimizer inlined and what it moved out of loops in the given Nexus file."""
+    try:
+        with open(file_path, 'r') as file:
+            code = file.read()
+        report = []
+        optimize(resolve(parse(code, buffered=True, pratt=pratt), optimized=False), report)
+        print(explain(report))
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+    except Exception as e:
+        print(f"Error while compiling the code: {e}")
+
 def main():
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("Usage: nexus <file.nx> [--ast]")
+    arg_parser = argparse.ArgumentParser(prog="nexus", description="Run a Nexus (.nx) or compiled (.nxb) program.")
+    arg_parser.add_argument("file", help="path to the .nx or .nxb file")
+    arg_parser.add_argument("--ast", action="store_true", help="print the AST before running")
+    arg_parser.add_argument("--pratt", action="store_true", help="parse expressions with the Pratt parser")
+    arg_parser.add_argument("--no-cache", action="store_true", help=f"always parse, skip the {CACHE_DIR_NAME} cache")
+    arg_parser.add_argument("--backend", choices=BACKENDS, help="execution backend (default: $NEXUS_BACKEND or tree)")
+    arg_parser.add_argument("--compile", action="store_true", help="write the program as .nxb bytecode instead of running it")
+    arg_parser.add_argument("-o", "--output", help="where --compile writes (default: the .nx path with .nxb)")
+    arg_parser.add_argument("--dis", action="store_true", help="print the bytecode instead of running the program")
+    arg_parser.add_argument("--opstats", action="store_true",
+                            help="run on the bytecode VM and report executions and time per opcode and instruction")
+    arg_parser.add_argument("--explain-opt", action="store_true",
+                            help="print the calls the optimizer inlined and what it moved out of loops instead of running the program")
+    arg_parser.add_argument("--inline-size", type=int, metavar="N",
+                            help=f"inline functions of up to N AST nodes (default: {optimizer.INLINE_SIZE})")
+    arg_parser.add_argument("--inline-depth", type=int, metavar="N",
+                            help=f"inline calls up to N inlined bodies deep, 0 for none (default: {optimizer.INLINE_DEPTH})")
+    arg_parser.add_argument("--memo-size", type=int, metavar="N",
+                            help=f"keep up to N results per fnmemo function (default: {runtime.MEMO_SIZE})")
+    arg_parser.add_argument("--memostats", action="store_true",
+                            help="report the memo hits and misses of every fnmemo function after running")
+    args = arg_parser.parse_args()
+
+    if args.memo_size is not None:
+        runtime.MEMO_SIZE = args.memo_size
+
+    if args.inline_size is not None or args.inline_depth is not None:
+        optimizer.INLINE_SIZE = optimizer.INLINE_SIZE if args.inline_size is None else args.inline_size
+        optimizer.INLINE_DEPTH = optimizer.INLINE_DEPTH if args.inline_depth is None else args.inline_depth
+        args.no_cache = True  # cached programs were inlined with the defaults
+
+    if not args.file.endswith((".nx", nxb.NXB_SUFFIX)):
+        print("Error: File extension must be .nx or .nxb")
+        return
+
+    if args.dis:
+        disassemble_file(args.file, args.pratt)
+        return
+
+    if args.opstats:
+        profile_file(args.file, args.pratt)
+        return
+
+    if args.explain_opt:
+        if not args.file.endswith(".nx"):
+            print("Error: --explain-opt needs a .nx file")
+            return
+        explain_file(args.file, args.pratt)
+        return
+
+    if args.file.endswith(nxb.NXB_SUFFIX) and not args.compile:
+        if args.backend not in (None, "bytecode"):
+            print("Error: .nxb files run on the bytecode backend")
+            return
+        run_nxb_file(args.file, args.memostats)
+        return
+
+    if not args.file.endswith(".nx"):
+        print("Error: --compile needs a .nx file")
         return
 
-    file_path = sys.argv[1]
-    if not file_path.endswith(".nx"):
-        print("Error: File extension must be .nx")
+    if args.compile:
+        compile_nexus_file(args.file, args.output, args.pratt)
         return
 
-    display_ast = len(sys.argv) == 3 and sys.argv[2] == "--ast"
-    run_nexus_file(file_path, display_ast)
+    run_nexus_file(args.file, args.ast, args.pratt, not args.no_cache, args.backend, args.memostats)
 
 if __name__ == "__main__":
     main()
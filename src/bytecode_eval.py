@@ -1,144 +1,708 @@
 from bytecode_gen import *
 from parser import *
+from resolver import resolve
+from runtime import *
+from register_gen import register_codegen
+from peephole import optimize_program
+from superinstructions import fuse_program
+import register_gen
+import time
 
 
+# ==========================================================================================
+# ==================================== HANDLERS ============================================
+# One function per opcode, called as handler(stack, push, pop, frame, consts, arg), where push
+# and pop are the stack's append and pop, bound once per code object run. A handler returns
+# None to go on with the next instruction, a code position to jump there, or EXIT to leave
+# the code object with the value on top of the stack.
 
-def execute_bytecode(insns, scope=None):
-    if scope is None:
-        scope = {}  # Initialize scope for variable bindings
+EXIT = -1
+HANDLERS = [None] * len(OPNAMES)
+
+
+def handles(*opcodes):
+    def register(handler):
+        for opcode in opcodes:
+            HANDLERS[opcode] = handler
+        return handler
+    return register
+
+
+def binary(fn):
+    def handler(stack, push, pop, frame, consts, arg):
+        r = pop()
+        stack[-1] = fn(stack[-1], r)
+    return handler
+
+
+def unary(fn):
+    def handler(stack, push, pop, frame, consts, arg):
+        stack[-1] = fn(stack[-1])
+    return handler
+
+
+for opcode, fn in BINARY_FUNCTIONS.items():
+    HANDLERS[opcode] = binary(fn)
+
+for opcode, fn in UNARY_FUNCTIONS.items():
+    HANDLERS[opcode] = unary(fn)
+
+
+@handles(HALT, RETURN)
+def exit_code(stack, push, pop, frame, consts, arg):
+    return EXIT
+
+
+@handles(NOP)
+def nop(stack, push, pop, frame, consts, arg):
+    pass
+
+
+@handles(PUSH_CONST)
+def push_const(stack, push, pop, frame, consts, arg):
+    push(consts[arg])
+
+
+@handles(POP)
+def pop_top(stack, push, pop, frame, consts, arg):
+    pop()
+
+
+@handles(DUP)
+def dup(stack, push, pop, frame, consts, arg):
+    push(stack[-1])
+
+
+@handles(LOAD)
+def load(stack, push, pop, frame, consts, arg):
+    push(frame[arg])
+
+
+@handles(LOAD_OUTER)
+def load_outer(stack, push, pop, frame, consts, arg):
+    push(outer(frame, arg >> SLOT_BITS)[arg & SLOT_MASK])
+
+
+@handles(VARBIND, ASSIGN)  # VARBIND always binds in the current frame
+def assign(stack, push, pop, frame, consts, arg):
+    frame[arg] = pop()
+
+
+@handles(ASSIGN_OUTER)
+def assign_outer(stack, push, pop, frame, consts, arg):
+    outer(frame, arg >> SLOT_BITS)[arg & SLOT_MASK] = pop()
+
+
+@handles(DISPLAY)
+def display(stack, push, pop, frame, consts, arg):
+    print(pop(), end="")
+
+
+@handles(DISPLAYL)
+def displayl(stack, push, pop, frame, consts, arg):
+    print(pop())
+
+
+@handles(FEED)
+def feed(stack, push, pop, frame, consts, arg):
+    stack[-1] = input(stack[-1])
+
+
+@handles(JUMP)
+def jump(stack, push, pop, frame, consts, arg):
+    return arg
+
+
+@handles(JUMP_IF_FALSE)
+def jump_if_false(stack, push, pop, frame, consts, arg):
+    if not pop():
+        return arg
+
+
+@handles(JUMP_IF_TRUE)
+def jump_if_true(stack, push, pop, frame, consts, arg):
+    if pop():
+        return arg
+
+
+@handles(BREAK)
+def break_out(stack, push, pop, frame, consts, arg):  # leaves the value for MOVEON unless it is BREAKOUT_SIGNAL
+    if stack[-1] is BREAKOUT_SIGNAL:
+        pop()
+        return arg
+
+
+@handles(MOVEON)
+def move_on(stack, push, pop, frame, consts, arg):
+    if pop() is MOVEON_SIGNAL:
+        return arg
+
+
+@handles(FUNC_DEF)
+def func_def(stack, push, pop, frame, consts, arg):
+    funcDef = consts[arg]
+    frame[funcDef.slot] = Function(funcDef, frame)
+
+
+@handles(BUILD_ARRAY)
+def build_array(stack, push, pop, frame, consts, arg):
+    items = stack[len(stack) - arg:]
+    del stack[len(stack) - arg:]
+    push(items)
+
+
+@handles(BUILD_HASH)
+def build_hash(stack, push, pop, frame, consts, arg):
+    items = stack[len(stack) - 2 * arg:]
+    del stack[len(stack) - 2 * arg:]
+    push(dict(zip(items[::2], items[1::2])))
+
+
+@handles(GET_ITEM)
+def get_item(stack, push, pop, frame, consts, arg):
+    index = pop()
+    stack[-1] = stack[-1][index]
+
+
+@handles(SET_ITEM)
+def set_item(stack, push, pop, frame, consts, arg):
+    index = pop()
+    container = pop()
+    container[index] = stack[-1]
+
+
+@handles(PUSH_FRONT)
+def push_front(stack, push, pop, frame, consts, arg):
+    value = pop()
+    stack[-1].insert(0, value)
+
+
+@handles(PUSH_BACK)
+def push_back(stack, push, pop, frame, consts, arg):
+    value = pop()
+    stack[-1].append(value)
+
+
+@handles(POP_FRONT)
+def pop_front_item(stack, push, pop, frame, consts, arg):
+    stack[-1] = pop_front(stack[-1], consts[arg])
+
+
+@handles(POP_BACK)
+def pop_back_item(stack, push, pop, frame, consts, arg):
+    stack[-1] = pop_back(stack[-1], consts[arg])
+
+
+@handles(LENGTH)
+def length(stack, push, pop, frame, consts, arg):
+    stack[-1] = len(stack[-1])
+
+
+@handles(CLEAR)
+def clear(stack, push, pop, frame, consts, arg):
+    stack[-1].clear()
+
+
+@handles(INSERT)
+def insert(stack, push, pop, frame, consts, arg):
+    value = pop()
+    index = pop()
+    stack[-1].insert(index, value)
+
+
+@handles(REMOVE_AT)
+def remove_item(stack, push, pop, frame, consts, arg):
+    index = pop()
+    stack[-1] = remove_at(stack[-1], index, consts[arg])
+
+
+@handles(REMOVE_KEY)
+def remove_hash_key(stack, push, pop, frame, consts, arg):
+    key = pop()
+    stack[-1] = remove_key(stack[-1], key, consts[arg])
+
+
+# ===== SUPERINSTRUCTIONS =====
+# The argument indexes a tuple of operands in the constant pool (see superinstructions.py).
+
+@handles(INC_LOCAL)
+def inc_local(stack, push, pop, frame, consts, arg):
+    slot, step = consts[arg]
+    frame[slot] = frame[slot] + step
+
+
+@handles(DEC_LOCAL)
+def dec_local(stack, push, pop, frame, consts, arg):
+    slot, step = consts[arg]
+    frame[slot] = frame[slot] - step
+
+
+@handles(ADD_LOCAL)
+def add_local(stack, push, pop, frame, consts, arg):
+    slot, other = consts[arg]
+    frame[slot] = frame[slot] + frame[other]
+
+
+@handles(LOAD_LOCAL_CMP_CONST_JUMP)
+def cmp_const_jump(stack, push, pop, frame, consts, arg):
+    slot, compare, value, target = consts[arg]
+    if not BINARY_FUNCTIONS[compare](frame[slot], value):
+        return target
+
+
+@handles(LOAD_LOCAL_CMP_LOCAL_JUMP)
+def cmp_local_jump(stack, push, pop, frame, consts, arg):
+    slot, compare, other, target = consts[arg]
+    if not BINARY_FUNCTIONS[compare](frame[slot], frame[other]):
+        return target
+
+
+@handles(MOD_EQ_ZERO_JUMP)
+def mod_eq_zero_jump(stack, push, pop, frame, consts, arg):
+    slot, divisor, value, target = consts[arg]
+    if not frame[slot] % (frame[divisor] if divisor else value) == 0:
+        return target
+
+
+def invalid(name):
+    def handler(*operands):
+        raise ValueError(f"Invalid opcode {name} in bytecode.")
+    return handler
+
+
+for opcode, handler in enumerate(HANDLERS):
+    if handler is None:  # LABEL never survives codegen
+        HANDLERS[opcode] = invalid(OPNAMES[opcode])
+
+
+def execute_bytecode(code_object, frame):
+    """Run `code_object` in `frame`; returns the value RETURN leaves, None at HALT."""
+    code, consts, handlers = code_object.code, code_object.consts, HANDLERS
+    stack = []
+    push, pop = stack.append, stack.pop
     ip = 0
-    operand = []
-    
-    def push(x):
-        operand.append(x)
-    
-    def pop():
-        return operand.pop()
-    
     while True:
-        opcode = insns[ip]
-        if opcode == HALT:
-            break
-        elif opcode == NOP:
-            pass
-        elif opcode == PUSH:
-            ip += 1
-            byte_length = insns[ip]
-            ip += 1
-            num_bytes = insns[ip:ip+byte_length]
-            ip += byte_length - 1
-            value = int.from_bytes(num_bytes, byteorder='big', signed=True)
-            push(value)
-        elif opcode == ADD:
-            r = pop()
-            l = pop()
-            push(l + r)
-        elif opcode == SUB:
-            r = pop()
-            l = pop()
-            push(l - r)
-        elif opcode == MUL:
-            r = pop()
-            l = pop()
-            push(l * r)
-        elif opcode == NEG:
-            l = pop()
-            push(-l)
-        elif opcode == DIV:
-            r = pop()
-            l = pop()
-            push(l // r)
-        elif opcode == MOD:
-            r = pop()
-            l = pop()
-            push(l % r)
-        elif opcode == POW:
-            r = pop()
-            l = pop()
-            push(l ** r)
-        elif opcode == LT:
-            r = pop()
-            l = pop()
-            push(1 if l < r else 0)
-        elif opcode == GT:
-            r = pop()
-            l = pop()
-            push(1 if l > r else 0)
-        elif opcode == EQ:
-            r = pop()
-            l = pop()
-            push(1 if l == r else 0)
-        elif opcode == NEQ:
-            r = pop()
-            l = pop()
-            push(1 if l != r else 0)
-        elif opcode == LE:
-            r = pop()
-            l = pop()
-            push(1 if l <= r else 0)
-        elif opcode == GE:
-            r = pop()
-            l = pop()
-            push(1 if l >= r else 0)
-        elif opcode == AND:
-            r = pop()
-            l = pop()
-            push(1 if l and r else 0)
-        elif opcode == OR:
-            r = pop()
-            l = pop()
-            push(1 if l or r else 0)
-        elif opcode == BAND:
-            r = pop()
-            l = pop()
-            push(l & r)
-        elif opcode == BOR:
-            r = pop()
-            l = pop()
-            push(l | r)
-        # elif opcode == BXOR:
-        #     r = pop()
-        #     l = pop()
-        #     push(l ^ r)
-        elif opcode == SHL:
-            r = pop()
-            l = pop()
-            push(l << r)
-        elif opcode == SHR:
-            r = pop()
-            l = pop()
-            push(l >> r)
-        elif opcode == NOT:
-            l = pop()
-            push(1 if not l else 0)
-        elif opcode == BNOT:
-            l = pop()
-            push(~l)
-        elif opcode == ASCII:
-            l = pop()
-            push(ord(l))
-        elif opcode == CHAR:
-            l = pop()
-            push(chr(l))
-        elif opcode == VARBIND:
-            ip += 1
-            name = insns[ip]  # Variable name
-            value = pop()  # Value to bind
-            scope[name] = value
-        elif opcode == DISPLAY:
-            value = pop()
-            print(value, end="")
-        elif opcode == DISPLAYL:
-            value = pop()
-            print(value)
-        ip += 1
-    
-    return 
+        target = handlers[code[ip]](stack, push, pop, frame, consts, code[ip + 1])
+        if target is None:
+            ip += 2
+        elif target == EXIT:
+            return pop() if stack else None
+        else:
+            ip = target
+
+
+def func_call_handler(execute):
+    """The FUNC_CALL handler, running the body with `execute(code_object, frame)`."""
+    def func_call(stack, push, pop, frame, consts, arg):
+        argc = arg & ARGC_MASK
+        args = stack[len(stack) - argc:]
+        del stack[len(stack) - argc:]
+        func = stack[-1]
+        if not isinstance(func, Function):
+            raise ValueError(f"Function {consts[arg >> ARGC_BITS]} is not defined correctly.")
+        funcDef = func.node
+        if func.memo is not None:
+            stack[-1] = memoized_call(func, args[:len(funcDef.funcParams)], invoke)
+            return
+        funcFrame = func.call_frame()
+        for i in range(len(funcDef.funcParams)):  # parameters are slots 1..n
+            funcFrame[i + 1] = args[i]
+        stack[-1] = execute(funcDef.bytecode, funcFrame)
+
+    def invoke(func, args):
+        funcFrame = func.call_frame()
+        for i in range(len(func.node.funcParams)):
+            funcFrame[i + 1] = args[i]
+        return execute(func.node.bytecode, funcFrame)
+    return func_call
+
+
+def tail_call_handler(func_call):
+    """
+    The TAIL_CALL handler. A call to the function whose code is running (same constants,
+    same enclosing frame) reuses the frame and starts the code over; the frame must not
+    outlive the call, so functions with nested functions are called as by `func_call`,
+    like every other function.
+    """
+    def tail_call(stack, push, pop, frame, consts, arg):
+        argc = arg & ARGC_MASK
+        func = stack[-1 - argc]
+        if (isinstance(func, Function) and func.env is frame[0] and func.template is not None
+                and func.node.bytecode.consts is consts and argc >= len(func.node.funcParams)):
+            args = stack[len(stack) - argc:len(stack) - argc + len(func.node.funcParams)]
+            del stack[len(stack) - argc - 1:]
+            frame[:] = func.template  # what a fresh frame holds
+            frame[1:len(args) + 1] = args
+            return 0
+        return func_call(stack, push, pop, frame, consts, arg)
+    return tail_call
+
+
+HANDLERS[FUNC_CALL] = func_call_handler(execute_bytecode)
+HANDLERS[TAIL_CALL] = tail_call_handler(HANDLERS[FUNC_CALL])
+
+
+# ===== PROFILING =====
+# execute_profiled is execute_bytecode with every instruction counted and timed; the
+# plain loop is untouched, so a run without --opstats pays nothing for it.
+
+class OpStats:
+    """Executions and nanoseconds per opcode and per instruction address. Times are self
+    times: a FUNC_CALL's leaves out the instructions of the call, which count for themselves."""
+
+    def __init__(self):
+        self.counts = [0] * len(OPNAMES)
+        self.times = [0] * len(OPNAMES)
+        self.in_calls = [0]     # wall-clock ns spent in called code so far
+        self.code_objects = {}  # id -> (code object, counts, times), per instruction index
+
+    def instructions(self, code_object):
+        """The per-instruction counts and times of `code_object`."""
+        if id(code_object) not in self.code_objects:
+            size = len(code_object.code) // 2
+            self.code_objects[id(code_object)] = (code_object, [0] * size, [0] * size)
+        return self.code_objects[id(code_object)][1:]
+
+
+def execute_profiled(code_object, frame, stats):
+    """execute_bytecode, adding what every instruction costs to `stats`, an OpStats."""
+    code, consts, handlers = code_object.code, code_object.consts, HANDLERS
+    op_counts, op_times = stats.counts, stats.times
+    counts, times = stats.instructions(code_object)
+    in_calls = stats.in_calls
+    clock = time.perf_counter_ns
+    stack = []
+    push, pop = stack.append, stack.pop
+    ip = 0
+    while True:
+        op = code[ip]
+        before = in_calls[0]
+        start = clock()
+        target = handlers[op](stack, push, pop, frame, consts, code[ip + 1])
+        elapsed = clock() - start - (in_calls[0] - before)
+        op_counts[op] += 1
+        op_times[op] += elapsed
+        counts[ip >> 1] += 1
+        times[ip >> 1] += elapsed
+        if target is None:
+            ip += 2
+        elif target == EXIT:
+            return stack.pop() if stack else None
+        else:
+            ip = target
+
+
+def run_profiled(code_object, frame, stats):
+    """Run `code_object` in `frame` with it and every function it calls profiled into `stats`."""
+    def call(code, frame):
+        before, start = stats.in_calls[0], time.perf_counter_ns()
+        result = execute_profiled(code, frame, stats)
+        stats.in_calls[0] = before + time.perf_counter_ns() - start  # nested calls are part of this one
+        return result
+
+    plain = HANDLERS[FUNC_CALL], HANDLERS[TAIL_CALL]
+    HANDLERS[FUNC_CALL] = func_call_handler(call)
+    HANDLERS[TAIL_CALL] = tail_call_handler(HANDLERS[FUNC_CALL])
+    try:
+        return execute_profiled(code_object, frame, stats)
+    finally:
+        HANDLERS[FUNC_CALL], HANDLERS[TAIL_CALL] = plain
+
+
+# ==========================================================================================
+# ==================================== REGISTER VM =========================================
+# Runs the register code of register_gen.py. A handler is called as
+# handler(regs, consts, a, b, c), where `regs` is the frame of the call, and returns what
+# a stack handler returns.
+
+REG_HANDLERS = [None] * len(register_gen.OPNAMES)
+
+
+def reg_handles(*opcodes):
+    def register(handler):
+        for opcode in opcodes:
+            REG_HANDLERS[opcode] = handler
+        return handler
+    return register
+
+
+def reg_binary(fn):
+    def handler(regs, consts, a, b, c):
+        regs[a] = fn(regs[b], regs[c])
+    return handler
+
+
+def reg_binary_const(fn):
+    def handler(regs, consts, a, b, c):
+        regs[a] = fn(regs[b], consts[c])
+    return handler
+
+
+def reg_unary(fn):
+    def handler(regs, consts, a, b, c):
+        regs[a] = fn(regs[b])
+    return handler
+
+
+def reg_jump_unless(fn):
+    def handler(regs, consts, a, b, c):
+        if not fn(regs[a], regs[b]):
+            return c
+    return handler
+
+
+def reg_jump_unless_const(fn):
+    def handler(regs, consts, a, b, c):
+        if not fn(regs[a], consts[b]):
+            return c
+    return handler
+
+
+def reg_jump_if(fn):
+    def handler(regs, consts, a, b, c):
+        if fn(regs[a], regs[b]):
+            return c
+    return handler
+
+
+def reg_jump_if_const(fn):
+    def handler(regs, consts, a, b, c):
+        if fn(regs[a], consts[b]):
+            return c
+    return handler
+
+
+COMPARE_JUMP_HANDLERS = {(False, False): reg_jump_unless, (False, True): reg_jump_unless_const,
+                         (True, False): reg_jump_if, (True, True): reg_jump_if_const}
+
+for op, opcode in register_gen.BINARY_OPCODES.items():  # same operations as the stack VM's
+    fn = BINARY_FUNCTIONS[BINARY_OPCODES[op]]
+    REG_HANDLERS[opcode] = reg_binary(fn)
+    REG_HANDLERS[opcode + register_gen.CONST_OPERAND] = reg_binary_const(fn)
+    for (holds, const), jump_handler in COMPARE_JUMP_HANDLERS.items():
+        if (opcode, holds, const) in register_gen.COMPARE_JUMPS:
+            REG_HANDLERS[register_gen.COMPARE_JUMPS[opcode, holds, const]] = jump_handler(fn)
+
+for op, opcode in register_gen.UNARY_OPCODES.items():
+    REG_HANDLERS[opcode] = reg_unary(UNARY_FUNCTIONS[UNARY_OPCODES[op]])
+
+
+@reg_handles(register_gen.HALT, register_gen.RETURN)
+def reg_exit(regs, consts, a, b, c):
+    return EXIT
+
+
+@reg_handles(register_gen.MOVE)
+def reg_move(regs, consts, a, b, c):
+    regs[a] = regs[b]
+
+
+@reg_handles(register_gen.LOADK)
+def reg_loadk(regs, consts, a, b, c):
+    regs[a] = consts[b]
+
+
+@reg_handles(register_gen.GETOUTER)
+def reg_getouter(regs, consts, a, b, c):
+    regs[a] = outer(regs, b >> SLOT_BITS)[b & SLOT_MASK]
+
+
+@reg_handles(register_gen.SETOUTER)
+def reg_setouter(regs, consts, a, b, c):
+    outer(regs, a >> SLOT_BITS)[a & SLOT_MASK] = regs[b]
+
+
+@reg_handles(register_gen.JUMP)
+def reg_jump(regs, consts, a, b, c):
+    return a
+
+
+@reg_handles(register_gen.JUMP_IF_FALSE)
+def reg_jump_if_false(regs, consts, a, b, c):
+    if not regs[a]:
+        return b
+
+
+@reg_handles(register_gen.JUMP_IF_TRUE)
+def reg_jump_if_true(regs, consts, a, b, c):
+    if regs[a]:
+        return b
+
+
+@reg_handles(register_gen.TEST_SIGNAL)
+def reg_test_signal(regs, consts, a, b, c):
+    value = regs[a]
+    if value is BREAKOUT_SIGNAL:
+        return b
+    if value is MOVEON_SIGNAL:
+        return c
+
+
+@reg_handles(register_gen.DISPLAY)
+def reg_display(regs, consts, a, b, c):
+    print(regs[a], end="")
+
+
+@reg_handles(register_gen.DISPLAYL)
+def reg_displayl(regs, consts, a, b, c):
+    print(regs[a])
+
+
+@reg_handles(register_gen.FEED)
+def reg_feed(regs, consts, a, b, c):
+    regs[a] = input(regs[b])
+
+
+@reg_handles(register_gen.FUNC_DEF)
+def reg_func_def(regs, consts, a, b, c):
+    funcDef = consts[a]
+    regs[funcDef.slot] = Function(funcDef, regs)
+
+
+@reg_handles(register_gen.CALL)
+def reg_call(regs, consts, a, b, c):
+    func = regs[a]
+    if not isinstance(func, Function):
+        raise ValueError(f"Function {consts[c]} is not defined correctly.")
+    funcDef = func.node
+    args = regs[a + 1:a + 1 + b]
+    if func.memo is not None:
+        regs[a] = memoized_call(func, args[:len(funcDef.funcParams)], reg_invoke)
+        return
+    funcFrame = func.call_frame()
+    for i in range(len(funcDef.funcParams)):  # parameters are slots 1..n
+        funcFrame[i + 1] = args[i]
+    regs[a] = execute_registers(funcDef.registers, funcFrame)
+
+
+@reg_handles(register_gen.TAIL_CALL)
+def reg_tail_call(regs, consts, a, b, c):
+    """
+    A call to the function whose code is running (same constants, same enclosing frame)
+    reuses the registers and starts the code over, as the stack VM's TAIL_CALL does.
+    """
+    func = regs[a]
+    if (isinstance(func, Function) and func.env is regs[0] and func.template is not None
+            and func.node.registers.consts is consts and b >= len(func.node.funcParams)):
+        args = regs[a + 1:a + 1 + len(func.node.funcParams)]
+        regs[:] = func.template  # what a fresh frame holds
+        regs[1:len(args) + 1] = args
+        return 0
+    return reg_call(regs, consts, a, b, c)
+
+
+def reg_invoke(func, args):
+    funcFrame = func.call_frame()
+    for i in range(len(func.node.funcParams)):
+        funcFrame[i + 1] = args[i]
+    return execute_registers(func.node.registers, funcFrame)
+
+
+@reg_handles(register_gen.NEW_ARRAY)
+def reg_new_array(regs, consts, a, b, c):
+    regs[a] = regs[b:b + c]
+
+
+@reg_handles(register_gen.NEW_HASH)
+def reg_new_hash(regs, consts, a, b, c):
+    items = regs[b:b + 2 * c]
+    regs[a] = dict(zip(items[::2], items[1::2]))
+
+
+@reg_handles(register_gen.GET_ITEM)
+def reg_get_item(regs, consts, a, b, c):
+    regs[a] = regs[b][regs[c]]
+
+
+@reg_handles(register_gen.SET_ITEM)
+def reg_set_item(regs, consts, a, b, c):
+    regs[a][regs[b]] = regs[c]
+
+
+@reg_handles(register_gen.PUSH_FRONT)
+def reg_push_front(regs, consts, a, b, c):
+    regs[a].insert(0, regs[b])
+
+
+@reg_handles(register_gen.PUSH_BACK)
+def reg_push_back(regs, consts, a, b, c):
+    regs[a].append(regs[b])
+
+
+@reg_handles(register_gen.POP_FRONT)
+def reg_pop_front(regs, consts, a, b, c):
+    regs[a] = pop_front(regs[b], consts[c])
+
+
+@reg_handles(register_gen.POP_BACK)
+def reg_pop_back(regs, consts, a, b, c):
+    regs[a] = pop_back(regs[b], consts[c])
+
+
+@reg_handles(register_gen.LENGTH)
+def reg_length(regs, consts, a, b, c):
+    regs[a] = len(regs[b])
+
+
+@reg_handles(register_gen.CLEAR)
+def reg_clear(regs, consts, a, b, c):
+    regs[a].clear()
+
+
+@reg_handles(register_gen.INSERT)
+def reg_insert(regs, consts, a, b, c):
+    regs[a].insert(regs[b], regs[c])
+
+
+@reg_handles(register_gen.REMOVE_AT)
+def reg_remove_at(regs, consts, a, b, c):
+    regs[a] = remove_at(regs[a], regs[b], consts[c])
+
+
+@reg_handles(register_gen.REMOVE_KEY)
+def reg_remove_key(regs, consts, a, b, c):
+    regs[a] = remove_key(regs[a], regs[b], consts[c])
+
+
+for opcode, handler in enumerate(REG_HANDLERS):
+    if handler is None:  # LABEL never survives register_codegen
+        REG_HANDLERS[opcode] = invalid(register_gen.OPNAMES[opcode])
+
+
+def execute_registers(code_object, regs):
+    """Run register code with `regs` as its frame; returns the register RETURN names, None at HALT."""
+    code, consts, handlers = code_object.code, code_object.consts, REG_HANDLERS
+    ip = 0
+    while True:
+        target = handlers[code[ip]](regs, consts, code[ip + 1], code[ip + 2], code[ip + 3])
+        if target is None:
+            ip += 4
+        elif target == EXIT:
+            return regs[code[ip + 1]] if code[ip] == register_gen.RETURN else None
+        else:
+            ip = target
+
+
+def compile_program(program):
+    """The top-level code object of `program` as the stack VM runs it: generated, optimized
+    and fused."""
+    code = codegen(program)
+    optimize_program(program, code)
+    fuse_program(program, code)
+    return code
+
+def run(program):
+    lines, _ = program
+    execute_bytecode(compile_program(program), new_frame(lines.frame_size, None, lines.hoisted))
+
+def run_registers(program):
+    lines, _ = program
+    code = register_codegen(program)
+    execute_registers(code, new_frame(code.size, None, lines.hoisted))
 
 def execute_all(prog):
-    ast, scope = parse(prog)
-    bytecode = codegen(ast,scope)
-    execute_bytecode(bytecode,scope)
+    run(resolve(parse(prog)))
+
 if __name__ == "__main__":
     # Example input code
     input_code = """
@@ -146,15 +710,15 @@ if __name__ == "__main__":
 """ 
 
     # Parse the input code to generate an AST
-    # ast, scope = parse(input_code)
-    # pprint(ast)
-    # pprint(scope)
+    # program = resolve(parse(input_code))
+    # pprint(program)
     # # Generate bytecode from the AST
-    # bytecode = codegen(ast,scope)
+    # bytecode = codegen(program)
 
     # # Print the generated bytecode
     # print("Generated Bytecode:", bytecode)
 
     # # evaluated bytecode
-    # print("Executed code:",execute_bytecode(bytecode,scope))
+    # lines, _ = program
+    # print("Executed code:",execute_bytecode(bytecode,new_frame(lines.frame_size, None, lines.hoisted)))
     execute_all(input_code)
\ No newline at end of file
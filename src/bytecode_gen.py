@@ -1,147 +1,397 @@
 from parser import *
+from runtime import nexus_pow, BREAKOUT_SIGNAL, MOVEON_SIGNAL
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import field
+import operator
+from optimizer import may_signal
 from pprint import pprint
 
-HALT, NOP, PUSH, POP, ADD, SUB, MUL, NEG = range(8)
+HALT, NOP, PUSH_CONST, POP, ADD, SUB, MUL, NEG = range(8)
 DIV, MOD, POW, LT, GT, EQ, NEQ, LE, GE, AND, OR, BAND, BOR, BXOR, SHL, SHR, NOT, BNOT, ASCII, CHAR = range(8, 28)
-VARBIND, DISPLAY, DISPLAYL = range(28, 31)  # Add new opcodes
-
-def do_codegen(t, code, scope):
-    match t:
-        case Number(v):
-            code.append(PUSH)
-            num = int(v)
-            num_bytes = num.to_bytes((num.bit_length() + 7) // 8 or 1, byteorder='big', signed=True)
-            code.append(len(num_bytes))  # Store byte length
-            code.extend(num_bytes)       # Store actual bytes
-        case BinOp("+", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(ADD)
-        case BinOp("-", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(SUB)
-        case BinOp("*", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(MUL)
-        case BinOp("/", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(DIV)
-        case BinOp("%", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(MOD)
-        case BinOp("^", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(POW)
-        case BinOp("<", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(LT)
-        case BinOp(">", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(GT)
-        case BinOp("==", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(EQ)
-        case BinOp("!=", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(NEQ)
-        case BinOp("<=", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(LE)
-        case BinOp(">=", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(GE)
-        case BinOp("and", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(AND)
-        case BinOp("or", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(OR)
-        case BinOp("&", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(BAND)
-        case BinOp("|", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(BOR)
-        case BinOp("<<", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(SHL)
-        case BinOp(">>", l, r):
-            do_codegen(l, code, scope)
-            do_codegen(r, code, scope)
-            code.append(SHR)
-        case BinOp("not", l, _):
-            do_codegen(l, code, scope)
-            code.append(NOT)
-        case BinOp("~", l, _):
-            do_codegen(l, code, scope)
-            code.append(BNOT)
-        case UnaryOp("~", val):
-            do_codegen(val, code, scope)
-            code.append(BNOT)
-        case UnaryOp("not", val) | UnaryOp("!", val):
-            do_codegen(val, code, scope)
-            code.append(NOT)
-        case UnaryOp("ascii", val):
-            do_codegen(val, code, scope)
-            code.append(ASCII)
-        case UnaryOp("char", val):
-            do_codegen(val, code, scope)
-            code.append(CHAR)
-        case String(s):
-            code.append(PUSH)
-            code.extend(s.encode('utf-8'))  # Encode string as bytes
-        case Boolean(b):
-            code.append(PUSH)
-            code.append(1 if b else 0)
-        case Variable(v):
-            code.append(PUSH)
-            val = scope.lookup(v)
-            code.extend(val)  # Encode variable name as bytes
-        case Array(val):
-            for element in val:
-                do_codegen(element, code, scope)
-            code.append(PUSH)
-            code.append(len(val))  # Push array size
-        case Hash(val):
-            for k, v in val.items():
-                do_codegen(k, code, scope)
-                do_codegen(v, code, scope)
-            code.append(PUSH)
-            code.append(len(val))  # Push hash size
-        case VarBind(name, dtype, value, category):
-            do_codegen(value, code, scope)  # Generate code for the value
-            code.append(VARBIND)
-            code.extend(name.encode('utf-8'))  # Push variable name as bytes
-        case Display(val):
-            do_codegen(val, code, scope)  # Generate code for the value
-            code.append(DISPLAY)
-        case DisplayL(val):
-            do_codegen(val, code, scope)  # Generate code for the value
-            code.append(DISPLAYL)
-    return code
-
-def codegen(ast,scope,not_list=False):
-    bytecode = bytearray()
-    if (not_list):
-        bytecode=[]
-    for statement in ast.statements:
-        do_codegen(statement, bytecode,scope)
-    bytecode.append(HALT)
-    return bytecode
+VARBIND, DISPLAY, DISPLAYL, ASSIGN = range(28, 32)
+LOAD, DUP, BUILD_ARRAY, BUILD_HASH, GET_ITEM, SET_ITEM = range(32, 38)
+PUSH_FRONT, PUSH_BACK, POP_FRONT, POP_BACK, LENGTH, CLEAR, INSERT, REMOVE_AT, REMOVE_KEY = range(38, 47)
+JUMP, JUMP_IF_TRUE, JUMP_IF_FALSE, LABEL, FEED, FUNC_DEF, FUNC_CALL, RETURN, BREAK, MOVEON = range(47, 57)
+LOAD_OUTER, ASSIGN_OUTER = range(57, 59)
+INC_LOCAL, DEC_LOCAL, ADD_LOCAL, LOAD_LOCAL_CMP_CONST_JUMP, LOAD_LOCAL_CMP_LOCAL_JUMP, MOD_EQ_ZERO_JUMP = range(59, 65)
+TAIL_CALL = 65
 
+OPNAMES = """HALT NOP PUSH_CONST POP ADD SUB MUL NEG DIV MOD POW LT GT EQ NEQ LE GE AND OR BAND BOR BXOR SHL
+SHR NOT BNOT ASCII CHAR VARBIND DISPLAY DISPLAYL ASSIGN LOAD DUP BUILD_ARRAY BUILD_HASH GET_ITEM SET_ITEM
+PUSH_FRONT PUSH_BACK POP_FRONT POP_BACK LENGTH CLEAR INSERT REMOVE_AT REMOVE_KEY JUMP JUMP_IF_TRUE
+JUMP_IF_FALSE LABEL FEED FUNC_DEF FUNC_CALL RETURN BREAK MOVEON LOAD_OUTER ASSIGN_OUTER INC_LOCAL DEC_LOCAL
+ADD_LOCAL LOAD_LOCAL_CMP_CONST_JUMP LOAD_LOCAL_CMP_LOCAL_JUMP MOD_EQ_ZERO_JUMP TAIL_CALL""".split()
+
+# Every instruction is two words, opcode and argument. What the argument means:
+CONST_ARGS = {PUSH_CONST, FUNC_DEF, POP_FRONT, POP_BACK, REMOVE_AT, REMOVE_KEY}  # constant pool index
+SLOT_ARGS = {VARBIND, ASSIGN, LOAD}             # slot in the current frame
+OUTER_ARGS = {LOAD_OUTER, ASSIGN_OUTER}         # depth << SLOT_BITS | slot
+COUNT_ARGS = {BUILD_ARRAY, BUILD_HASH}          # element / pair count
+JUMPS = {JUMP, JUMP_IF_TRUE, JUMP_IF_FALSE, BREAK, MOVEON}  # target code position
+# FUNC_CALL, TAIL_CALL: name index << ARGC_BITS | argument count; LABEL: label id, removed
+# by resolve_labels
+# Superinstructions (see superinstructions.py): constant index of a tuple of operands
+FUSED = {INC_LOCAL, DEC_LOCAL, ADD_LOCAL, LOAD_LOCAL_CMP_CONST_JUMP, LOAD_LOCAL_CMP_LOCAL_JUMP, MOD_EQ_ZERO_JUMP}
+FUSED_JUMPS = {LOAD_LOCAL_CMP_CONST_JUMP, LOAD_LOCAL_CMP_LOCAL_JUMP, MOD_EQ_ZERO_JUMP}  # target last
+
+SLOT_BITS, SLOT_MASK = 16, 0xFFFF
+ARGC_BITS, ARGC_MASK = 8, 0xFF
+
+BINARY_OPCODES = {
+    "+": ADD, "-": SUB, "*": MUL, "/": DIV, "÷": DIV, "%": MOD, "**": POW,
+    "<": LT, ">": GT, "==": EQ, "!=": NEQ, "<=": LE, ">=": GE,
+    "&": BAND, "|": BOR, "^": BXOR, "<<": SHL, ">>": SHR,
+}
+UNARY_OPCODES = {"not": NOT, "!": NOT, "~": BNOT, "ascii": ASCII, "char": CHAR}
+
+# What the operator opcodes compute, for the VM and for constant folding
+BINARY_FUNCTIONS = {
+    ADD: operator.add, SUB: operator.sub, MUL: operator.mul, DIV: operator.truediv,
+    MOD: operator.mod, POW: nexus_pow, LT: operator.lt, GT: operator.gt, EQ: operator.eq,
+    NEQ: operator.ne, LE: operator.le, GE: operator.ge, BAND: operator.and_,
+    BOR: operator.or_, BXOR: operator.xor, SHL: operator.lshift, SHR: operator.rshift,
+    AND: lambda l, r: l and r, OR: lambda l, r: l or r,
+}
+COMPARISONS = {LT, GT, EQ, NEQ, LE, GE}
+UNARY_FUNCTIONS = {NEG: operator.neg, NOT: operator.not_, BNOT: operator.invert, ASCII: ord, CHAR: chr}
+
+
+# Where a statement's value goes: left on the stack, dropped, or checked by the enclosing
+# loop for BreakOut (jump to `exit`) and MoveOn (jump to `next`).
+VALUE, DISCARD = "value", "discard"
+
+
+@dataclass
+class Loop:
+    exit: int
+    next: int
+
+
+def drops(sink, t):
+    """Whether nothing looks at the value of statement `t`."""
+    return sink == DISCARD or (isinstance(sink, Loop) and not may_signal(t))
+
+
+@dataclass
+class CodeObject:
+    """The code of one function body, or of the program's top level."""
+    name: str
+    code: array    # array('i') of fixed-width instructions: opcode, argument, opcode, ...
+    consts: list   # what PUSH_CONST, FUNC_DEF and the error messages refer to by index
+    lines: list = field(default_factory=list)  # [(code position, source line)] by position
+
+
+class BytecodeGenerator:
+    """
+    Generates the code of one function body (or of the program) with its own constant pool.
+    Jumps are emitted against LABEL placeholders and resolved to code positions at the end.
+    """
+    def __init__(self, functions):
+        self.code = []
+        self.consts = []
+        self.const_index = {}  # (type, repr) of a literal -> its index, so each is pooled once
+        self.labels = 0
+        self.lines = []        # (word offset in self.code, source line) where each statement starts
+        self.functions = functions  # id(function body) -> code object, shared by every generator
+
+    def emit(self, opcode, arg=0):
+        self.code.extend((opcode, arg))
+
+    def const(self, value):
+        """Index of `value` in the constant pool."""
+        if isinstance(value, (int, float, str, type(None))):
+            key = (type(value), repr(value))  # keeps 1, 1.0 and True apart
+            if key not in self.const_index:
+                self.const_index[key] = len(self.consts)
+                self.consts.append(value)
+            return self.const_index[key]
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def push(self, value):
+        self.emit(PUSH_CONST, self.const(value))
+
+    def label(self):
+        self.labels += 1
+        return self.labels
+
+    def place(self, label):
+        self.emit(LABEL, label)
+
+    def load(self, t):
+        if t.depth == 0:
+            self.emit(LOAD, t.slot)
+        else:
+            self.emit(LOAD_OUTER, outer_arg(t))
+
+    def assign(self, t):
+        if t.depth == 0:
+            self.emit(ASSIGN, t.slot)
+        else:
+            self.emit(ASSIGN_OUTER, outer_arg(t))
+
+    def function(self, funcDef):
+        """Generate `funcDef`'s body, and the functions hoisted into its frame, once."""
+        funcBody = funcDef.funcBody
+        if id(funcBody) not in self.functions:
+            body = BytecodeGenerator(self.functions)
+            self.functions[id(funcBody)] = body.generate(funcDef.funcName, funcBody, VALUE, RETURN)
+            for inner in funcDef.hoisted:
+                self.function(inner)
+        funcDef.bytecode = self.functions[id(funcBody)]
+
+    def generate(self, name, body, sink, end):
+        self.stmt(body, sink)
+        self.emit(end)
+        return CodeObject(name, array('i', resolve_labels(self.code)), self.consts, self.line_table())
+
+    def line_table(self):
+        """self.lines at the code positions resolve_labels gives, one line per position."""
+        labels = [ip for ip, opcode, _ in instructions(self.code) if opcode == LABEL]
+        table = {}
+        for offset, line in self.lines:
+            table[offset - 2 * bisect_left(labels, offset)] = line  # a later statement wins
+        return sorted(table.items())
+
+    def none(self, sink):
+        if sink == VALUE:
+            self.push(None)
+
+    def stmt(self, t, sink):
+        if getattr(t, "line", 0):  # None and Statements have no line
+            self.lines.append((len(self.code), t.line))
+        match t:
+            case Statements(statements):
+                for stmt in statements[:-1]:  # in a loop body, any of them may break out
+                    self.stmt(stmt, sink if isinstance(sink, Loop) else DISCARD)
+                if statements:
+                    self.stmt(statements[-1], sink)
+                else:
+                    self.none(sink)
+            case If(cond, then_body, else_body, _):
+                otherwise, end = self.label(), self.label()
+                self.expr(cond)
+                self.emit(JUMP_IF_FALSE, otherwise)
+                self.stmt(then_body, sink)
+                self.emit(JUMP, end)
+                self.place(otherwise)
+                self.stmt(else_body, sink)
+                self.place(end)
+            case WhileLoop(cond, body, _):
+                top, exit = self.label(), self.label()
+                self.place(top)
+                self.expr(cond)
+                self.emit(JUMP_IF_FALSE, exit)
+                for stmt in body.statements:
+                    self.stmt(stmt, Loop(exit, top))
+                self.emit(JUMP, top)
+                self.place(exit)
+                self.none(sink)
+            case ForLoop(init, cond, incr, body, _):
+                top, step, exit = self.label(), self.label(), self.label()
+                self.stmt(init, DISCARD)
+                self.place(top)
+                self.expr(cond)
+                self.emit(JUMP_IF_FALSE, exit)
+                for stmt in body.statements:
+                    self.stmt(stmt, Loop(exit, step))
+                self.place(step)
+                self.stmt(incr, DISCARD)
+                self.emit(JUMP, top)
+                self.place(exit)
+                self.none(sink)
+            case BreakOut() if isinstance(sink, Loop):
+                self.emit(JUMP, sink.exit)
+            case MoveOn() if isinstance(sink, Loop):
+                self.emit(JUMP, sink.next)
+            case None | Break() | BreakOut() | MoveOn() if sink != VALUE:
+                pass
+            case FuncDef():
+                self.function(t)
+                self.emit(FUNC_DEF, self.const(t))
+                self.none(sink)
+            case VarBind(_, _, value, _) if drops(sink, t):
+                self.expr(value)
+                self.emit(VARBIND, t.slot)
+            case AssignToVar(_, value) if drops(sink, t):
+                self.expr(value)
+                self.assign(t)
+            case CompoundAssignment(_, op, value) if drops(sink, t) and op[0] in BINARY_OPCODES:
+                self.load(t)
+                self.expr(value)
+                self.emit(BINARY_OPCODES[op[0]])
+                self.assign(t)
+            case Display(val) | DisplayL(val) if sink != VALUE:
+                self.expr(val)
+                self.emit(DISPLAY if isinstance(t, Display) else DISPLAYL)
+            case _:
+                self.expr(t)
+                if isinstance(sink, Loop) and may_signal(t):
+                    self.emit(BREAK, sink.exit)
+                    self.emit(MOVEON, sink.next)
+                elif sink != VALUE:
+                    self.emit(POP)
+
+
+    def expr(self, t):
+        """Code leaving the value of `t` on the stack."""
+        match t:
+            case Number(v) | String(v) | Boolean(v):
+                self.push(v)
+            case Variable():
+                self.load(t)
+            case Array(val):
+                for element in val:
+                    self.expr(element)
+                self.emit(BUILD_ARRAY, len(val))
+            case Hash(val):
+                for k, v in val:
+                    self.expr(k)
+                    self.expr(v)
+                self.emit(BUILD_HASH, len(val))
+
+            case BinOp("and" | "or", l, r):  # short-circuits, and gives an operand back
+                end = self.label()
+                self.expr(l)
+                self.emit(DUP)
+                self.emit(JUMP_IF_FALSE if t.op == "and" else JUMP_IF_TRUE, end)
+                self.emit(POP)
+                self.expr(r)
+                self.place(end)
+            case BinOp("not" | "~", l, _):  # unary forms the parser builds as BinOp
+                self.expr(l)
+                self.emit(UNARY_OPCODES[t.op])
+            case BinOp(op, l, r) if op in BINARY_OPCODES:
+                self.expr(l)
+                self.expr(r)
+                self.emit(BINARY_OPCODES[op])
+            case UnaryOp(op, val) if op in UNARY_OPCODES:
+                self.expr(val)
+                self.emit(UNARY_OPCODES[op])
+            case Feed(msg):
+                self.expr(msg)
+                self.emit(FEED)
+
+            case FuncCall(funcName, funcArgs):
+                if len(funcArgs) > ARGC_MASK:
+                    raise ValueError(f"Function {funcName} is called with too many arguments.")
+                self.load(t)  # the function is looked up before its arguments run, as in e()
+                for arg in funcArgs:
+                    self.expr(arg)
+                self.emit(TAIL_CALL if t.tail else FUNC_CALL, self.const(funcName) << ARGC_BITS | len(funcArgs))
+
+            case Statements() | If() | WhileLoop() | ForLoop() | FuncDef():
+                self.stmt(t, VALUE)
+            case Display(val) | DisplayL(val):
+                self.stmt(t, DISCARD)
+                self.push(None)
+            case VarBind(_, _, value, _):
+                self.expr(value)
+                self.emit(DUP)
+                self.emit(VARBIND, t.slot)
+            case AssignToVar(_, value):
+                self.expr(value)
+                self.emit(DUP)
+                self.assign(t)
+            case CompoundAssignment(_, op, value) if op[0] in BINARY_OPCODES:
+                self.load(t)
+                self.expr(value)
+                self.emit(BINARY_OPCODES[op[0]])
+                self.emit(DUP)
+                self.assign(t)
+            case BreakOut():
+                self.push(BREAKOUT_SIGNAL)
+            case MoveOn():
+                self.push(MOVEON_SIGNAL)
+
+            case PushFront(_, value) | PushBack(_, value):
+                self.load(t)
+                self.expr(value)
+                self.emit(PUSH_FRONT if isinstance(t, PushFront) else PUSH_BACK)
+            case PopFront(name) | PopBack(name):
+                self.load(t)
+                self.emit(POP_FRONT if isinstance(t, PopFront) else POP_BACK, self.const(name))
+            case GetLength(_):
+                self.load(t)
+                self.emit(LENGTH)
+            case ClearArray(_):
+                self.load(t)
+                self.emit(CLEAR)
+            case InsertAt(_, index, value):
+                self.load(t)
+                self.expr(index)
+                self.expr(value)
+                self.emit(INSERT)
+            case RemoveAt(name, index):
+                self.load(t)
+                self.expr(index)
+                self.emit(REMOVE_AT, self.const(name))
+            case CallArr(_, index) | CallHashVal(_, index):
+                self.load(t)
+                self.expr(index)
+                self.emit(GET_ITEM)
+            case AssigntoArr(_, index, value) | AssignHashVal(_, index, value):
+                self.expr(value)  # the value is evaluated before the index, as in e()
+                self.load(t)
+                self.expr(index)
+                self.emit(SET_ITEM)
+            case AddHashPair(_, key, value):
+                self.expr(value)
+                self.load(t)
+                self.expr(key)
+                self.emit(SET_ITEM)
+                self.emit(POP)
+                self.push(None)
+            case RemoveHashPair(name, key):
+                self.load(t)
+                self.expr(key)
+                self.emit(REMOVE_KEY, self.const(name))
+
+            case _:  # what the tree-walker does not match evaluates to None there too
+                self.push(None)
+
+
+def outer_arg(t):
+    """The argument of LOAD_OUTER / ASSIGN_OUTER for a name `t.depth` frames out."""
+    if t.slot > SLOT_MASK:
+        raise ValueError("Too many variables in one frame for the bytecode VM.")
+    return t.depth << SLOT_BITS | t.slot
+
+
+def instructions(code):
+    """(position, opcode, argument) of every instruction in a list or array of words."""
+    for ip in range(0, len(code), 2):
+        yield ip, code[ip], code[ip + 1]
+
+
+def line_of(code_object, ip):
+    """Source line of the statement the instruction at `ip` belongs to, or 0 if unknown."""
+    i = bisect_right(code_object.lines, (ip, float("inf")))
+    return code_object.lines[i - 1][1] if i else 0
+
+
+def resolve_labels(code):
+    """Drop the LABEL placeholders and point every jump at its label's code position."""
+    positions, size = {}, 0
+    for _, opcode, arg in instructions(code):
+        if opcode == LABEL:
+            positions[arg] = size
+        else:
+            size += 2
+    resolved = []
+    for _, opcode, arg in instructions(code):
+        if opcode in JUMPS:
+            resolved.extend((opcode, positions[arg]))
+        elif opcode != LABEL:
+            resolved.extend((opcode, arg))
+    return resolved
+
+
+def codegen(program):
+    """Code object of a resolved program's top level; function bodies are stored on their FuncDefs."""
+    lines, _ = program
+    generator = BytecodeGenerator({})
+    for funcDef in lines.hoisted:
+        generator.function(funcDef)
+    return generator.generate("<program>", lines, DISCARD, HALT)
@@ -0,0 +1,378 @@
+import operator
+
+from parser import *
+from runtime import *
+
+# ==========================================================================================
+# ==================================== CLOSURE COMPILER ====================================
+# A second backend for resolved programs. Instead of matching every node on every visit,
+# as the tree-walker does, each node is turned once into a Python closure `f(frame)` that
+# does that node's work and calls its children's closures directly. Function bodies are
+# compiled once and stored on their FuncDef as `compiled`. Frames, functions and the
+# checked operations come from runtime.py, so both backends behave the same.
+
+BINARY = {
+    "+": lambda l, r: lambda frame: l(frame) + r(frame),
+    "*": lambda l, r: lambda frame: l(frame) * r(frame),
+    "-": lambda l, r: lambda frame: l(frame) - r(frame),
+    "÷": lambda l, r: lambda frame: l(frame) / r(frame),
+    "/": lambda l, r: lambda frame: l(frame) / r(frame),
+    "**": lambda l, r: lambda frame: nexus_pow(l(frame), r(frame)),
+    "<": lambda l, r: lambda frame: l(frame) < r(frame),
+    ">": lambda l, r: lambda frame: l(frame) > r(frame),
+    "==": lambda l, r: lambda frame: l(frame) == r(frame),
+    "!=": lambda l, r: lambda frame: l(frame) != r(frame),
+    "<=": lambda l, r: lambda frame: l(frame) <= r(frame),
+    ">=": lambda l, r: lambda frame: l(frame) >= r(frame),
+    "%": lambda l, r: lambda frame: l(frame) % r(frame),
+    "and": lambda l, r: lambda frame: l(frame) and r(frame),
+    "or": lambda l, r: lambda frame: l(frame) or r(frame),
+    "&": lambda l, r: lambda frame: l(frame) & r(frame),
+    "|": lambda l, r: lambda frame: l(frame) | r(frame),
+    "^": lambda l, r: lambda frame: l(frame) ^ r(frame),
+    "<<": lambda l, r: lambda frame: l(frame) << r(frame),
+    ">>": lambda l, r: lambda frame: l(frame) >> r(frame),
+    "not": lambda l, _: lambda frame: not l(frame),  # unary forms the parser builds as BinOp
+    "~": lambda l, _: lambda frame: ~l(frame),
+}
+
+UNARY = {
+    "~": operator.invert,
+    "not": operator.not_,
+    "!": operator.not_,
+    "ascii": ord,
+    "char": chr,
+}
+
+# `x op= v` computes `x op v`; same operator functions as BINARY
+COMPOUND = {
+    "+": operator.add, "*": operator.mul, "-": operator.sub, "÷": operator.truediv,
+    "/": operator.truediv, "**": nexus_pow, "%": operator.mod, "&": operator.and_,
+    "|": operator.or_, "^": operator.xor, "<<": operator.lshift, ">>": operator.rshift,
+}
+
+
+def constant(value):
+    return lambda frame: value
+
+
+def load(depth, slot):
+    """Closure reading `slot` of the frame `depth` static links out."""
+    if depth == 0:
+        return lambda frame: frame[slot]
+    if depth == 1:
+        return lambda frame: frame[0][slot]
+    return lambda frame: outer(frame, depth)[slot]
+
+
+def owner(depth):
+    """Closure returning the frame `depth` static links out."""
+    if depth == 0:
+        return lambda frame: frame
+    if depth == 1:
+        return lambda frame: frame[0]
+    return lambda frame: outer(frame, depth)
+
+
+def sequence(stmts):
+    """Closure running `stmts` in order and returning the last value, like Statements."""
+    if not stmts:
+        return constant(None)
+    if len(stmts) == 1:
+        return stmts[0]
+
+    def run_all(frame):
+        result = None
+        for stmt in stmts:
+            result = stmt(frame)
+        return result
+    return run_all
+
+
+def checked_sequence(stmts):
+    """Closure running a block of a loop body, which a breakout or moveon ends."""
+    def run_until_signal(frame):
+        result = None
+        for stmt in stmts:
+            result = stmt(frame)
+            if result is BREAKOUT_SIGNAL or result is MOVEON_SIGNAL:
+                break
+        return result
+    return run_until_signal
+
+
+def invoke(func, args):
+    """Run the compiled body of `func` on the values `args` of its parameters."""
+    funcFrame = func.call_frame()
+    funcFrame[1:len(args) + 1] = args
+    return func.node.compiled(funcFrame)
+
+
+class Compiler:
+    def __init__(self):
+        self.bodies = {}  # id(function body) -> compiled body
+
+    def function(self, funcDef):
+        """Compile `funcDef`'s body, and the functions hoisted into its frame, once."""
+        funcBody = funcDef.funcBody
+        if id(funcBody) not in self.bodies:
+            self.bodies[id(funcBody)] = self.compile(funcBody)
+            for inner in funcDef.hoisted:
+                self.function(inner)
+        funcDef.compiled = self.bodies[id(funcBody)]
+
+    def body(self, statements):
+        return tuple(self.compile(stmt) for stmt in statements.statements)
+
+    def compile(self, tree):
+        match tree:
+            case Number(v) | String(v) | Boolean(v):
+                return constant(v)
+            case Variable():
+                return load(tree.depth, tree.slot)
+
+            case Array(val):
+                items = [self.compile(x) for x in val]
+                return lambda frame: [x(frame) for x in items]
+            case Hash(val):
+                pairs = [(self.compile(k), self.compile(v)) for k, v in val]
+                return lambda frame: {k(frame): v(frame) for k, v in pairs}
+
+            case BinOp(op, l, r) if op in BINARY:
+                return BINARY[op](self.compile(l), self.compile(r))
+            case UnaryOp(op, val) if op in UNARY:
+                fn, val = UNARY[op], self.compile(val)
+                return lambda frame: fn(val(frame))
+            case Feed(msg):
+                msg = self.compile(msg)
+                return lambda frame: input(msg(frame))
+
+            case FuncDef():
+                self.function(tree)
+                slot = tree.slot
+
+                def define(frame):
+                    frame[slot] = Function(tree, frame)
+                return define
+
+            case FuncCall(funcName, funcArgs):
+                func_of = load(tree.depth, tree.slot)
+                args = [self.compile(arg) for arg in funcArgs]
+
+                def call(frame):
+                    func = func_of(frame)
+                    if not isinstance(func, Function):
+                        raise ValueError(f"Function {funcName} is not defined correctly.")
+                    if func.memo is not None:
+                        return memoized_call(func, [args[i](frame) for i in range(len(func.node.funcParams))], invoke)
+                    funcFrame = func.call_frame()
+                    for i in range(len(func.node.funcParams)):  # parameters are slots 1..n
+                        funcFrame[i + 1] = args[i](frame)
+                    return func.node.compiled(funcFrame)
+                return call
+
+            case Statements(statements):
+                return (checked_sequence if tree.signals else sequence)(self.body(tree))
+
+            case If(cond, then_body, else_body, _):
+                cond, then_body, else_body = self.compile(cond), self.compile(then_body), self.compile(else_body)
+
+                def branch(frame):
+                    if cond(frame):
+                        return then_body(frame)
+                    return else_body(frame)
+                return branch
+
+            case Display(val):
+                val = self.compile(val)
+                return lambda frame: print(val(frame), end="")
+            case DisplayL(val):
+                val = self.compile(val)
+                return lambda frame: print(val(frame))
+
+            case CompoundAssignment(_, op, value) if op[0] in COMPOUND:
+                fn, owner_of, slot, value = COMPOUND[op[0]], owner(tree.depth), tree.slot, self.compile(value)
+
+                def update(frame):
+                    owner_frame = owner_of(frame)
+                    prev_val = owner_frame[slot]
+                    owner_frame[slot] = new_val = fn(prev_val, value(frame))
+                    return new_val
+                return update
+
+            case VarBind(_, _, value, _):
+                slot, value = tree.slot, self.compile(value)
+
+                def bind(frame):
+                    frame[slot] = var_val = value(frame)
+                    return var_val
+                return bind
+
+            case AssignToVar(_, value):
+                owner_of, slot, value = owner(tree.depth), tree.slot, self.compile(value)
+
+                def assign(frame):
+                    val_to_assign = value(frame)
+                    owner_of(frame)[slot] = val_to_assign
+                    return val_to_assign
+                return assign
+
+            case PushFront(_, value):
+                arr_of, value = load(tree.depth, tree.slot), self.compile(value)
+
+                def push_front(frame):
+                    arr = arr_of(frame)
+                    arr.insert(0, value(frame))
+                    return arr
+                return push_front
+
+            case PushBack(_, value):
+                arr_of, value = load(tree.depth, tree.slot), self.compile(value)
+
+                def push_back(frame):
+                    arr = arr_of(frame)
+                    arr.append(value(frame))
+                    return arr
+                return push_back
+
+            case PopFront(arr_name):
+                arr_of = load(tree.depth, tree.slot)
+                return lambda frame: pop_front(arr_of(frame), arr_name)
+            case PopBack(arr_name):
+                arr_of = load(tree.depth, tree.slot)
+                return lambda frame: pop_back(arr_of(frame), arr_name)
+            case GetLength(_):
+                arr_of = load(tree.depth, tree.slot)
+                return lambda frame: len(arr_of(frame))
+
+            case ClearArray(_):
+                arr_of = load(tree.depth, tree.slot)
+
+                def clear(frame):
+                    arr = arr_of(frame)
+                    arr.clear()
+                    return arr
+                return clear
+
+            case InsertAt(_, index, value):
+                arr_of, index, value = load(tree.depth, tree.slot), self.compile(index), self.compile(value)
+
+                def insert_at(frame):
+                    arr = arr_of(frame)
+                    arr.insert(index(frame), value(frame))
+                    return arr
+                return insert_at
+
+            case RemoveAt(arr_name, index):
+                arr_of, index = load(tree.depth, tree.slot), self.compile(index)
+                return lambda frame: remove_at(arr_of(frame), index(frame), arr_name)
+
+            case CallArr(_, index) | CallHashVal(_, index):
+                container_of, index = load(tree.depth, tree.slot), self.compile(index)
+                return lambda frame: container_of(frame)[index(frame)]
+
+            case AssigntoArr(_, index, value):
+                arr_of, index, value = load(tree.depth, tree.slot), self.compile(index), self.compile(value)
+
+                def assign_item(frame):
+                    val_to_assign = value(frame)
+                    arr_of(frame)[index(frame)] = val_to_assign
+                    return val_to_assign
+                return assign_item
+
+            case AddHashPair(_, key, val):
+                hash_of, key, val = load(tree.depth, tree.slot), self.compile(key), self.compile(val)
+
+                def add_pair(frame):
+                    hash_table = hash_of(frame)
+                    hash_table[key(frame)] = val(frame)
+                return add_pair
+
+            case RemoveHashPair(name, key):
+                hash_of, key = load(tree.depth, tree.slot), self.compile(key)
+
+                def remove_pair(frame):
+                    remove_key(hash_of(frame), key(frame), name)
+                return remove_pair
+
+            case AssignHashVal(_, key, new_val):
+                hash_of, key, new_val = load(tree.depth, tree.slot), self.compile(key), self.compile(new_val)
+
+                def assign_val(frame):
+                    val_to_assign = new_val(frame)
+                    hash_of(frame)[key(frame)] = val_to_assign
+                    return val_to_assign
+                return assign_val
+
+            # Loops
+            case WhileLoop(cond, body, _) if not tree.signals:  # no statement value to look at
+                cond, body = self.compile(cond), sequence(self.body(body))
+
+                def while_loop(frame):
+                    while cond(frame):
+                        body(frame)
+                return while_loop
+
+            case WhileLoop(cond, body, _):
+                cond, body = self.compile(cond), self.body(body)
+
+                def while_loop(frame):
+                    while cond(frame):
+                        for stmt in body:
+                            result = stmt(frame)
+                            if result is BREAKOUT_SIGNAL:
+                                return
+                            if result is MOVEON_SIGNAL:
+                                break
+                return while_loop
+
+            case ForLoop(init, cond, incr, body, _) if not tree.signals:
+                init, cond, incr = self.compile(init), self.compile(cond), self.compile(incr)
+                body = sequence(self.body(body))
+
+                def for_loop(frame):
+                    init(frame)
+                    while cond(frame):
+                        body(frame)
+                        incr(frame)
+                return for_loop
+
+            case ForLoop(init, cond, incr, body, _):
+                init, cond, incr, body = self.compile(init), self.compile(cond), self.compile(incr), self.body(body)
+
+                def for_loop(frame):
+                    init(frame)
+                    while cond(frame):
+                        for stmt in body:
+                            result = stmt(frame)
+                            if result is BREAKOUT_SIGNAL:
+                                return
+                            if result is MOVEON_SIGNAL:
+                                break
+                        incr(frame)
+                return for_loop
+
+            case BreakOut():
+                return constant(BREAKOUT_SIGNAL)
+            case MoveOn():
+                return constant(MOVEON_SIGNAL)
+
+            case _:  # what the tree-walker does not match evaluates to None there too
+                return constant(None)
+
+
+def compile_program(program):
+    """Compile a resolved program; returns its top-level statements as closures."""
+    lines, _ = program
+    compiler = Compiler()
+    for funcDef in lines.hoisted:
+        compiler.function(funcDef)
+    return compiler.body(lines)
+
+
+def run(program):
+    lines, _ = program
+    stmts = compile_program(program)
+    frame = new_frame(lines.frame_size, None, lines.hoisted)
+    for stmt in stmts:
+        stmt(frame)
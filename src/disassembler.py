@@ -0,0 +1,104 @@
+from bytecode_gen import *
+from nxb import tables
+
+# ==========================================================================================
+# ==================================== DISASSEMBLER ========================================
+# Human-readable listings of stack VM code (what `nexus --dis` prints) and of the counts
+# and times bytecode_eval.run_profiled collects (`nexus --opstats`). Both work the same
+# for a program compiled from source and one loaded from a .nxb file; given the source,
+# the statements are shown above their instructions.
+
+SYMBOLS = {opcode: op for op, opcode in BINARY_OPCODES.items()}
+
+
+def constant(value):
+    """Short form of a constant-pool entry."""
+    if isinstance(value, FuncDef):
+        return f"<fn {value.funcName}>"
+    return repr(value)
+
+
+def operand(op, arg, consts):
+    """What the argument of instruction `op` means, or '' when it has none."""
+    if op in FUSED:
+        operands = consts[arg]
+    if op == PUSH_CONST:
+        return constant(consts[arg])
+    if op == FUNC_DEF:
+        return f"{constant(consts[arg])} -> slot {consts[arg].slot}"
+    if op in CONST_ARGS:
+        return consts[arg]
+    if op in SLOT_ARGS:
+        return f"slot {arg}"
+    if op in OUTER_ARGS:
+        return f"depth {arg >> SLOT_BITS} slot {arg & SLOT_MASK}"
+    if op in COUNT_ARGS:
+        return f"{arg} {'pairs' if op == BUILD_HASH else 'items'}"
+    if op in JUMPS:
+        return f"to {arg}"
+    if op in (FUNC_CALL, TAIL_CALL):
+        return f"{consts[arg >> ARGC_BITS]}, {arg & ARGC_MASK} args"
+    if op in (INC_LOCAL, DEC_LOCAL):
+        return f"slot {operands[0]} {'+' if op == INC_LOCAL else '-'}= {operands[1]!r}"
+    if op == ADD_LOCAL:
+        return f"slot {operands[0]} += slot {operands[1]}"
+    if op in (LOAD_LOCAL_CMP_CONST_JUMP, LOAD_LOCAL_CMP_LOCAL_JUMP):
+        slot, compare, other, target = operands
+        other = repr(other) if op == LOAD_LOCAL_CMP_CONST_JUMP else f"slot {other}"
+        return f"unless slot {slot} {SYMBOLS[compare]} {other}: to {target}"
+    if op == MOD_EQ_ZERO_JUMP:
+        slot, divisor, value, target = operands
+        return f"unless slot {slot} % {f'slot {divisor}' if divisor else repr(value)} == 0: to {target}"
+    return ""
+
+
+def jump_targets(code_object):
+    return {arg if op in JUMPS else code_object.consts[arg][-1]
+            for _, op, arg in instructions(code_object.code) if op in JUMPS or op in FUSED_JUMPS}
+
+
+def disassemble(code_object, source_lines=None):
+    """Listing of one code object: `source_lines` is the program's source, split in lines."""
+    code, consts = code_object.code, code_object.consts
+    out = [f"== {code_object.name} ({len(code) // 2} instructions, {len(consts)} constants) =="]
+    targets = jump_targets(code_object)
+    line = 0
+    for ip, op, arg in instructions(code):
+        if line_of(code_object, ip) != line:
+            line = line_of(code_object, ip)
+            text = source_lines[line - 1].strip() if source_lines and line <= len(source_lines) else ""
+            out.append(f"{line:>5}| {text}".rstrip())
+        marker = ">>" if ip in targets else ""
+        out.append(f"{marker:>8} {ip:>5}  {OPNAMES[op]:<26} {arg:>6}  {operand(op, arg, consts)}".rstrip())
+    if consts:
+        out.append("   constants: " + ", ".join(f"{i}: {constant(value)}" for i, value in enumerate(consts)))
+    return "\n".join(out)
+
+
+def dis(compiled, source=None):
+    """Listing of every code object of a Compiled program (see nxb.py)."""
+    source_lines = source.splitlines() if source is not None else None
+    codes, _ = tables(compiled)
+    return "\n\n".join(disassemble(code_object, source_lines) for code_object in codes)
+
+
+def format_opstats(stats, top=20):
+    """Report of an OpStats (see bytecode_eval.run_profiled): the time per opcode, then the
+    `top` instructions by time."""
+    total = sum(stats.times) or 1
+    out = [f"{'opcode':<26} {'count':>12} {'total ms':>10} {'ns/exec':>9} {'time':>7}"]
+    for op in sorted(range(len(OPNAMES)), key=lambda op: -stats.times[op]):
+        if stats.counts[op]:
+            out.append(f"{OPNAMES[op]:<26} {stats.counts[op]:>12} {stats.times[op] / 1e6:>10.2f} "
+                       f"{stats.times[op] // stats.counts[op]:>9} {100 * stats.times[op] / total:>6.1f}%")
+    hottest = sorted(((elapsed, count, code_object, index)
+                      for code_object, counts, times in stats.code_objects.values()
+                      for index, (count, elapsed) in enumerate(zip(counts, times)) if count),
+                     key=lambda entry: -entry[0])[:top]
+    out += ["", f"{'code':<16} {'ip':>5} {'line':>5}  {'instruction':<40} {'count':>12} {'total ms':>10}"]
+    for elapsed, count, code_object, index in hottest:
+        op, arg = code_object.code[2 * index], code_object.code[2 * index + 1]
+        instruction = f"{OPNAMES[op]} {operand(op, arg, code_object.consts)}"
+        out.append(f"{code_object.name:<16} {2 * index:>5} {line_of(code_object, 2 * index):>5}  "
+                   f"{instruction[:40]:<40} {count:>12} {elapsed / 1e6:>10.2f}")
+    return "\n".join(out)
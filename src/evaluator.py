@@ -1,294 +1,303 @@
 from parser import *
+from resolver import resolve
 from scope import SymbolCategory, SymbolTable
+from runtime import *
+import bytecode_eval
+import closure_compiler
+import transpiler
+import stack_evaluator
 import copy
+import os
 
 # ==========================================================================================
 # ==================================== (TREE-WALK) EVALUATOR ===============================
-
-
-
-def e(tree: AST, tS) -> Any:
+# Runs resolved programs: a frame is a list, slot 0 is the static link to the enclosing
+# frame and the other slots hold the names the resolver laid out (see resolver.py).
+# Functions and frames live in runtime.py, shared with the other backends.
+#
+# A tail call (see resolver.mark_tail_calls) evaluates to a TailCall (runtime.py) instead
+# of running: it is the value of the body, and the FuncCall running the body makes it in
+# its place, in a loop, so fnrec recursion in tail position takes no Python stack.
+#
+# A loop only looks at the values of its body statements when the resolver marked it as
+# one whose body may break out or move on (see resolver.mark_loops).
+
+
+def e(tree: AST, frame) -> Any:
     match tree:
         case Number(n):
-            if '.' in n:  # Check if the number contains a decimal point
-                return float(n)  # Return as a float
-            else:
-                return int(n)
+            return n
         case String(s):
             return s
         case Boolean(b):
             return b
-        case Variable(v):
-            return tS.lookup(v)
+        case Variable():
+            return outer(frame, tree.depth)[tree.slot]
+
         case Array(val):
-            all_vals = list(map(lambda x: e(x, tS), val))
+            all_vals = list(map(lambda x: e(x, frame), val))
             return all_vals
         case Hash(val):
-            return {e(k, tS): e(v, tS) for k, v in val}
+            return {e(k, frame): e(v, frame) for k, v in val}
         # Operators
         case BinOp("+", l, r):
-            return e(l, tS) + e(r, tS)
+            return e(l, frame) + e(r, frame)
         case BinOp("*", l, r):
-            return e(l, tS) * e(r, tS)
+            return e(l, frame) * e(r, frame)
         case BinOp("-", l, r):
-            return e(l, tS) - e(r, tS)
+            return e(l, frame) - e(r, frame)
         case BinOp("÷", l, r):
-            return e(l, tS) / e(r, tS)
+            return e(l, frame) / e(r, frame)
         case BinOp("/", l, r):
-            return e(l, tS) / e(r, tS)
+            return e(l, frame) / e(r, frame)
         case BinOp("**", l, r):
-            base = e(l, tS)
-            exponent = e(r, tS)
-            
-            # Rule 1: Zero to the power of a negative number
-            if base == 0 and exponent < 0:
-                raise ValueError("Math error: Zero cannot be raised to a negative power.")
-            
-            # Rule 2: Negative number to the power of a decimal
-            if base < 0 and not exponent.is_integer():
-                raise ValueError("Math error: Negative numbers cannot be raised to a decimal power.")
-            
-            return base ** exponent
+            return nexus_pow(e(l, frame), e(r, frame))
         case BinOp("<", l, r):
-            return e(l, tS) < e(r, tS)
+            return e(l, frame) < e(r, frame)
         case BinOp(">", l, r):
-            return e(l, tS) > e(r, tS)
+            return e(l, frame) > e(r, frame)
         case BinOp("==", l, r):
-            return e(l, tS) == e(r, tS)
+            return e(l, frame) == e(r, frame)
         case BinOp("!=", l, r):
-            return e(l, tS) != e(r, tS)
+            return e(l, frame) != e(r, frame)
         case BinOp("<=", l, r):
-            return e(l, tS) <= e(r, tS)
+            return e(l, frame) <= e(r, frame)
         case BinOp(">=", l, r):
-            return e(l, tS) >= e(r, tS)
+            return e(l, frame) >= e(r, frame)
         case BinOp("%", l, r):
-            return e(l, tS) % e(r, tS)
+            return e(l, frame) % e(r, frame)
         case BinOp("and", l, r):
-            return e(l, tS) and e(r, tS)
+            return e(l, frame) and e(r, frame)
         case BinOp("or", l, r):
-            return e(l, tS) or e(r, tS)
+            return e(l, frame) or e(r, frame)
         case BinOp("&", l, r):
-            return e(l, tS) & e(r, tS)
+            return e(l, frame) & e(r, frame)
         case BinOp("|", l, r):
-            return e(l, tS) | e(r, tS)
+            return e(l, frame) | e(r, frame)
         case BinOp("^", l, r):
-            return e(l, tS) ^ e(r, tS)
+            return e(l, frame) ^ e(r, frame)
         case BinOp("<<", l, r):
-            return e(l, tS) << e(r, tS)
+            return e(l, frame) << e(r, frame)
         case BinOp(">>", l, r):
-            return e(l, tS) >> e(r, tS)
+            return e(l, frame) >> e(r, frame)
         case BinOp("not", l, _):  # Unary logical operator
-            return not e(l, tS)
+            return not e(l, frame)
         case BinOp("~", l, _):  # Unary bitwise operator
-            return ~e(l, tS)
+            return ~e(l, frame)
         case UnaryOp("~", val):
-            return ~e(val, tS)
+            return ~e(val, frame)
         case UnaryOp("not", val):
-            return not e(val, tS)
+            return not e(val, frame)
         case UnaryOp("!", val):
-            return not e(val, tS)
+            return not e(val, frame)
         case UnaryOp("ascii", val):
-            return ord(e(val, tS))
+            return ord(e(val, frame))
         case UnaryOp("char", val):
-            return chr(e(val, tS))
+            return chr(e(val, frame))
         case Feed(msg):
-            return input(e(msg,tS))
-        case FuncDef(funcName, funcParams, funcBody, funcScope, isRec):
-            tS.define(funcName, (funcParams, funcBody, funcScope, isRec), SymbolCategory.FUNCTION)
+            return input(e(msg,frame))
+        case FuncDef():
+            frame[tree.slot] = Function(tree, frame)
             return
 
         case FuncCall(funcName, funcArgs):
             """
-            Step 1: Extract function body
-            Step 2: Put argument values into function's scope
+            Step 1: Extract function body (an fnmemo function may have the result already)
+            Step 2: Take a fresh frame for this call and put the argument values into it
             Step 3: Evaluate the function body
-            Step 4: Pop the arg values from the function's scope (don't delete the scope table)
+            Step 4: If the body ended in a tail call, make it the same way
             """
-            funcData = tS.lookup(funcName)  # Step 1
-            if not isinstance(funcData, tuple) or len(funcData) != 4:
+            func = outer(frame, tree.depth)[tree.slot]  # Step 1
+            if not isinstance(func, Function):
                 raise ValueError(f"Function {funcName} is not defined correctly.")
-            (funcParams, funcBody, funcScopeMain, isRec) = funcData
-            funcScope = funcScopeMain.copy_scope() if isRec else funcScopeMain
-
-            for i in range(len(funcParams)):  # Step 2
-                # funcScope.table[funcParams[i]] = e(funcArgs[i], tS)
-                funcScope.define(funcParams[i], e(funcArgs[i], tS),SymbolCategory.VARIABLE)
-
-            for stmt in funcBody.statements:  # Step 3
-                ans = e(
-                    stmt, funcScope
-                )  #! every line in body is evaluated (always returns something)
-
-            for i in range(len(funcParams)):
-                funcScope.define(funcParams[i],None,SymbolCategory.VARIABLE)
-                # funcScope.table[funcParams[i]] = None  # Step 4
-
-            return ans  # after returning ans
+            args = [e(funcArgs[i], frame) for i in range(len(func.node.funcParams))]
+            if tree.tail:
+                return TailCall(func, args)
+            memo = func.memo
+            if memo is not None:
+                key, ans = memo.lookup(args)
+                if ans is not MISSING:
+                    return ans
+
+            while True:
+                funcDef = func.node
+                funcFrame = func.call_frame()
+                funcFrame[1:len(args) + 1] = args  # Step 2 (parameters are slots 1..n)
+
+                ans = None
+                for stmt in funcDef.funcBody.statements:  # Step 3
+                    ans = e(
+                        stmt, funcFrame
+                    )  #! every line in body is evaluated (always returns something)
+
+                if type(ans) is not TailCall:
+                    if memo is not None:
+                        memo.store(key, ans)
+                    return ans  # after returning ans
+                func, args = ans.func, ans.args  # Step 4
 
         case Statements(statements):
             result = None
+            if tree.signals:  # a block of a loop body, which a breakout or moveon ends
+                for stmt in statements:
+                    result = e(stmt, frame)
+                    if result is BREAKOUT_SIGNAL or result is MOVEON_SIGNAL:
+                        break
+                return result
             for stmt in statements:
-                result = e(stmt, tS)
+                result = e(stmt, frame)
             return result
 
         # Conditional
-        case If(cond, then_body, else_body, tS_cond):
+        case If(cond, then_body, else_body, _):
             ans = None
-            if e(cond, tS_cond):
-                ans = e(then_body, tS_cond)
+            if e(cond, frame):
+                ans = e(then_body, frame)
             elif else_body is not None:
-                ans = e(else_body, tS_cond)
+                ans = e(else_body, frame)
             return ans
 
         # Display
         case Display(val):
-            return print(e(val, tS), end="")
+            return print(e(val, frame), end="")
 
         case DisplayL(val):
-            return print(e(val, tS))
+            return print(e(val, frame))
 
         case CompoundAssignment(var_name, op, value):
-            prev_val = tS.lookup(var_name)
-            new_val = e(BinOp(op[0], Number(str(prev_val)), value), tS)
-            tS.find_and_update(var_name, new_val)
+            owner = outer(frame, tree.depth)
+            prev_val = owner[tree.slot]
+            new_val = e(BinOp(op[0], Number(prev_val), value), frame)
+            owner[tree.slot] = new_val
             return new_val
 
         case VarBind(name, dtype, value,category):
-            var_val = e(value, tS)
-            tS.define(name,var_val,category)# binds in current scope
+            var_val = e(value, frame)
+            frame[tree.slot] = var_val # binds in current scope
             return var_val
         case PushFront(arr_name, value):
-            arr= tS.lookup(arr_name)
-            arr.insert(0, e(value, tS))
-            tS.find_and_update(arr_name, arr)
+            arr = outer(frame, tree.depth)[tree.slot]
+            arr.insert(0, e(value, frame))
             return arr
 
         case PushBack(arr_name, value):
-            arr = tS.lookup(arr_name)
-            arr.append(e(value, tS))
-            tS.find_and_update(arr_name, arr)
+            arr = outer(frame, tree.depth)[tree.slot]
+            arr.append(e(value, frame))
             return arr
 
         case PopFront(arr_name):
-            arr = tS.lookup(arr_name)
-            if len(arr) > 0:
-                value = arr.pop(0)
-                tS.find_and_update(arr_name, arr)
-                return value
-            else:
-                raise IndexError(f"Cannot PopFront from an empty array: {arr_name}")
+            return pop_front(outer(frame, tree.depth)[tree.slot], arr_name)
 
         case PopBack(arr_name):
-            arr = tS.lookup(arr_name)
-            if len(arr) > 0:
-                value = arr.pop()
-                tS.find_and_update(arr_name, arr)
-                return value
-            else:
-                raise IndexError(f"Cannot PopBack from an empty array: {arr_name}")
+            return pop_back(outer(frame, tree.depth)[tree.slot], arr_name)
 
         case GetLength(arr_name):
-            return len(tS.lookup(arr_name))
+            return len(outer(frame, tree.depth)[tree.slot])
 
         case ClearArray(arr_name):
-            arr = tS.lookup(arr_name)
+            arr = outer(frame, tree.depth)[tree.slot]
             arr.clear()
-            tS.find_and_update(arr_name, arr)
             return arr
 
         case InsertAt(arr_name, index, value):
-            arr = tS.lookup(arr_name)
-            arr.insert(e(index, tS), e(value, tS))
-            tS.find_and_update(arr_name, arr)
+            arr = outer(frame, tree.depth)[tree.slot]
+            arr.insert(e(index, frame), e(value, frame))
             return arr
 
         case RemoveAt(arr_name, index):
-            arr = tS.lookup(arr_name)
-            if 0 <= e(index, tS) < len(arr):
-                value = arr.pop(e(index, tS))
-                tS.find_and_update(arr_name, arr)
-                return value
-            else:
-                raise IndexError(f"Index {e(index, tS)} out of bounds for array: {arr_name}")
+            return remove_at(outer(frame, tree.depth)[tree.slot], e(index, frame), arr_name)
         # case BindArray(xname, atype, val):
-        #     all_vals = list(map(lambda x: e(x, tS), val))
-        #     tS.table[xname] = all_vals
-        #     tS.define(xname,all_vals,SymbolCategory.ARRAY)
+        #     all_vals = list(map(lambda x: e(x, frame), val))
+        #     frame.table[xname] = all_vals
+        #     frame.define(xname,all_vals,SymbolCategory.ARRAY)
         #     return all_vals
         case AssignToVar(var_name, value):
-            val_to_assign = e(value, tS)
-            tS.find_and_update(var_name, val_to_assign)
+            val_to_assign = e(value, frame)
+            outer(frame, tree.depth)[tree.slot] = val_to_assign
             return val_to_assign
 
         case CallArr(xname, index):
-            return tS.lookup(xname)[e(index, tS)]
+            return outer(frame, tree.depth)[tree.slot][e(index, frame)]
         
         case AssigntoArr(xname, index, value):
-            val_to_assign = e(value, tS)
-            tS.find_and_update_arr(xname, e(index, tS), val_to_assign)
+            val_to_assign = e(value, frame)
+            outer(frame, tree.depth)[tree.slot][e(index, frame)] = val_to_assign
             return val_to_assign
         #hash funcs
         case CallHashVal(name,key):
-           return tS.lookup(name)[e(key, tS)]
+           return outer(frame, tree.depth)[tree.slot][e(key, frame)]
         
         case AddHashPair(name, key, val):
-            hash_table = tS.lookup(name)
-            hash_table[e(key, tS)] = e(val, tS)
-            tS.find_and_update(name, hash_table)
+            hash_table = outer(frame, tree.depth)[tree.slot]
+            hash_table[e(key, frame)] = e(val, frame)
         
         case RemoveHashPair(name, key):
-            hash_table = tS.lookup(name)
-            if e(key, tS) in hash_table:
-                del hash_table[e(key, tS)]
-                tS.find_and_update(name, hash_table)
-            else:
-                raise KeyError(f"Key {e(key, tS)} not found in hash {name}")
+            remove_key(outer(frame, tree.depth)[tree.slot], e(key, frame), name)
 
         case AssignHashVal(name, key, new_val):
-            hash_table = tS.lookup(name)
-            hash_table[e(key, tS)] = e(new_val, tS)
-            tS.find_and_update(name, hash_table)
-            return hash_table[e(key, tS)]
+            val_to_assign = e(new_val, frame)
+            outer(frame, tree.depth)[tree.slot][e(key, frame)] = val_to_assign
+            return val_to_assign
             
         # Loops
-        case WhileLoop(cond, body, tS_while):
-            while e(cond, tS_while):
-                loop_should_break = False
-                for stmt in body.statements:
-                    result = e(stmt, tS_while)
-                    if isinstance(result, BreakOut):
-                        loop_should_break = True
-                        break  
-                    elif isinstance(result, MoveOn):
-                        break
-                if loop_should_break:
-                    break
-
-        case ForLoop(init, cond, incr, body, tS_for):
-            e(init, tS_for)
-            while e(cond, tS_for):
-                loop_should_break = False
-                for stmt in body.statements:
-                    result = e(stmt, tS_for)
-                    if isinstance(result, BreakOut):
-                        loop_should_break = True
+        case WhileLoop(cond, body, _):
+            statements = body.statements
+            if not tree.signals:  # nothing in the body can break out or move on
+                while e(cond, frame):
+                    for stmt in statements:
+                        e(stmt, frame)
+                return
+            while e(cond, frame):
+                for stmt in statements:
+                    result = e(stmt, frame)
+                    if result is BREAKOUT_SIGNAL:
+                        return
+                    if result is MOVEON_SIGNAL:
                         break
-                    elif isinstance(result, MoveOn):
+
+        case ForLoop(init, cond, incr, body, _):
+            statements = body.statements
+            e(init, frame)
+            if not tree.signals:
+                while e(cond, frame):
+                    for stmt in statements:
+                        e(stmt, frame)
+                    e(incr, frame)
+                return
+            while e(cond, frame):
+                for stmt in statements:
+                    result = e(stmt, frame)
+                    if result is BREAKOUT_SIGNAL:
+                        return
+                    if result is MOVEON_SIGNAL:
                         break
-                if loop_should_break:
-                    break
-                e(incr, tS_for)
+                e(incr, frame)
 
         case BreakOut():
-            return BreakOut()
+            return BREAKOUT_SIGNAL
 
         case MoveOn():
-            return MoveOn()
+            return MOVEON_SIGNAL
 
-def execute(prog):
-        lines, tS = parse(prog)
+def run(program):
+        lines, _ = program
+        frame = new_frame(lines.frame_size, None, lines.hoisted)
         for line in lines.statements:
-            e(line, tS)
+            e(line, frame)
+
+BACKENDS = {"tree": run, "closure": closure_compiler.run, "python": transpiler.run, "bytecode": bytecode_eval.run,
+            "register": bytecode_eval.run_registers, "stack": stack_evaluator.run}
+
+
+def backend_runner(backend=None):
+        """The run(program) of `backend`; defaults to $NEXUS_BACKEND, else the tree-walker."""
+        backend = backend or os.environ.get("NEXUS_BACKEND", "tree")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+        return BACKENDS[backend]
+
+def execute(prog, pratt=False, backend=None):
+        backend_runner(backend)(resolve(parse(prog, pratt=pratt)))
 
 if __name__ == "__main__":
 
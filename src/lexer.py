@@ -2,6 +2,9 @@ from dataclasses import dataclass
 from collections.abc import Iterator
 from tokens import  *
 from typing import Union
+from array import array
+from bisect import bisect_right
+import re
 
 # ==========================================================================================
 # ==================================== LEXER ===============================================
@@ -90,7 +93,343 @@ class MoveOnToken(Token):
 
 
 # ======================================================================================================
+# Table-driven lexer: a single compiled master pattern scanned with `finditer`.
+# Alternatives are ordered like the branches of `lex_legacy` below, which is kept
+# around as the reference implementation (and for the lexer benchmark).
+
+_two_char_ops = list(dict.fromkeys(top_level_operator_tokens + ("**",)))
+_one_char_ops = [op for op in base_operator_tokens + bitwise_ops if len(op) == 1 and op != "-"]
+
+_MASTER = re.compile(
+    r"\s*(?:"
+    r"(?P<semi>;)"
+    r"|(?P<word>[^\W\d_]+)"
+    r"|(?P<string>\"[^\"]*\"|'[^']*')"
+    r"|(?P<quote>[\"'])"
+    r"|(?P<number>\d+(?:\.\d*)?)"
+    r"|(?P<comment>/>[^\n]*|/~[\s\S]*?(?:~/|\Z))"
+    # `-=`, or a `-` followed by a number, an identifier or a `(`
+    r"|(?P<minus>-(?:(?P<minus_eq>=)|\s*(?:(?P<minus_num>\d[\d.]*)"
+    r"|(?P<minus_var>[^\W\d_]+)|(?=(?P<minus_paren>\())))?)"
+    r"|(?P<op>\+\+|" + "|".join(map(re.escape, _two_char_ops)) + "|[" + re.escape("".join(_one_char_ops)) + "])"
+    r"|(?P<punct>[{}()\[\],.:])"
+    r"|(?P<error>[\s\S])"
+    r"|(?P<end>\Z))"
+)
+
+_WORD_TOKENS = {kw: KeywordToken(kw) for kw in keyword_tokens}
+_WORD_TOKENS.update({b: BooleanToken(b) for b in boolean_tokens})
+_WORD_TOKENS.update({ty: TypeToken(ty) for ty in base_type_tokens})
+_WORD_TOKENS.update(
+    {"break": BreakToken(), "breakout": BreakOutToken(), "moveon": MoveOnToken()}
+)
+
+_PUNCT_TOKENS = {
+    "{": LeftBraceToken(),
+    "}": RightBraceToken(),
+    "(": LeftParenToken(),
+    ")": RightParenToken(),
+    "[": LeftSquareToken(),
+    "]": RightSquareToken(),
+    ",": CommaToken(),
+    ".": DotToken(),
+    ":": ColonToken(),
+}
+
+_OPERATOR_TOKENS = {op: OperatorToken(op) for op in _two_char_ops + _one_char_ops}
+_OPERATOR_TOKENS["-"] = OperatorToken("-")
+_OPERATOR_TOKENS["-="] = OperatorToken("-=")
+
+_SEMICOLON = SemicolonToken()
+_NEG_ONE = NumberToken("-1")
+
+
+def is_binary_context(prev: Token) -> bool:
+    """True if a `-` following `prev` is a subtraction rather than a unary negation."""
+    return isinstance(prev, (NumberToken, VarToken)) or (
+        isinstance(prev, KeywordToken) and prev.kw_name not in ("display", "displayl")
+    )
+
+
 def lex(s: str) -> Iterator[Token]:
+    words = _WORD_TOKENS
+    ops = _OPERATOR_TOKENS
+    punct = _PUNCT_TOKENS
+    names = {}
+    prev = None  # last keyword/identifier/number/operator, decides unary minus
+    for m in _MASTER.finditer(s):
+        kind = m.lastgroup
+        if kind == "word":
+            t = m.group(kind)
+            tok = words.get(t)
+            if tok is None:
+                tok = names.get(t)
+                if tok is None:
+                    tok = names[t] = VarToken(t)
+                prev = tok
+            elif tok.__class__ is KeywordToken:
+                prev = tok
+            yield tok
+        elif kind == "op":
+            t = m.group(kind)
+            if t == "++":
+                raise SyntaxError("Invalid operator '++'. Did you mean '+'?")
+            prev = ops[t]
+            yield prev
+        elif kind == "punct":
+            yield punct[m.group(kind)]
+        elif kind == "number":
+            prev = NumberToken(m.group(kind))
+            yield prev
+        elif kind == "semi":
+            yield _SEMICOLON
+        elif kind == "string":
+            yield StringToken(m.group(kind)[1:-1])
+        elif kind == "minus":
+            if m.group("minus_eq"):
+                yield ops["-="]
+            elif num := m.group("minus_num"):
+                # unary negation / subtraction on a number: `x - 3` => `x + (-3)`
+                if is_binary_context(prev):
+                    yield ops["+"]
+                yield NumberToken("-" + num)
+            elif var := m.group("minus_var"):
+                # unary negation on a variable: `-x` => `-1 * x`
+                if is_binary_context(prev):
+                    yield ops["+"]
+                yield _NEG_ONE
+                yield ops["*"]
+                yield VarToken(var)
+            elif m.group("minus_paren"):
+                yield ops["-"]
+        elif kind == "quote":
+            raise SyntaxError(f"Expected {m.group(kind)}")
+        elif kind == "error":
+            raise SyntaxError(f"Unexpected character {m.group(kind)!r}")
+
+
+# ======================================================================================================
+# Struct-of-arrays token stream: one byte of kind plus start/end offsets per token,
+# lexemes are slices of the source. `TokenCursor` walks it by index and is what
+# `parse(..., buffered=True)` uses in place of `peekable(lex(s))`.
+
+VAR_KIND, NUMBER_KIND, STRING_KIND = 0, 1, 2
+
+# every payload-free token gets its own kind; the prototype doubles as the token
+_FIXED_TOKENS = (
+    [_SEMICOLON]
+    + list(_WORD_TOKENS.values())
+    + list(_PUNCT_TOKENS.values())
+    + list(_OPERATOR_TOKENS.values())
+)
+KIND_TOKENS = [None, None, None] + _FIXED_TOKENS  # the token of each kind, None if it has a lexeme
+END_KIND = len(KIND_TOKENS)  # what `TokenCursor.kind` is past the last token
+_WORD_KINDS = {w: KIND_TOKENS.index(tok, 3) for w, tok in _WORD_TOKENS.items()}
+_PUNCT_KINDS = {p: KIND_TOKENS.index(tok, 3) for p, tok in _PUNCT_TOKENS.items()}
+_OPERATOR_KINDS = {op: KIND_TOKENS.index(tok, 3) for op, tok in _OPERATOR_TOKENS.items()}
+_SEMICOLON_KIND = 3
+
+
+class TokenBuffer:
+    """Tokens of `source` as parallel arrays instead of one object per token."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.kinds = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.synthetic = {}  # index -> lexeme for tokens not spelled out in the source
+        self._lines = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def lexeme(self, i: int) -> str:
+        text = self.synthetic.get(i)
+        if text is None:
+            text = self.source[self.starts[i]:self.ends[i]]
+        return text
+
+    def token(self, i: int) -> Token:
+        kind = self.kinds[i]
+        if kind == VAR_KIND:
+            return VarToken(self.lexeme(i))
+        elif kind == NUMBER_KIND:
+            return NumberToken(self.lexeme(i))
+        elif kind == STRING_KIND:
+            return StringToken(self.lexeme(i))
+        return KIND_TOKENS[kind]
+
+    def newlines(self) -> list:
+        """Offsets of the newlines in the source, found on first use."""
+        if self._lines is None:
+            self._lines = [m.start() for m in re.finditer("\n", self.source)]
+        return self._lines
+
+    def line(self, i: int) -> int:
+        """1-based source line of token `i`."""
+        return bisect_right(self.newlines(), self.starts[i]) + 1
+
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.kinds, self.starts, self.ends))
+
+
+def lex_buffer(s: str) -> TokenBuffer:
+    """Same token stream as `lex`, stored in a `TokenBuffer`."""
+    buf = TokenBuffer(s)
+    kinds = buf.kinds.append
+    starts = buf.starts.append
+    ends = buf.ends.append
+    synthetic = buf.synthetic
+    words = _WORD_KINDS
+    ops = _OPERATOR_KINDS
+    punct = _PUNCT_KINDS
+    plus, times, minus, minus_eq = ops["+"], ops["*"], ops["-"], ops["-="]
+    keyword_kinds = {k for w, k in words.items() if w in keyword_tokens}
+    binary = {VAR_KIND, NUMBER_KIND} | {
+        words[w] for w in keyword_tokens if w not in ("display", "displayl")
+    }
+    prev = None  # kind of the last keyword/identifier/number/operator
+    for m in _MASTER.finditer(s):
+        kind = m.lastgroup
+        start, end = m.span(kind)
+        if kind == "word":
+            k = words.get(s[start:end], VAR_KIND)
+            if k == VAR_KIND or k in keyword_kinds:
+                prev = k
+        elif kind == "op":
+            if s[start:end] == "++":
+                raise SyntaxError("Invalid operator '++'. Did you mean '+'?")
+            prev = k = ops[s[start:end]]
+        elif kind == "punct":
+            k = punct[s[start]]
+        elif kind == "number":
+            prev = k = NUMBER_KIND
+        elif kind == "semi":
+            k = _SEMICOLON_KIND
+        elif kind == "string":
+            k = STRING_KIND
+            start += 1
+            end -= 1
+        elif kind == "minus":
+            if m.group("minus_eq"):
+                k = minus_eq
+            elif num := m.group("minus_num"):
+                if prev in binary:
+                    kinds(plus)
+                    starts(start)
+                    ends(start)
+                if m.start("minus_num") != start + 1:  # whitespace between `-` and digits
+                    synthetic[len(buf.kinds)] = "-" + num
+                k = NUMBER_KIND
+            elif m.group("minus_var"):
+                if prev in binary:
+                    kinds(plus)
+                    starts(start)
+                    ends(start)
+                synthetic[len(buf.kinds)] = "-1"
+                kinds(NUMBER_KIND)
+                starts(start)
+                ends(start + 1)
+                kinds(times)
+                starts(start)
+                ends(start)
+                k = VAR_KIND
+                start, end = m.span("minus_var")
+            elif m.group("minus_paren"):
+                k = minus
+                end = start + 1
+            else:
+                continue
+        elif kind == "end" or kind == "comment":
+            continue
+        elif kind == "quote":
+            raise SyntaxError(f"Expected {m.group(kind)}")
+        else:
+            raise SyntaxError(f"Unexpected character {m.group(kind)!r}")
+        kinds(k)
+        starts(start)
+        ends(end)
+    return buf
+
+
+class TokenCursor:
+    """Index-based cursor over a `TokenBuffer` with the `peek`/`next` protocol of `peekable`.
+
+    `kind` is the kind of the token under the cursor, read straight from the buffer;
+    `advance()` moves past the token and `take()` also returns its lexeme, so a parser
+    that goes by kinds builds no Token objects. `peek()` builds one only when asked:
+    payload-free kinds share their prototype and names are interned.
+    """
+
+    __slots__ = ("buf", "kinds", "i", "kind", "_tok", "_names", "_lexemes", "_source", "_starts", "_ends",
+                 "_synthetic", "_newlines")
+
+    def __init__(self, buf: TokenBuffer):
+        self.buf = buf
+        self.kinds = buf.kinds + array("B", [END_KIND])  # the sentinel saves a bounds check
+        self._source, self._starts, self._ends, self._synthetic = buf.source, buf.starts, buf.ends, buf.synthetic
+        self._names = {}
+        self._lexemes = {}  # one str per spelling, as lex() gives: scope lookups then hit by identity
+        self._newlines = None
+        self.i = 0
+        self.kind = self.kinds[0]
+        self._tok = None
+
+    def take(self) -> str:
+        """Lexeme of the token under the cursor, moving past it."""
+        self.i = i = self.i + 1
+        self.kind = self.kinds[i]
+        self._tok = None
+        i -= 1
+        text = self._synthetic.get(i) or self._source[self._starts[i]:self._ends[i]]
+        return self._lexemes.setdefault(text, text)
+
+    def advance(self):
+        """Move past the token under the cursor without building it."""
+        self.i = i = self.i + 1
+        self.kind = self.kinds[i]
+        self._tok = None
+
+    def peek(self, default=None):
+        tok = self._tok
+        if tok is None:
+            kind = self.kind
+            if kind == END_KIND:
+                return default
+            tok = KIND_TOKENS[kind]
+            if kind == VAR_KIND:
+                name = self.buf.lexeme(self.i)
+                tok = self._names.get(name)
+                if tok is None:
+                    name = self._lexemes.setdefault(name, name)
+                    tok = self._names[name] = VarToken(name)
+            elif tok is None:
+                tok = self.buf.token(self.i)
+            self._tok = tok
+        return tok
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        tok = self.peek()
+        if tok is None:
+            raise StopIteration
+        self.advance()
+        return tok
+
+    def line(self) -> int:
+        """Source line of the token under the cursor (0 once exhausted)."""
+        if self.kind == END_KIND:
+            return 0
+        if self._newlines is None:
+            self._newlines = self.buf.newlines()
+        return bisect_right(self._newlines, self._starts[self.i]) + 1
+
+
+def lex_legacy(s: str) -> Iterator[Token]:
+    """Character-by-character lexer that `lex` replaced; kept as the reference."""
     i = 0
     # prev_char = None
     prev_token= None
@@ -0,0 +1,319 @@
+import mmap
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from functools import cached_property
+
+from bytecode_gen import *
+from bytecode_eval import compile_program, execute_bytecode
+from runtime import MemoStats, new_frame, BREAKOUT_SIGNAL, MOVEON_SIGNAL
+
+# ==========================================================================================
+# ==================================== NXB FILES ===========================================
+# A .nxb file is a program compiled for the stack VM (generated, optimized and fused, see
+# bytecode_eval.compile_program), so it runs without the lexer, parser or resolver.
+# Everything is little-endian:
+#
+#   header     MAGIC, FORMAT_VERSION, the opcode count, the top level (code object, frame
+#              size, hoisted functions) and where the blocks below start
+#   words      int32 blocks, each 4-byte aligned: the instructions and line tables of every
+#              code object, the function and code records and the hoisted function indices
+#   values     tagged constants (see VALUES): names, parameter lists and constant pools
+#
+# A function record is FUNCTION_RECORD words: code object, slot, frame size, isRec, isMemo,
+# first and count of its hoisted functions, and the offset of its (name, params) value.
+# Records of the same fnmemo function share the MemoStats made on loading. A code
+# record is CODE_RECORD words: offsets of its name, instructions, line table and constant
+# pool, with the word counts of the middle two. Code objects and functions are referred to
+# by their index, -1 meaning none.
+#
+# Loading maps the file and reads the records in place. The word blocks become memoryviews
+# the VM indexes directly, and a function's code object, constant pool included, is only
+# decoded when it is first called, so start-up does not grow with the amount of code.
+
+MAGIC = b"NXB\0"
+FORMAT_VERSION = 5  # bump when the layout or the opcodes change
+HEADER = struct.Struct("<4sHHiIIIIIIIII")
+FUNCTION_RECORD, CODE_RECORD = 8, 6
+NXB_SUFFIX = ".nxb"
+
+
+@dataclass
+class Compiled:
+    """What running a program needs once the front end is done."""
+    code: CodeObject  # the top level
+    frame_size: int
+    hoisted: tuple    # FuncDefs that live in the top-level frame
+
+
+class LineTable:
+    """A code object's line table read in place: [(code position, source line)]."""
+    __slots__ = ("words",)
+
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words) // 2
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.words[2 * i], self.words[2 * i + 1]
+
+
+class LoadedFuncDef(FuncDef):
+    """A FuncDef read from a .nxb file. It is made without __init__ and the fields it has
+    no use for; name, parameters and code object are decoded when first asked for."""
+    funcBody = funcScope = None
+    image = None
+    code_index = signature = -1
+
+    @cached_property
+    def bytecode(self):
+        return None if self.code_index < 0 else self.image.code(self.code_index)
+
+    @cached_property
+    def funcName(self):
+        return self.image.value(self.signature)[0]
+
+    @cached_property
+    def funcParams(self):
+        return list(self.image.value(self.signature)[1])
+
+
+# ===== VALUES =====
+# One tag byte, then: I the u32 length and the signed bytes of an int, D a double, S the
+# u32 length and UTF-8 of a string, U a u32 count and the items of a tuple, R the u32
+# index of a function; N, T and F are None, True and False, B and M what breakout and
+# moveon evaluate to.
+
+def write_value(out, value, functions):
+    match value:
+        case None:
+            out += b"N"
+        case True:
+            out += b"T"
+        case False:
+            out += b"F"
+        case int():
+            data = value.to_bytes(value.bit_length() // 8 + 1, "little", signed=True)
+            out += b"I" + struct.pack("<I", len(data)) + data
+        case float():
+            out += b"D" + struct.pack("<d", value)
+        case str():
+            data = value.encode()
+            out += b"S" + struct.pack("<I", len(data)) + data
+        case tuple() | list():
+            out += b"U" + struct.pack("<I", len(value))
+            for item in value:
+                write_value(out, item, functions)
+        case FuncDef():
+            out += b"R" + struct.pack("<I", functions[id(value)])
+        case BreakOut():
+            out += b"B"
+        case MoveOn():
+            out += b"M"
+        case _:
+            raise ValueError(f"Cannot store constant {value!r} in a {NXB_SUFFIX} file.")
+
+
+class Reader:
+    def __init__(self, view, offset, functions=()):
+        self.view = view
+        self.offset = offset
+        self.functions = functions
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.view, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values[0]
+
+    def value(self):
+        tag = self.view[self.offset]
+        self.offset += 1
+        match tag:
+            case 78:  # N
+                return None
+            case 84:  # T
+                return True
+            case 70:  # F
+                return False
+            case 73:  # I
+                size = self.unpack("<I")
+                self.offset += size
+                return int.from_bytes(self.view[self.offset - size:self.offset], "little", signed=True)
+            case 68:  # D
+                return self.unpack("<d")
+            case 83:  # S
+                size = self.unpack("<I")
+                self.offset += size
+                return str(self.view[self.offset - size:self.offset], "utf-8")
+            case 85:  # U
+                return tuple(self.value() for _ in range(self.unpack("<I")))
+            case 82:  # R
+                return self.functions[self.unpack("<I")]
+            case 66:  # B
+                return BREAKOUT_SIGNAL
+            case 77:  # M
+                return MOVEON_SIGNAL
+        raise ValueError(f"Corrupt {NXB_SUFFIX} file: unknown value tag {tag} at byte {self.offset - 1}.")
+
+
+# ===== WRITING =====
+
+def tables(compiled):
+    """Every code object and FuncDef `compiled` reaches, in table order."""
+    codes, functions = {}, {}
+    pending = [compiled.code, *compiled.hoisted]
+    while pending:
+        item = pending.pop(0)  # the top level first
+        if isinstance(item, CodeObject):
+            if id(item) not in codes:
+                codes[id(item)] = item
+                pending.extend(const for const in item.consts if isinstance(const, FuncDef))
+        elif id(item) not in functions:
+            functions[id(item)] = item
+            pending.extend(item.hoisted)
+            if item.bytecode is not None:
+                pending.append(item.bytecode)
+    return list(codes.values()), list(functions.values())
+
+
+def words(values):
+    block = array("i", values)
+    if sys.byteorder == "big":
+        block.byteswap()
+    return block.tobytes()
+
+
+def dumps(compiled):
+    """The bytes of the .nxb file holding `compiled`."""
+    codes, functions = tables(compiled)
+    code_index = {id(code): i for i, code in enumerate(codes)}
+    function_index = {id(funcDef): i for i, funcDef in enumerate(functions)}
+    values, hoisted = bytearray(), []
+
+    def value(v):
+        offset = len(values)
+        write_value(values, v, function_index)
+        return offset
+
+    def hoist(funcDefs):
+        hoisted.extend(function_index[id(funcDef)] for funcDef in funcDefs)
+        return len(hoisted) - len(funcDefs), len(funcDefs)
+
+    out = bytearray(HEADER.size)
+    code_records = []
+    for code in codes:
+        code_offset = len(out)
+        out += words(code.code)
+        lines_offset = len(out)
+        out += words([word for entry in code.lines for word in entry])
+        code_records += [value(code.name), code_offset, len(code.code), lines_offset, len(code.lines), value(code.consts)]
+    function_records = []
+    for funcDef in functions:
+        function_records += [-1 if funcDef.bytecode is None else code_index[id(funcDef.bytecode)],
+                             -1 if funcDef.slot is None else funcDef.slot, funcDef.frame_size, funcDef.isRec,
+                             funcDef.memo is not None, *hoist(funcDef.hoisted), value((funcDef.funcName, funcDef.funcParams))]
+    top_hoisted = hoist(compiled.hoisted)
+    functions_offset = len(out)
+    out += words(function_records)
+    codes_offset = len(out)
+    out += words(code_records)
+    hoisted_offset = len(out)
+    out += words(hoisted)
+    values_offset = len(out)
+    out += values
+    HEADER.pack_into(out, 0, MAGIC, FORMAT_VERSION, len(OPNAMES), code_index[id(compiled.code)], compiled.frame_size,
+                     *top_hoisted, functions_offset, len(functions), codes_offset, len(codes), hoisted_offset,
+                     values_offset)
+    return bytes(out)
+
+
+def build(program):
+    """The Compiled form of a resolved `program`."""
+    lines, _ = program
+    return Compiled(compile_program(program), lines.frame_size, lines.hoisted)
+
+
+def compile_file(program, path):
+    """Compile a resolved `program` and write it to `path`; returns the number of bytes."""
+    data = dumps(build(program))
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+# ===== LOADING =====
+
+def block(view, offset, count):
+    """`count` int32 words at `offset`, read in place where the byte order allows it."""
+    data = view[offset:offset + 4 * count]
+    if sys.byteorder == "little":
+        return data.cast("i")
+    swapped = array("i", data.tobytes())
+    swapped.byteswap()
+    return swapped
+
+
+class Image:
+    """A .nxb file in memory: every function, and the code objects decoded so far."""
+
+    def __init__(self, data):
+        self.view = view = memoryview(data)
+        if len(view) < HEADER.size:
+            raise ValueError(f"Not a {NXB_SUFFIX} file: too short.")
+        (magic, version, opcodes, self.top, self.frame_size, top_hoisted, top_count, functions_offset,
+         function_count, codes_offset, code_count, hoisted_offset, self.values) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"Not a {NXB_SUFFIX} file.")
+        if version != FORMAT_VERSION or opcodes != len(OPNAMES):
+            raise ValueError(f"{NXB_SUFFIX} format version {version} with {opcodes} opcodes, this build reads "
+                             f"version {FORMAT_VERSION} with {len(OPNAMES)}: recompile the program.")
+        records = block(view, functions_offset, FUNCTION_RECORD * function_count)
+        self.code_records = block(view, codes_offset, CODE_RECORD * code_count)
+        self.codes = [None] * code_count
+        self.functions = []
+        memos = {}  # code index -> MemoStats
+        for i in range(0, len(records), FUNCTION_RECORD):
+            funcDef = LoadedFuncDef.__new__(LoadedFuncDef)
+            funcDef.image, funcDef.code_index, funcDef.signature = self, records[i], records[i + 7]
+            funcDef.isRec, funcDef.isMemo = bool(records[i + 3]), bool(records[i + 4])
+            if funcDef.isMemo:
+                funcDef.memo = memos.setdefault(records[i], MemoStats(funcDef.funcName))
+            funcDef.slot = None if records[i + 1] < 0 else records[i + 1]
+            funcDef.frame_size = records[i + 2]
+            self.functions.append(funcDef)
+        hoisted = block(view, hoisted_offset, (self.values - hoisted_offset) // 4)
+        for funcDef, i in zip(self.functions, range(0, len(records), FUNCTION_RECORD)):
+            funcDef.hoisted = tuple(self.functions[j] for j in hoisted[records[i + 5]:records[i + 5] + records[i + 6]])
+        self.hoisted = tuple(self.functions[j] for j in hoisted[top_hoisted:top_hoisted + top_count])
+
+    def value(self, offset):
+        return Reader(self.view, self.values + offset, self.functions).value()
+
+    def code(self, index):
+        """Code object `index`, decoded on first use."""
+        if self.codes[index] is None:
+            name, code, size, lines, count, consts = self.code_records[CODE_RECORD * index:CODE_RECORD * (index + 1)]
+            self.codes[index] = CodeObject(self.value(name), block(self.view, code, size), list(self.value(consts)),
+                                           LineTable(block(self.view, lines, 2 * count)))
+        return self.codes[index]
+
+
+def loads(data):
+    """The Compiled program in `data`, a buffer holding a .nxb file."""
+    image = Image(data)
+    return Compiled(image.code(image.top), image.frame_size, image.hoisted)
+
+
+def load(path):
+    """The Compiled program in the .nxb file at `path`, read through a memory map."""
+    with open(path, "rb") as f:
+        return loads(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def run(compiled):
+    execute_bytecode(compiled.code, new_frame(compiled.frame_size, None, compiled.hoisted))
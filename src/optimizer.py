@@ -0,0 +1,814 @@
+import math
+import operator
+from copy import copy
+from dataclasses import fields
+
+from parser import *
+from runtime import nexus_pow
+
+# ==========================================================================================
+# ==================================== AST OPTIMIZER =======================================
+# Runs on resolved programs (resolve() calls it last), so every backend, the tree-walker
+# included, gets the same rewritten tree. Nodes are updated in place; a node is only
+# replaced by a new constant or by one of its own operands, which keep their resolver
+# annotations.
+#
+# Constant folding evaluates BinOp/UnaryOp nodes whose operands are literals with the
+# tree-walker's semantics. An operation that raises (1 / 0, 0 ** -1, "a" + 1) is left for
+# run time to raise, and so are values too big to be worth storing in the tree.
+#
+# Identities (x * 1, x + 0, not not x, ...) only hold for some types of x: "s" + 0 is an
+# error and not not 5 is true, not 5. They are applied where kind() can tell the type of
+# x from the tree and from the variable types infer() finds; in a condition only truth
+# matters, so `not not x` always goes there.
+#
+# Strength reduction turns x ** 2 into x * x when x is an int variable, saving the call to
+# nexus_pow and its checks. Other classic reductions do not pay in this interpreter and
+# are left out: x % 2 ** k as x & (2 ** k - 1) and x * 2 ** k as a shift measure no faster
+# in any backend, and slower in the tree-walker, whose match reaches & and << later; the
+# stack VM already fuses x % c == 0 into MOD_EQ_ZERO_JUMP; x * x * x for x ** 3 loses in
+# both VMs (see benchmarks/optimizer_bench.py).
+
+FOLD_LIMIT = 4096  # bits of the largest int and length of the longest string folded
+
+BINARY = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv,
+    "÷": operator.truediv, "**": nexus_pow, "%": operator.mod,
+    "<": operator.lt, ">": operator.gt, "==": operator.eq, "!=": operator.ne,
+    "<=": operator.le, ">=": operator.ge,
+    "and": lambda a, b: a and b, "or": lambda a, b: a or b,
+    "&": operator.and_, "|": operator.or_, "^": operator.xor,
+    "<<": operator.lshift, ">>": operator.rshift,
+}
+UNARY = {"not": operator.not_, "!": operator.not_, "~": operator.invert, "ascii": ord, "char": chr}
+COMPARISONS = {"<", ">", "==", "!=", "<=", ">="}
+
+NUMBERS = (int, float)
+# op -> (identity element, types of x it is an identity for): x op e == x, and e op x == x
+# for the LEFT ones
+RIGHT_IDENTITIES = {"+": (0, (int,)), "-": (0, (int,)), "*": (1, NUMBERS), "**": (1, NUMBERS),
+                    "|": (0, (int,)), "^": (0, (int,)), "<<": (0, (int,)), ">>": (0, (int,))}
+LEFT_IDENTITIES = {"+": (0, (int,)), "*": (1, NUMBERS), "|": (0, (int,)), "^": (0, (int,))}
+
+
+def is_literal(tree):
+    return isinstance(tree, (Number, String, Boolean))
+
+
+def literal(value):
+    """The node for a folded value, or None if it should not go in the tree."""
+    match value:
+        case bool():
+            return Boolean(value)
+        case int() if value.bit_length() <= FOLD_LIMIT:
+            return Number(value)
+        case float() if math.isfinite(value):
+            return Number(value)
+        case str() if len(value) <= FOLD_LIMIT:
+            return String(value)
+    return None
+
+
+def too_big(op, a, b):
+    """Whether `a op b` could build a huge value before literal() gets to refuse it."""
+    if op == "**" and type(a) is int and type(b) is int:
+        return abs(a) > 1 and b * a.bit_length() > FOLD_LIMIT
+    if op == "<<" and isinstance(b, int):
+        return b > FOLD_LIMIT
+    if op == "*" and isinstance(a, str) != isinstance(b, str):
+        return isinstance(a, int) and a > FOLD_LIMIT or isinstance(b, int) and b > FOLD_LIMIT
+    return False
+
+
+def evaluate(op, operands):
+    """The literal `op` gives on `operands`, or None to leave the operation to run time."""
+    if len(operands) == 2 and too_big(op, *operands):
+        return None
+    try:
+        value = (UNARY if len(operands) == 1 else BINARY)[op](*operands)
+    except (ArithmeticError, TypeError, ValueError):  # raised when the program runs instead
+        return None
+    return literal(value)
+
+
+def negated(tree):
+    """The operand of a logical not, or None."""
+    match tree:
+        case BinOp("not", val, _) | UnaryOp("not" | "!", val):
+            return val
+    return None
+
+
+def kind(tree):
+    """The type every value of `tree` has, if it shows in the tree; None otherwise."""
+    match tree:
+        case Number(v):
+            return type(v)
+        case Variable():
+            return tree.type
+        case Boolean():
+            return bool
+        case String() | UnaryOp("char", _):
+            return str
+        case UnaryOp("ascii", _):
+            return int
+        case BinOp(op, _, _) if op in COMPARISONS:
+            return bool
+        case BinOp("not", _, _) | UnaryOp("not" | "!", _):
+            return bool
+        case BinOp("~", val, _) | UnaryOp("~", val):
+            return int if kind(val) is int else None
+        case BinOp("+" | "-" | "*" | "%", l, r):
+            kinds = {kind(l), kind(r)}
+            if kinds <= {int, float}:
+                return float if float in kinds else int
+        case BinOp("/" | "÷", l, r):
+            if {kind(l), kind(r)} <= {int, float}:
+                return float
+        case BinOp("&" | "|" | "^" | "<<" | ">>", l, r):
+            if kind(l) is int and kind(r) is int:
+                return int
+    return None
+
+
+def simplify(tree):
+    """A cheaper node equivalent to operator node `tree`, whose operands are folded."""
+    match tree:
+        case BinOp("not" | "~" as op, val, _) | UnaryOp(op, val):
+            if is_literal(val):
+                return evaluate(op, (val.val,)) or tree
+            inner = negated(val)
+            if op in ("not", "!") and inner is not None and kind(inner) is bool:
+                return inner
+        case BinOp("and" | "or" as op, l, r) if is_literal(l):
+            return r if bool(l.val) == (op == "and") else l
+        case BinOp(op, l, r) if is_literal(l) and is_literal(r):
+            return evaluate(op, (l.val, r.val)) or tree
+        case BinOp("**", Variable() as x, Number(v)) if type(v) is int and v == 2 and x.type is int:
+            return BinOp("*", x, copy(x))
+        case BinOp(op, l, Number(v)) if type(v) is int and op in RIGHT_IDENTITIES:
+            identity, kinds = RIGHT_IDENTITIES[op]
+            if v == identity and kind(l) in kinds:
+                return l
+        case BinOp(op, Number(v), r) if type(v) is int and op in LEFT_IDENTITIES:
+            identity, kinds = LEFT_IDENTITIES[op]
+            if v == identity and kind(r) in kinds:
+                return r
+    return tree
+
+
+def condition(tree):
+    """`tree` folded where only its truth is used."""
+    tree = fold(tree)
+    while negated(tree) is not None and negated(negated(tree)) is not None:
+        tree = negated(negated(tree))
+    return tree
+
+
+def fold(tree):
+    """`tree` with its constant operations folded and identities removed."""
+    match tree:
+        case BinOp(_, l, r):
+            tree.left, tree.right = fold(l), fold(r)
+            return simplify(tree)
+        case UnaryOp(_, val):
+            tree.val = fold(val)
+            return simplify(tree)
+        case Statements(statements):
+            for i, stmt in enumerate(statements):
+                statements[i] = fold(stmt)
+                if statements[i] is not stmt and isinstance(stmt, AST):
+                    statements[i].line = stmt.line
+        case Array(val):
+            val[:] = map(fold, val)
+        case Hash(val):
+            val[:] = [(fold(k), fold(v)) for k, v in val]
+        case VarBind() | AssignToVar() | CompoundAssignment() | PushFront() | PushBack() | Display() \
+                | DisplayL():
+            tree.val = fold(tree.val)
+        case AssigntoArr() | InsertAt():
+            tree.index, tree.val = fold(tree.index), fold(tree.val)
+        case AddHashPair():
+            tree.key, tree.val = fold(tree.key), fold(tree.val)
+        case CallArr() | RemoveAt():
+            tree.index = fold(tree.index)
+        case CallHashVal() | RemoveHashPair():
+            tree.key = fold(tree.key)
+        case AssignHashVal():
+            tree.key, tree.new_val = fold(tree.key), fold(tree.new_val)
+        case Feed(msg):
+            tree.msg = fold(msg)
+        case FuncCall(_, funcArgs):
+            funcArgs[:] = map(fold, funcArgs)
+        case If(c, t, e, _):
+            tree.c, tree.t, tree.e = condition(c), fold(t), fold(e)
+        case WhileLoop(cond, body, _):
+            tree.condition, tree.body = condition(cond), fold(body)
+        case ForLoop(init, cond, incr, body, _):
+            tree.initialization, tree.condition = fold(init), condition(cond)
+            tree.increment, tree.body = fold(incr), fold(body)
+    return tree
+
+
+# ===== TYPE INFERENCE =====
+# Flow-insensitive: a variable has a type if every value assigned to it anywhere has that
+# type, which kind() tells from the assigned expressions. A parameter is assigned the
+# arguments of every call, as long as its function is only ever called by name: once its
+# value is read or overwritten, calls can no longer be told apart and it stays untyped.
+# The slots of functions are never typed. A variable is assumed to be assigned before it
+# is read.
+
+UNSEEN = object()  # no assignment looked at yet
+WRITES = (VarBind, AssignToVar, CompoundAssignment)
+
+
+def children(tree):
+    """The nodes right under `tree`; none under a FuncDef, whose body is another frame."""
+    if isinstance(tree, FuncDef) or not isinstance(tree, (AST, Statements)):
+        return
+    for value in vars(tree).values():
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            for child in item if isinstance(item, tuple) else (item,):  # hash pairs
+                if isinstance(child, (AST, Statements)):
+                    yield child
+
+
+def nodes(tree):
+    """`tree` and every node under it, not looking into function bodies."""
+    yield tree
+    for child in children(tree):
+        yield from nodes(child)
+
+
+def blocks(tree):
+    """The outermost Statements under `tree`, not looking into function bodies."""
+    for child in children(tree):
+        if isinstance(child, Statements):
+            yield child
+        else:
+            yield from blocks(child)
+
+
+def frames(body, hoisted, outer=()):
+    """(body, ids of the bodies of its enclosing frames and its own, hoisted FuncDefs) of
+    the frame running `body` and of every frame inside it."""
+    chain = (*outer, id(body))
+    yield body, chain, hoisted
+    for funcDef in hoisted:
+        yield from frames(funcDef.funcBody, funcDef.hoisted, chain)
+
+
+def join(a, b):
+    return b if a is UNSEEN else a if a == b else None
+
+
+def rebuild(tree, visit):
+    """Replace every child of `tree` by visit(child), not looking into function bodies."""
+    if isinstance(tree, FuncDef) or not isinstance(tree, (AST, Statements)):
+        return
+    for name, value in vars(tree).items():
+        if isinstance(value, list):
+            value[:] = [tuple(map(visit, item)) if isinstance(item, tuple) else visit(item) for item in value]
+        elif isinstance(value, (AST, Statements)):
+            setattr(tree, name, visit(value))
+
+
+def owners(lines):
+    """id(body) -> the nodes holding the frame_size of the frame running it."""
+    found = {id(lines): [lines]}
+    for body, _, hoisted in frames(lines, lines.hoisted):
+        for node in nodes(body):
+            if isinstance(node, FuncDef):
+                found.setdefault(id(node.funcBody), []).append(node)
+        for funcDef in hoisted:
+            found.setdefault(id(funcDef.funcBody), []).append(funcDef)
+    return found
+
+
+def new_slot(owners):
+    """A new slot at the end of a frame."""
+    slot = owners[0].frame_size
+    for owner in owners:
+        owner.frame_size = slot + 1
+    return slot
+
+
+def written_by_functions(lines):
+    """The variables some function assigns outside its own frame."""
+    return {(chain[-1 - node.depth], node.slot) for body, chain, _ in frames(lines, lines.hoisted)
+            for node in nodes(body) if isinstance(node, WRITES) and node.depth}
+
+
+def where(owners, body):
+    owner = owners[id(body)][0]
+    return owner.funcName if isinstance(owner, FuncDef) else "<program>"
+
+
+def known_functions(lines):
+    """(id(body), slot) -> FuncDef of the variables that only ever hold that function: a
+    call by one of these names always reaches it."""
+    functions, assigned = {}, set()
+    for body, chain, hoisted in frames(lines, lines.hoisted):
+        for funcDef in hoisted:
+            functions.setdefault((id(body), funcDef.slot), []).append(funcDef)
+        for node in nodes(body):
+            if isinstance(node, WRITES):
+                assigned.add((chain[-1 - node.depth], node.slot))
+    return {variable: funcDefs[0] for variable, funcDefs in functions.items()
+            if len(funcDefs) == 1 and variable not in assigned}
+
+
+class Types:
+    def __init__(self):
+        self.assigned = {}   # variable -> expressions whose values it is assigned
+        self.reads = []      # (Variable node, variable)
+        self.calls = {}      # function variable -> argument lists of the calls to it
+        self.functions = {}  # function variable -> FuncDefs
+        self.untyped = set()
+        # a variable is (id of its frame's body, slot)
+
+    def frame(self, body, frames, hoisted):
+        for funcDef in hoisted:
+            self.functions.setdefault((id(body), funcDef.slot), []).append(funcDef)
+        for node in nodes(body):
+            variable = (frames[-1 - node.depth], node.slot) if isinstance(node, Named) else None
+            match node:
+                case Variable():
+                    self.reads.append((node, variable))
+                case VarBind(_, _, val, _) | AssignToVar(_, val):
+                    self.assigned.setdefault(variable, []).append(val)
+                case CompoundAssignment(name, op, val):  # x op= v is x = x op v (see evaluator.e)
+                    current = Variable(name)
+                    self.reads.append((current, variable))
+                    self.assigned.setdefault(variable, []).append(BinOp(op[0], current, val))
+                case FuncCall(_, funcArgs):
+                    self.calls.setdefault(variable, []).append(funcArgs)
+
+    def parameters(self):
+        """Assign every parameter its arguments, or leave it untyped."""
+        read = {variable for _, variable in self.reads}
+        for variable, funcDefs in self.functions.items():
+            self.untyped.add(variable)
+            calls = self.calls.get(variable, [])
+            for funcDef in funcDefs:
+                for i in range(len(funcDef.funcParams)):
+                    param = (id(funcDef.funcBody), i + 1)
+                    if variable in read or variable in self.assigned or any(len(args) <= i for args in calls):
+                        self.untyped.add(param)
+                    else:
+                        self.assigned.setdefault(param, []).extend(args[i] for args in calls)
+
+    def solve(self):
+        """Set the type of every Variable node: the least fixpoint, starting from UNSEEN."""
+        types = {variable: UNSEEN for variable in self.assigned if variable not in self.untyped}
+        changed = True
+        while changed:
+            for node, variable in self.reads:
+                node.type = types.get(variable)
+                if node.type is UNSEEN:
+                    node.type = int  # a guess for this round only: its assignments fix it
+            changed = False
+            for variable in types:
+                new = types[variable]
+                for val in self.assigned[variable]:
+                    new = join(new, kind(val))
+                if new is not types[variable]:
+                    types[variable], changed = new, True
+
+
+def infer(lines):
+    """Type the variables of a resolved program."""
+    types = Types()
+    for frame in frames(lines, lines.hoisted):
+        types.frame(*frame)
+    types.parameters()
+    types.solve()
+
+
+# ===== LOOP-INVARIANT CODE MOTION =====
+# An operation inside a while or for loop whose operands the loop never writes is computed
+# once, into a temporary assigned right before the loop; the loop reads the temporary.
+# A loop that calls a function may write whatever any function assigns outside its own
+# frame. Only operations that cannot raise are moved, since the loop might not have
+# evaluated them (safe() decides from kind()); calls, feed and array and hash reads never
+# are. Temporaries take new slots at the end of their frame.
+
+def safe(tree):
+    """Whether operator node `tree` cannot raise, whatever the values of its operands."""
+    match tree:
+        case BinOp("and" | "or" | "==" | "!=" | "not", _, _) | UnaryOp("not" | "!", _):
+            return True
+        case BinOp("~", val, _) | UnaryOp("~", val):
+            return kind(val) is int
+        case BinOp("+" | "-" | "*", l, r):  # int with float can overflow
+            return kind(l) is kind(r) and kind(l) in NUMBERS or tree.op == "+" and kind(l) is kind(r) is str
+        case BinOp("<" | ">" | "<=" | ">=", l, r):
+            return {kind(l), kind(r)} <= {int, float} or kind(l) is kind(r) is str
+        case BinOp("&" | "|" | "^", l, r):
+            return kind(l) is kind(r) is int
+        case BinOp("%", l, Number(v)):
+            return kind(l) in NUMBERS and v != 0
+        case BinOp("/" | "÷", l, Number(v)):  # a big enough int does not fit a float
+            return kind(l) is float and v != 0
+        case BinOp("<<" | ">>", l, Number(v)):
+            return kind(l) is int and type(v) is int and 0 <= v <= FOLD_LIMIT
+    return False
+
+
+def source(tree, nested=False):
+    """Nexus text of an expression, for reports."""
+    match tree:
+        case Number(v) | Boolean(v):
+            return repr(v)
+        case String(v):
+            return f'"{v}"'
+        case Variable(name):
+            return name
+        case BinOp("not" | "~" as op, val, _) | UnaryOp(op, val):
+            text = f"{op}({source(val)})" if op in ("ascii", "char") else f"{op} {source(val, True)}"
+        case BinOp("+", l, Number(v)) if v < 0:  # how the lexer reads `l - n`
+            text = f"{source(l, True)} - {-v!r}"
+        case BinOp(op, l, r):
+            text = f"{source(l, True)} {op} {source(r, True)}"
+        case _:
+            return f"<{type(tree).__name__}>"
+    return f"({text})" if nested else text
+
+
+def signature(tree):
+    """What two equal expressions have in common (dataclass equality ignores slots)."""
+    match tree:
+        case Variable():
+            return "var", tree.depth, tree.slot
+        case BinOp(op, l, r):
+            return op, signature(l), signature(r)
+        case UnaryOp(op, val):
+            return op, signature(val)
+    return type(tree).__name__, getattr(tree, "val", None), type(getattr(tree, "val", None))
+
+
+class Motion:
+    def __init__(self, lines, report):
+        self.report = report    # (where, line, what) per moved operation
+        self.owners = owners(lines)
+        self.by_functions = written_by_functions(lines)
+        self.count = 0
+
+    def variable(self, node):
+        return self.chain[-1 - node.depth], node.slot
+
+    def frame(self, body, chain, hoisted):
+        self.body, self.chain = body, chain
+        self.block(body)
+
+    def block(self, block):
+        """Move the invariants out of every loop in `block`, outer loops first."""
+        statements = block.statements
+        i = 0
+        while i < len(statements):
+            stmt = statements[i]
+            if isinstance(stmt, (WhileLoop, ForLoop)):
+                temporaries = self.loop(stmt)
+                statements[i:i] = temporaries
+                i += len(temporaries)
+            for inner in [stmt] if isinstance(stmt, Statements) else list(blocks(stmt)):
+                self.block(inner)
+            i += 1
+
+    def loop(self, loop):
+        """Rewrite `loop`; returns the VarBinds of its temporaries."""
+        self.written = set()
+        calls = False
+        for node in nodes(loop):
+            if isinstance(node, WRITES):
+                self.written.add(self.variable(node))
+            calls = calls or isinstance(node, FuncCall)
+        if calls:
+            self.written |= self.by_functions
+        self.temporaries = {}  # signature -> VarBind
+        if isinstance(loop, ForLoop):
+            loop.condition, loop.increment = self.hoist(loop.condition), self.hoist(loop.increment)
+        else:
+            loop.condition = self.hoist(loop.condition)
+        self.hoist(loop.body)
+        for temporary in self.temporaries.values():
+            temporary.line = loop.line
+            self.report.append((where(self.owners, self.body), loop.line,
+                                f"{temporary.var_name} = {source(temporary.val)} (moved out of the loop)"))
+        return list(self.temporaries.values())
+
+    def invariant(self, tree):
+        match tree:
+            case Number() | String() | Boolean() | None:
+                return True
+            case Variable():
+                return self.variable(tree) not in self.written
+            case BinOp(_, l, r):
+                return self.invariant(l) and self.invariant(r) and safe(tree)
+            case UnaryOp(_, val):
+                return self.invariant(val) and safe(tree)
+        return False
+
+    def hoist(self, tree):
+        """`tree`, its invariant operations read from temporaries."""
+        if isinstance(tree, (BinOp, UnaryOp)) and self.invariant(tree):
+            return self.temporary(tree)
+        rebuild(tree, self.hoist)
+        return tree
+
+    def temporary(self, expr):
+        """A read of the temporary holding `expr`, taking a new slot for it if needed."""
+        key = signature(expr)
+        if key not in self.temporaries:
+            self.count += 1
+            temporary = VarBind(f"@{self.count}", None, expr, SymbolCategory.VARIABLE)
+            temporary.slot = new_slot(self.owners[id(self.body)])
+            self.temporaries[key] = temporary
+        temporary = self.temporaries[key]
+        read = Variable(temporary.var_name)
+        read.slot, read.type = temporary.slot, kind(expr)
+        return read
+
+
+def move_invariants(lines, report):
+    motion = Motion(lines, report)
+    for frame in frames(lines, lines.hoisted):
+        motion.frame(*frame)
+
+
+# ===== INLINING =====
+# A call to a small function is replaced by a copy of the function's body, with its
+# parameters and locals moved to new slots of the caller's frame and its reads of outer
+# frames deepened by the depth of the call. The arguments are bound to those slots first,
+# in order, in a Statements expression around the copy. An argument is put straight in
+# place of its parameter instead when nothing can tell: a literal; a variable that
+# neither the body nor the arguments after it can change; an operation on those that
+# cannot raise (safe()), if the parameter is read once. A temporary costs the tree-walker
+# about what the call did.
+#
+# Only functions that are not fnrec or fnmemo and do not call themselves, define no functions, have
+# no loops, breakout or moveon, print nothing, read no input, change no array or hash,
+# write nothing outside their frame and assign every local before reading it are inlined,
+# and only when their name is never assigned, so a call by that name always reaches them.
+# Calls in an inlined body are inlined in turn, up to a depth.
+
+INLINE_SIZE = 24   # nodes in the largest function body inlined
+INLINE_DEPTH = 2   # inlined bodies inside inlined bodies; 0 turns inlining off
+
+EFFECTS = (WhileLoop, ForLoop, FuncDef, BreakOut, MoveOn, Display, DisplayL, Feed,
+           PushFront, PushBack, PopFront, PopBack, AssigntoArr, AssignFullArray, InsertAt,
+           RemoveAt, ClearArray, AddHashPair, RemoveHashPair, AssignHashVal)
+
+
+def inlinable(funcDef, size):
+    """Whether calls to `funcDef` can be replaced by its body."""
+    if funcDef.isRec or funcDef.isMemo or funcDef.hoisted:
+        return False
+    params = len(funcDef.funcParams)
+    bound = set(range(1, params + 1))
+    count = 0
+    for stmt in funcDef.funcBody.statements:
+        for node in nodes(stmt):
+            count += 1
+            if isinstance(node, EFFECTS) or isinstance(node, WRITES) and node.depth:
+                return False
+            if isinstance(node, FuncCall) and node.depth == 1 and node.slot == funcDef.slot:
+                return False
+            if isinstance(node, Named) and not node.depth and node.slot not in bound and not (
+                    node is stmt and isinstance(stmt, (VarBind, AssignToVar))):
+                return False  # a local possibly read before it is assigned
+        if isinstance(stmt, (VarBind, AssignToVar)):
+            bound.add(stmt.slot)
+    return count <= size
+
+
+def pure(tree):
+    """Whether evaluating `tree` can neither raise nor change anything."""
+    match tree:
+        case Number() | String() | Boolean() | Variable() | None:
+            return True
+        case BinOp(_, l, r):
+            return safe(tree) and pure(l) and pure(r)
+        case UnaryOp(_, val):
+            return safe(tree) and pure(val)
+    return False
+
+
+def clone(tree, rename):
+    """A copy of `tree`, each Named node in it replaced by rename(copy of the node)."""
+    match tree:
+        case Statements(statements):
+            return Statements([clone(stmt, rename) for stmt in statements])
+        case AST():
+            tree = copy(tree)
+            vars(tree).pop("line", None)  # source lines of the callee
+            for name, value in list(vars(tree).items()):
+                if isinstance(value, list):
+                    setattr(tree, name, [tuple(clone(child, rename) for child in item) if isinstance(item, tuple)
+                                         else clone(item, rename) for item in value])
+                elif isinstance(value, (AST, Statements)):
+                    setattr(tree, name, clone(value, rename))
+            return rename(tree) if isinstance(tree, Named) else tree
+    return tree
+
+
+class Inliner:
+    def __init__(self, lines, report, size, depth):
+        self.report = report  # (where, line, what) per inlined call
+        self.depth = depth
+        self.owners = owners(lines)
+        self.by_functions = written_by_functions(lines)
+        self.functions = {variable: funcDef for variable, funcDef in known_functions(lines).items()
+                          if inlinable(funcDef, size)}
+        self.inlining = []  # the FuncDefs whose copies are being visited, innermost last
+        self.count = 0
+
+    def frame(self, body, chain, hoisted):
+        self.body, self.chain, self.line = body, chain, 0
+        self.visit(body)
+
+    def visit(self, tree):
+        self.line = getattr(tree, "line", 0) or self.line
+        rebuild(tree, self.visit)
+        return self.inline(tree) if isinstance(tree, FuncCall) else tree
+
+    def substitute(self, arg, reads, later, calls):
+        """Whether `arg` can stand for its parameter, read by the nodes `reads` of the
+        body; `later` are the arguments after it, `calls` whether the body makes calls."""
+        if not all(pure(other) for other in later):
+            return False
+        if calls and any((self.chain[-1 - node.depth], node.slot) in self.by_functions
+                         for node in nodes(arg) if isinstance(node, Variable)):
+            return False
+        if isinstance(arg, Variable):
+            return True
+        plain = all(isinstance(read, Variable) for read in reads)
+        return plain and (is_literal(arg) or len(reads) <= 1 and pure(arg))
+
+    def inline(self, call):
+        """The body of the function `call` calls, in its place, or `call` itself."""
+        funcDef = self.functions.get((self.chain[-1 - call.depth], call.slot))
+        if (funcDef is None or funcDef in self.inlining or len(self.inlining) >= self.depth
+                or len(call.funcArgs) != len(funcDef.funcParams)):
+            return call
+        body = list(nodes(funcDef.funcBody))
+        written = {node.slot for node in body if isinstance(node, WRITES)}
+        calls = any(isinstance(node, FuncCall) for node in body)
+        frame = self.owners[id(self.body)]
+        slots, substitutes, binds = {}, {}, []
+        for i, (param, arg) in enumerate(zip(funcDef.funcParams, call.funcArgs), 1):
+            reads = [node for node in body if isinstance(node, Named) and not node.depth and node.slot == i]
+            if i not in written and self.substitute(arg, reads, call.funcArgs[i:], calls):
+                substitutes[i] = arg
+                continue
+            bind = VarBind(param, None, arg, SymbolCategory.VARIABLE)
+            bind.slot = slots[i] = new_slot(frame)
+            binds.append(bind)
+        for slot in range(len(funcDef.funcParams) + 1, funcDef.frame_size):
+            slots[slot] = new_slot(frame)
+
+        def rename(node):
+            if node.depth:
+                node.depth += call.depth - 1
+            elif node.slot in substitutes:
+                arg = substitutes[node.slot]
+                if not isinstance(node, Variable):  # an array or hash read of a variable argument
+                    node.depth, node.slot = arg.depth, arg.slot
+                    return node
+                return clone(arg, lambda named: named)
+            else:
+                node.slot = slots[node.slot]
+            return node
+
+        self.count += 1
+        self.report.append((where(self.owners, self.body), self.line, f"inlined call to {funcDef.funcName}"))
+        copied = clone(funcDef.funcBody, rename)
+        self.inlining.append(funcDef)
+        self.visit(copied)
+        self.inlining.pop()
+        statements = binds + copied.statements
+        return statements[0] if len(statements) == 1 else Statements(statements)
+
+
+def inline_calls(lines, report, size, depth):
+    inliner = Inliner(lines, report, size, depth)
+    for frame in frames(lines, lines.hoisted):
+        inliner.frame(*frame)
+    return inliner.count > 0
+
+
+# ===== PURITY =====
+# The results of an fnmemo function are looked up by its arguments (runtime.Memo), so the
+# resolver only accepts one whose calls compute a value from the arguments and do nothing
+# else: no printing or input, no change to an array or hash, no function defined, no read
+# or write of a variable outside its frame, and only calls to functions that are pure in
+# turn, by names that always hold them. Reading a variable of an enclosing frame is out
+# as well, since it may change between two calls with the same arguments.
+
+IMPURE = {Display: "prints", DisplayL: "prints", Feed: "reads input", FuncDef: "defines a function"}
+MUTATIONS = (PushFront, PushBack, PopFront, PopBack, AssigntoArr, AssignFullArray, InsertAt, RemoveAt,
+             ClearArray, AddHashPair, RemoveHashPair, AssignHashVal)
+
+
+def impurity(body, chain, functions):
+    """(Why running `body`, the body of a function, does more than compute a value from
+    its parameters, or None; the FuncDefs it calls)."""
+    called = []
+    for node in nodes(body):
+        if type(node) in IMPURE:
+            return f"it {IMPURE[type(node)]}", called
+        if isinstance(node, MUTATIONS):
+            return "it changes an array or hash", called
+        if isinstance(node, FuncCall):
+            funcDef = functions.get((chain[-1 - node.depth], node.slot))
+            if funcDef is None:
+                return f"it calls {node.funcName}, which may hold any function", called
+            called.append(funcDef)
+        elif isinstance(node, Named) and node.depth:
+            name = getattr(node, fields(node)[0].name)
+            return f"it {'assigns' if isinstance(node, WRITES) else 'reads'} {name}, outside its frame", called
+    return None, called
+
+
+def impurities(lines):
+    """id(body) -> why calling the function with that body may do more than compute a
+    value from its arguments, or None when it is pure."""
+    functions = known_functions(lines)
+    reasons, calls = {}, {}
+    for body, chain, _ in frames(lines, lines.hoisted):
+        if body is not lines:
+            reasons[id(body)], calls[id(body)] = impurity(body, chain, functions)
+    changed = True
+    while changed:  # a function calling an impure one is impure, recursion or not
+        changed = False
+        for body, called in calls.items():
+            for funcDef in called:
+                if reasons[body] is None and reasons[id(funcDef.funcBody)] is not None:
+                    reasons[body] = f"it calls {funcDef.funcName}, which is not pure"
+                    changed = True
+    return reasons
+
+
+# ===== CONTROL FLOW =====
+# A loop checks the value of each body statement, and of each statement of the blocks
+# and if branches those are made of, for breakout and moveon. Only statements whose value
+# can be one of the two need the check.
+
+def may_signal(tree) -> bool:
+    """Whether `tree`, in a loop body, can break out or move on: evaluate to BreakOut or
+    MoveOn, or be a block with a statement that does."""
+    match tree:
+        case BreakOut() | MoveOn():
+            return True
+        case Variable() | FuncCall() | CallArr() | CallHashVal() | PopFront() | PopBack() | RemoveAt():
+            return True
+        case BinOp("and" | "or", l, r):
+            return may_signal(l) or may_signal(r)
+        case If(_, then_body, else_body, _):
+            return may_signal(then_body) or may_signal(else_body)
+        case Statements(statements):
+            return any(may_signal(stmt) for stmt in statements)
+        case VarBind(_, _, value, _) | AssignToVar(_, value) | AssigntoArr(_, _, value) \
+                | AssignHashVal(_, _, value):
+            return may_signal(value)
+        case _:
+            return False
+
+
+# ===== DRIVER =====
+
+def fold_functions(hoisted):
+    """Fold the body of every function: each one is hoisted into some frame."""
+    for funcDef in hoisted:
+        fold(funcDef.funcBody)
+        fold_functions(funcDef.hoisted)
+
+
+def optimize(program, report=None, inline_size=None, inline_depth=None):
+    """
+    Rewrite a resolved program (Statements, global scope) in place and return it. Each
+    inlined call and each operation moved out of a loop is appended to `report` as
+    (function, line, what was done); see explain(). The inlining thresholds default to
+    INLINE_SIZE and INLINE_DEPTH.
+    """
+    lines, _ = program
+    report = [] if report is None else report
+    for typed in (False, True):  # folding first gives inference more literals to go on
+        if typed:
+            infer(lines)
+        fold(lines)
+        fold_functions(lines.hoisted)
+    if inline_calls(lines, report, INLINE_SIZE if inline_size is None else inline_size,
+                    INLINE_DEPTH if inline_depth is None else inline_depth):
+        infer(lines)  # the temporaries of the arguments, and literals in place of parameters
+        fold(lines)
+        fold_functions(lines.hoisted)
+    move_invariants(lines, report)
+    return program
+
+
+def explain(report):
+    """The text `nexus --explain-opt` prints for an optimize() report."""
+    if not report:
+        return "No calls inlined and no loop-invariant operations."
+    return "\n".join(f"{where}:{line}: {what}" for where, line, what in report)
@@ -16,7 +16,7 @@ class AST:
     It serves as a base class for all nodes in the AST.
     """
 
-    pass
+    line = 0  # set by the buffered parser on statements: their first source line
 
 class ABT: #unused for the time being
     """
@@ -28,16 +28,28 @@ class ABT: #unused for the time being
     """
     pass
 
+class Named(AST):
+    """
+    Base for nodes that refer to a variable or function by name.
+
+    The resolver sets `depth` (static links to follow from the current frame) and
+    `slot` (index in that frame). They are plain attributes, not dataclass fields,
+    so node equality and repr ignore them.
+    """
+    depth = 0
+    slot = None
+
 @dataclass
-class VarBind(AST): # for variable binding
+class VarBind(Named): # for variable binding
     var_name: str
     dtype: Optional[str]
     val: AST
     category : SymbolCategory
 
 @dataclass
-class Variable(AST):
+class Variable(Named):
     var_name: str
+    type = None  # set by the optimizer: the type of every value read here, if known
 
 @dataclass
 class BinOp(AST):
@@ -51,30 +63,30 @@ class UnaryOp(AST):
     val: AST
 
 @dataclass
-class CallArr(AST):
+class CallArr(Named):
     xname: str
     index: AST
 
 @dataclass
-class PushFront(AST):
+class PushFront(Named):
     xname: str
     val: AST
 
 @dataclass
-class PushBack(AST):
+class PushBack(Named):
     xname: str
     val: AST
 
 @dataclass
-class PopFront(AST):
+class PopFront(Named):
     xname: str
 
 @dataclass
-class PopBack(AST):
+class PopBack(Named):
     xname: str
 
 @dataclass
-class AssigntoArr(AST):
+class AssigntoArr(Named):
     xname: str
     index: AST
     val: AST
@@ -87,23 +99,23 @@ class Hash(AST):
     val: List[Tuple[AST]]
 
 @dataclass
-class CallHashVal(AST):
+class CallHashVal(Named):
     name: str
     key : AST
 
 @dataclass 
-class AddHashPair(AST):
+class AddHashPair(Named):
     name: str
     key: AST
     val: AST
 
 @dataclass
-class RemoveHashPair(AST):
+class RemoveHashPair(Named):
     name: str
     key : AST
 
 @dataclass
-class AssignHashVal(AST):
+class AssignHashVal(Named):
     name: str
     key : AST
     new_val: AST
@@ -114,27 +126,27 @@ class AssignFullArray(AST):
     val: List[AST]
 
 @dataclass
-class InsertAt(AST):
+class InsertAt(Named):
     xname: str
     index: AST
     val: AST
 
 @dataclass
-class RemoveAt(AST):
+class RemoveAt(Named):
     xname: str
     index: AST
 
 @dataclass
-class GetLength(AST):
+class GetLength(Named):
     xname: str
 
 @dataclass
-class ClearArray(AST):
+class ClearArray(Named):
     xname: str
 
 @dataclass
 class Number(AST):
-    val: str
+    val: int | float
 
 @dataclass
 class String(AST):
@@ -157,7 +169,7 @@ class Break(AST):
     pass
 
 @dataclass
-class CompoundAssignment(AST):
+class CompoundAssignment(Named):
     var_name: str
     op: str
     val: AST
@@ -167,6 +179,7 @@ class WhileLoop(AST):
     condition: AST 
     body: AST
     whileScope: Any
+    signals = True              # set by the resolver: whether the body may break out or move on
 
 @dataclass
 class Feed(AST):
@@ -178,6 +191,7 @@ class ForLoop(AST):
     increment: AST
     body: AST
     forScope: Any
+    signals = True              # set by the resolver: whether the body may break out or move on
 
 @dataclass
 class BreakOut(AST):
@@ -188,7 +202,7 @@ class MoveOn(AST):
     pass
 
 @dataclass
-class AssignToVar(AST): # through assignment operator
+class AssignToVar(Named): # through assignment operator
     var_name: str
     val: AST
 
@@ -202,19 +216,29 @@ class If(AST):
 @dataclass
 class Statements:
     statements: List[AST]
+    signals = False             # set by the resolver: a block in a loop body that may break out
+                                # or move on before its last statement
 
 @dataclass
-class FuncDef(AST):
+class FuncDef(Named):
     funcName: str
     funcParams: List[Variable]  # list of variables
     funcBody: List[AST]         # assumed body is one-liner expression # will use {} for multiline
     funcScope: Any              # static scoping (scope is tied to function definition and not its call)
     isRec: bool                 # recursive or not
+    isMemo: bool = False        # declared with fnmemo: results looked up by arguments
+    frame_size = 0              # set by the resolver: slots in one activation frame
+    hoisted = ()                # set by the resolver: FuncDefs whose names live in that frame
+    compiled = None             # set by the closure compiler: the body as one closure
+    bytecode = None             # set by codegen: the body's code object
+    registers = None            # set by register_codegen: the body's register code
+    memo = None                 # set by the resolver: the MemoStats of an fnmemo function
 
 @dataclass 
-class FuncCall(AST):
+class FuncCall(Named):
     funcName: str               # function name as a string
     funcArgs: List[AST]         # takes a list of expressions
+    tail = False                # set by the resolver: an fnrec function calling itself last
     
 # ==========================================================================================
 
@@ -228,20 +252,110 @@ def map_type(value):
     else:
         return SymbolCategory.VARIABLE
 #==========================================================================================
-def parse(s: str) -> List[AST]:
+# Binding levels for the Pratt parser (`parse(..., pratt=True)`), one per rung of the
+# descent chain parse_if -> parse_logic -> ... -> call_vartoks, lowest binding first.
+(IF_LEVEL, LOGIC_LEVEL, BITWISE_LEVEL, CMP_LEVEL, SHIFT_LEVEL, ADD_LEVEL, SUB_LEVEL, MUL_LEVEL,
+ MOD_LEVEL, DIV_SLASH_LEVEL, DIV_DOT_LEVEL, EXP_LEVEL, ASCII_CHAR_LEVEL, ARRAY_DICT_LEVEL,
+ INPUT_LEVEL, STRING_LEVEL, FUNC_LEVEL, BRACKETS_LEVEL, VARTOK_LEVEL) = range(19)
+
+# left-associative binary operators: the right operand is parsed one level up
+binary_levels = {
+    "and": LOGIC_LEVEL, "or": LOGIC_LEVEL,
+    "&": BITWISE_LEVEL, "|": BITWISE_LEVEL, "^": BITWISE_LEVEL,
+    "<": CMP_LEVEL, ">": CMP_LEVEL, "==": CMP_LEVEL, "!=": CMP_LEVEL, "<=": CMP_LEVEL, ">=": CMP_LEVEL,
+    "<<": SHIFT_LEVEL, ">>": SHIFT_LEVEL,
+    "+": ADD_LEVEL,
+    "-": SUB_LEVEL,
+    "*": MUL_LEVEL,
+    "%": MOD_LEVEL,
+    "/": DIV_SLASH_LEVEL,
+    "÷": DIV_DOT_LEVEL,
+}
+
+# every token the expression loop reacts to, with the level whose loop handles it
+led_levels = binary_levels | {
+    "not": LOGIC_LEVEL, "~": BITWISE_LEVEL,
+    "**": EXP_LEVEL,
+    "char": ASCII_CHAR_LEVEL, "ascii": ASCII_CHAR_LEVEL,
+    "[": ARRAY_DICT_LEVEL, "{": ARRAY_DICT_LEVEL,
+    "feed": INPUT_LEVEL,
+    "fn": FUNC_LEVEL, "fnrec": FUNC_LEVEL, "fnmemo": FUNC_LEVEL, "(": FUNC_LEVEL,
+    "<name>": VARTOK_LEVEL,
+}
+led_punct = {LeftSquareToken: "[", LeftBraceToken: "{", LeftParenToken: "(", VarToken: "<name>"}
+
+def led_key(tok):
+    """Key of `tok` in `led_levels`: operator or keyword text, or a name from `led_punct`."""
+    cls = type(tok)
+    if cls is OperatorToken:
+        return tok.o
+    if cls is KeywordToken:
+        return tok.kw_name
+    return led_punct.get(cls)
+
+def nud_key(tok):
+    """What the Pratt parser starts an operand with: "if", "<string>", "True", "False", "("
+    or None for everything parse_atom handles."""
+    cls = type(tok)
+    if cls is KeywordToken and tok.kw_name == "if":
+        return "if"
+    if cls is StringToken:
+        return "<string>"
+    if cls is BooleanToken:
+        return tok.val
+    if cls is LeftParenToken:
+        return "("
+    return None
+
+def stmt_key(tok):
+    """What the statement parsers tell `tok` apart by: keyword text, ";", "}", "<op>" for
+    any operator, "<end>" past the last token, or None."""
+    cls = type(tok)
+    if cls is KeywordToken:
+        return tok.kw_name
+    if cls is OperatorToken:
+        return "<op>"
+    if cls is SemicolonToken:
+        return ";"
+    if cls is RightBraceToken:
+        return "}"
+    return "<end>" if tok is None else None
+
+# led_key, nud_key and stmt_key by token kind, for parsing straight from a TokenBuffer
+led_kinds = [led_key(tok) for tok in KIND_TOKENS] + [None]  # the last is END_KIND
+led_kinds[VAR_KIND] = "<name>"
+nud_kinds = [nud_key(tok) for tok in KIND_TOKENS] + [None]
+nud_kinds[STRING_KIND] = "<string>"
+nud_kinds[NUMBER_KIND] = "<number>"  # what parse_atom would read, taken inline
+nud_kinds[VAR_KIND] = "<name>"
+stmt_kinds = [stmt_key(tok) if tok is not None else None for tok in KIND_TOKENS] + ["<end>"]
 
-    t = peekable(lex(s))
+#==========================================================================================
+def parse(s: str, buffered: bool = False, pratt: bool = False) -> List[AST]:
+    """Parse Nexus source into (Statements, global scope).
+
+    With `buffered=True` the source is lexed into a compact `TokenBuffer` first and
+    the parser walks it with a `TokenCursor` instead of `peekable(lex(s))`.
+    Statements and operators are then told apart by the token kinds in the buffer
+    (`stmt_kinds`, `led_kinds`, `nud_kinds`) and names, numbers and strings are read as
+    source slices, so no Token is built for them.
+    With `pratt=True` expressions go through the table-driven `parse_expr` instead of
+    the parse_if -> ... -> call_vartoks chain; both build the same AST.
+    """
+
+    t = TokenCursor(lex_buffer(s)) if buffered else peekable(lex(s))
+    advance = t.advance if buffered else t.__next__  # past the current token
 
     def expect(what: Token):
         if t.peek(None) == what:
-            next(t)
+            advance()
             return
         raise SyntaxError(f"Expected {what} got {t.peek(None)}")
     
     def expect_any(expected_tokens: list[Token]):
         next_token = t.peek(None)  
         if next_token.o in expected_tokens:
-            next(t)  
+            advance()  
             return
         raise SyntaxError(f"Expected one of {expected_tokens}, but got {next_token}")
 
@@ -251,17 +365,21 @@ def parse(s: str) -> List[AST]:
             thisScope = SymbolTable() # forms the global scope
 
         statements = []
-        while t.peek(None) is not None:
-            if isinstance(t.peek(None), RightBraceToken):    # function body parsing done
+        while True:
+            key = stmt_kinds[t.kind] if buffered else stmt_key(t.peek(None))
+            if key == "<end>" or key == "}":    # "}": function body parsing done
                 break
-            match t.peek(None):
-                case KeywordToken("while"):
+            line = t.line() if buffered else 0
+            match key:
+                case "while":
                     stmt, thisScope = parse_while(thisScope)
-                case KeywordToken("for"):
+                case "for":
                     stmt, thisScope = parse_for(thisScope)
                 case _:
                     stmt, thisScope = parse_display(thisScope)
 
+            if line and isinstance(stmt, AST):
+                stmt.line = line
             statements.append(stmt)                         # collection of parsed statements
 
         return Statements(statements), thisScope          # Return a list of parsed statements + scope
@@ -275,7 +393,7 @@ def parse(s: str) -> List[AST]:
         """
         match t.peek(None):
             case KeywordToken("while"):
-                next(t)
+                advance()
                 expect(LeftParenToken()) 
                 tS_while = SymbolTable(tS)
                 condition = parse_var(tS_while)[0]
@@ -294,7 +412,7 @@ def parse(s: str) -> List[AST]:
         """
         match t.peek(None):
             case KeywordToken("for"):
-                next(t)
+                advance()
                 expect(LeftParenToken())
                 tS_for = SymbolTable(tS) # new scope for tS
                 initialization, tS_for = parse_var(tS_for)
@@ -314,15 +432,15 @@ def parse(s: str) -> List[AST]:
     def parse_display(tS):  # display value/output
         (ast, tS) = parse_var(tS)
         while True:
-            match t.peek(None):
-                case KeywordToken("display"):
-                    next(t)
+            match stmt_kinds[t.kind] if buffered else stmt_key(t.peek(None)):
+                case "display":
+                    advance()
                     ast = Display(parse_var(tS)[0])
-                case KeywordToken("displayl"):
-                    next(t)
+                case "displayl":
+                    advance()
                     ast = DisplayL(parse_var(tS)[0])
-                case SemicolonToken():
-                    next(t)
+                case ";":
+                    advance()
                     return ast, tS
                 case _:
                     return ast, tS
@@ -333,13 +451,13 @@ def parse(s: str) -> List[AST]:
             dtype = None
             if isinstance(t.peek(None), TypeToken):
                 dtype = t.peek(None).type_name
-                next(t)
+                advance()
             if isinstance(t.peek(None), VarToken):
                 name = t.peek(None).var_name
                 if tS.inScope(name):
                     print(f"Error! Variable `{name}` is already declared. Can't declare again.")
                     exit()
-                next(t)
+                advance()
                 return dtype, name
             else:
                 print("Syntax Error! Expected a variable name.")
@@ -357,9 +475,9 @@ def parse(s: str) -> List[AST]:
 
         ast = parse_update_var(tS)
         while True:
-            match t.peek(None):
-                case KeywordToken("var"):
-                    next(t)
+            match stmt_kinds[t.kind] if buffered else stmt_key(t.peek(None)):
+                case "var":
+                    advance()
                     dtype, name = parse_dtype_and_name()
                     value = parse_value()
                     category=map_type(value)
@@ -370,12 +488,13 @@ def parse(s: str) -> List[AST]:
 
                 
     def parse_update_var(tS): # for updating var
-        ast = parse_if(tS)
+        ast = parse_expr(tS) if pratt else parse_if(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken(op):
+            match stmt_kinds[t.kind] if buffered else stmt_key(t.peek(None)):
+                case "<op>":
+                    op = t.peek(None).o
                     var_name = ast.var_name
-                    next(t)
+                    advance()
                     value = parse_var(tS)[0]
                     ast = CompoundAssignment(var_name,op,value) if op in compound_assigners else AssignToVar(var_name, value)
                 case _:
@@ -396,13 +515,13 @@ def parse(s: str) -> List[AST]:
     def parse_if(tS):
         match t.peek(None):
             case KeywordToken("if"):
-                next(t)
+                advance()
                 tS_cond = SymbolTable(tS)
                 cond = parse_var(tS_cond)[0]
                 expect(KeywordToken("then"))
                 
                 if isinstance(t.peek(None), LeftBraceToken):
-                    next(t)  
+                    advance()  
                     then_body, tS_cond = parse_program(tS_cond)
                     expect(RightBraceToken()) 
                 else:
@@ -412,9 +531,9 @@ def parse(s: str) -> List[AST]:
                 if not (isinstance(t.peek(None), KeywordToken) and t.peek(None).kw_name == "else"):
                     else_body = None
                 else:
-                    next(t)  
+                    advance()  
                     if isinstance(t.peek(None), LeftBraceToken):
-                        next(t)  
+                        advance()  
                         else_body, tS_cond = parse_program(tS_cond)
                         expect(RightBraceToken())
                     else:
@@ -430,15 +549,15 @@ def parse(s: str) -> List[AST]:
     def parse_logic(tS):
         ast = parse_bitwise(tS)
         while True:
-            match t.peek(None):
-                case KeywordToken("and"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "and":
+                    advance()
                     ast = BinOp("and", ast, parse_bitwise(tS))
-                case KeywordToken("or"):
-                    next(t)
+                case "or":
+                    advance()
                     ast = BinOp("or", ast, parse_bitwise(tS))
-                case KeywordToken("not"):
-                    next(t)
+                case "not":
+                    advance()
                     ast = UnaryOp("not", parse_bitwise(tS))
                 case _:
                     return ast
@@ -446,18 +565,18 @@ def parse(s: str) -> List[AST]:
     def parse_bitwise(tS):
         ast = parse_cmp(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("&"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "&":
+                    advance()
                     ast = BinOp("&", ast, parse_cmp(tS))
-                case OperatorToken("|"):
-                    next(t)
+                case "|":
+                    advance()
                     ast = BinOp("|", ast, parse_cmp(tS))
-                case OperatorToken("^"):
-                    next(t)
+                case "^":
+                    advance()
                     ast = BinOp("^", ast, parse_cmp(tS))
-                case OperatorToken("~"):
-                    next(t)
+                case "~":
+                    advance()
                     ast = UnaryOp("~", parse_cmp(tS))
                 case _:
                     return ast
@@ -465,24 +584,24 @@ def parse(s: str) -> List[AST]:
     def parse_cmp(tS):
         ast = parse_shift(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("<"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "<":
+                    advance()
                     ast = BinOp("<", ast, parse_shift(tS))
-                case OperatorToken(">"):
-                    next(t)
+                case ">":
+                    advance()
                     ast = BinOp(">", ast, parse_shift(tS))
-                case OperatorToken("=="):
-                    next(t)
+                case "==":
+                    advance()
                     ast = BinOp("==", ast, parse_shift(tS))
-                case OperatorToken("!="):
-                    next(t)
+                case "!=":
+                    advance()
                     ast = BinOp("!=", ast, parse_shift(tS))
-                case OperatorToken("<="):
-                    next(t)
+                case "<=":
+                    advance()
                     ast = BinOp("<=", ast, parse_shift(tS))
-                case OperatorToken(">="):
-                    next(t)
+                case ">=":
+                    advance()
                     ast = BinOp(">=", ast, parse_shift(tS))
                 case _:
                     return ast
@@ -490,12 +609,12 @@ def parse(s: str) -> List[AST]:
     def parse_shift(tS):
         ast = parse_add(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("<<"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "<<":
+                    advance()
                     ast = BinOp("<<", ast, parse_add(tS))
-                case OperatorToken(">>"):
-                    next(t)
+                case ">>":
+                    advance()
                     ast = BinOp(">>", ast, parse_add(tS))
                 case _:
                     return ast
@@ -503,9 +622,9 @@ def parse(s: str) -> List[AST]:
     def parse_add(tS):
         ast = parse_sub(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("+"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "+":
+                    advance()
                     ast = BinOp("+", ast, parse_sub(tS))
                 case _:
                     return ast
@@ -513,9 +632,9 @@ def parse(s: str) -> List[AST]:
     def parse_sub(tS):
         ast = parse_mul(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("-"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "-":
+                    advance()
                     ast = BinOp("-", ast, parse_mul(tS))
                 case _:
                     return ast
@@ -524,18 +643,18 @@ def parse(s: str) -> List[AST]:
     def parse_mul(tS):
         ast = parse_modulo(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("*"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "*":
+                    advance()
                     ast = BinOp("*", ast, parse_modulo(tS))
                 case _:
                     return ast
     def parse_modulo(tS):
         ast =parse_div_slash(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("%"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "%":
+                    advance()
                     ast=BinOp("%",ast,parse_div_slash(tS))
                 case _:
                     return ast
@@ -543,9 +662,9 @@ def parse(s: str) -> List[AST]:
     def parse_div_slash(tS):
         ast = parse_div_dot(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("/"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "/":
+                    advance()
                     ast = BinOp("/", ast, parse_div_dot(tS))
                 case _:
                     return ast
@@ -553,17 +672,17 @@ def parse(s: str) -> List[AST]:
     def parse_div_dot(tS):
         ast = parse_exp(tS)
         while True:
-            match t.peek(None):
-                case OperatorToken("÷"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "÷":
+                    advance()
                     ast = BinOp("÷", ast, parse_exp(tS))
                 case _:
                     return ast
                 
     def parse_exp(tS):
         ast = parse_ascii_char(tS)
-        if isinstance(t.peek(None), OperatorToken) and t.peek(None).o == "**":
-            next(t)
+        if (led_kinds[t.kind] if buffered else led_key(t.peek(None))) == "**":
+            advance()
             right = parse_exp(tS)
             ast = BinOp("**", ast, right)
         return ast
@@ -572,15 +691,15 @@ def parse(s: str) -> List[AST]:
     def parse_ascii_char(tS):
         ast = parse_array_dict(tS)
         while True:
-            match t.peek(None):
-                case KeywordToken("char"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "char":
+                    advance()
                     expect(LeftParenToken())
                     value = parse_if(tS)    
                     expect(RightParenToken())
                     ast = UnaryOp("char", value)
-                case KeywordToken("ascii"):
-                    next(t)
+                case "ascii":
+                    advance()
                     expect(LeftParenToken())
                     value = parse_if(tS)
                     expect(RightParenToken())
@@ -590,19 +709,19 @@ def parse(s: str) -> List[AST]:
     def parse_array_dict(tS):
         ast=parse_input(tS)
         while True:
-            match t.peek(None):
-                case LeftSquareToken(): # parse list of elements
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "[": # parse list of elements
+                    advance()
                     elements = []
                     while not isinstance(t.peek(None), RightSquareToken):
                         elements.append(parse_input(tS))
                         if isinstance(t.peek(None), CommaToken):
-                            next(t)
+                            advance()
                     expect(RightSquareToken())
 
                     ast = Array(elements)
-                case LeftBraceToken(): # parse list of dictionary
-                    next(t)
+                case "{": # parse list of dictionary
+                    advance()
                     elements= []
                     while not isinstance(t.peek(None), RightBraceToken):
                         key=parse_input(tS)
@@ -610,7 +729,7 @@ def parse(s: str) -> List[AST]:
                         val = parse_input(tS)
                         elements.append((key,val))
                         if isinstance(t.peek(None), CommaToken):
-                            next(t)
+                            advance()
                     expect(RightBraceToken())
 
                     ast=Hash(elements)
@@ -619,9 +738,9 @@ def parse(s: str) -> List[AST]:
     def parse_input(tS):
         ast=parse_string(tS)
         while True:
-            match t.peek(None):
-                case KeywordToken("feed"):
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "feed":
+                    advance()
                     expect(LeftParenToken())
                     msg=parse_string(tS)
                     if (msg is None):
@@ -632,16 +751,15 @@ def parse(s: str) -> List[AST]:
                     return ast
 
     def parse_string(tS): # while True may be included in future
-        match t.peek(None):
-            case StringToken(s):
-                next(t)
-                return String(s)
+        match nud_kinds[t.kind] if buffered else nud_key(t.peek(None)):
+            case "<string>":
+                return String(t.take() if buffered else next(t).val)
             case _:
                 return parse_boolean(tS)
     def parse_boolean(tS):
-        match t.peek(None):
-            case BooleanToken(b):
-                next(t)
+        match nud_kinds[t.kind] if buffered else nud_key(t.peek(None)):
+            case "True" | "False" as b:
+                advance()
                 return Boolean(b=="True")
             case _:
                 return parse_func(tS)
@@ -664,99 +782,101 @@ def parse(s: str) -> List[AST]:
     def parse_func(tS): # Function definition and Function call
         ast = parse_brackets(tS)
         while True:
-            match t.peek(None):
-                case KeywordToken("fn") | KeywordToken("fnrec"): # function declaration
-                    if t.peek(None).kw_name == "fnrec":
-                        isRec = True
-                    else:
-                        isRec = False
-
-                    next(t)
-                    
-                    if isinstance(t.peek(None), VarToken):
-                        funcName = t.peek(None).var_name
-                        next(t)
-                    else:
-                        print("Function name missing\nAborting")
-                        exit()
-
-                    if tS.inScope(funcName):
-                        print(f"Error! Multiple declaration of function `{funcName}()` in the same scope (not allowed)")
-                        exit()
-
-                    expect(LeftParenToken())
-
-                    # parse parameters
-                    params = []
-                    while isinstance(t.peek(None), VarToken):
-                        params.append(t.peek(None).var_name)
-                        next(t)
-                        if isinstance(t.peek(None), CommaToken):
-                            next(t) 
-                        else:
-                            expect(RightParenToken()) # parameter list end
-                            break    
-                    
-                    if len(params)==0:
-                        expect(RightParenToken()) # no parameters in the function declaration
-
-                    tS_f = SymbolTable(tS) # Function Scope (with tS as parent scope)
-
-                    # add param names to function scope
-                    for var_name in params:
-                        # tS_f.table[var_name] = None
-                        tS_f.define(var_name,None,SymbolCategory.VARIABLE)
-                    
-                    expect(LeftBraceToken()) # {
-                    # function body begins
-                    
-                    # body = parse_var()
-                    # bodyCode = []
-                    # while not isinstance(t.peek(None), RightBraceToken):
-                    #     stmt = parse_display()      # Parse current statement
-                    #     bodyCode.append(stmt)       # collection of parsed statements
-                    # body = Statements(bodyCode)     # list of parsed statements
-                    tS.define(funcName,None,SymbolCategory.FUNCTION)
-                    (body, tS_f) = parse_program(tS_f) # get updated tS_f
-                    next(t)
-                    ast = FuncDef(funcName, params, body, tS_f, isRec)
-                    # tS.table[funcName] = (params, body, tS_f, isRec)
-                    tS.define(funcName,(params,body,tS_f,isRec),SymbolCategory.FUNCTION)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "fn" | "fnrec" | "fnmemo": # function declaration
+                    ast = parse_func_def(tS)
                 
                 # Function call
-                case LeftParenToken(): # denotes the identifier is not a variable but a function call
-                    # extract arguments
-                    funcName = ast.var_name
-                    funcArgs = []
-                    next(t)
-                    while True: 
-                        match t.peek(None):
-                            case CommaToken():
-                                next(t)
-                            case RightParenToken():
-                                # function call ends
-                                ast = FuncCall(funcName, funcArgs)
-                                next(t)
-                                return ast
-                            case _:
-                                # expect expression
-                                expr = parse_var(tS)[0]
-                                funcArgs.append(expr)
+                case "(": # denotes the identifier is not a variable but a function call
+                    return parse_func_call(tS, ast.var_name)
                 
                 case _:
                     return ast
                 # parse_func() ends here
+
+    def parse_func_def(tS): # current token is `fn`, `fnrec` or `fnmemo`
+        isRec = t.peek(None).kw_name == "fnrec"
+        isMemo = t.peek(None).kw_name == "fnmemo"
+
+        advance()
+        
+        if isinstance(t.peek(None), VarToken):
+            funcName = t.peek(None).var_name
+            advance()
+        else:
+            print("Function name missing\nAborting")
+            exit()
+
+        if tS.inScope(funcName):
+            print(f"Error! Multiple declaration of function `{funcName}()` in the same scope (not allowed)")
+            exit()
+
+        expect(LeftParenToken())
+
+        # parse parameters
+        params = []
+        while isinstance(t.peek(None), VarToken):
+            params.append(t.peek(None).var_name)
+            advance()
+            if isinstance(t.peek(None), CommaToken):
+                advance() 
+            else:
+                expect(RightParenToken()) # parameter list end
+                break    
+        
+        if len(params)==0:
+            expect(RightParenToken()) # no parameters in the function declaration
+
+        tS_f = SymbolTable(tS) # Function Scope (with tS as parent scope)
+
+        # add param names to function scope
+        for var_name in params:
+            # tS_f.table[var_name] = None
+            tS_f.define(var_name,None,SymbolCategory.VARIABLE)
+        
+        expect(LeftBraceToken()) # {
+        # function body begins
+        
+        # body = parse_var()
+        # bodyCode = []
+        # while not isinstance(t.peek(None), RightBraceToken):
+        #     stmt = parse_display()      # Parse current statement
+        #     bodyCode.append(stmt)       # collection of parsed statements
+        # body = Statements(bodyCode)     # list of parsed statements
+        tS.define(funcName,None,SymbolCategory.FUNCTION)
+        (body, tS_f) = parse_program(tS_f) # get updated tS_f
+        advance()
+        # tS.table[funcName] = (params, body, tS_f, isRec, isMemo)
+        tS.define(funcName,(params,body,tS_f,isRec,isMemo),SymbolCategory.FUNCTION)
+        return FuncDef(funcName, params, body, tS_f, isRec, isMemo)
+
+    def parse_func_call(tS, funcName): # current token is the `(` after the function name
+        # extract arguments
+        funcArgs = []
+        advance()
+        while True: 
+            match t.peek(None):
+                case CommaToken():
+                    advance()
+                case RightParenToken():
+                    # function call ends
+                    advance()
+                    return FuncCall(funcName, funcArgs)
+                case _:
+                    # expect expression
+                    expr = parse_var(tS)[0]
+                    funcArgs.append(expr)
    
 
     def parse_brackets(tS):
         while True:
-            match t.peek(None):
-                case LeftParenToken():
-                    next(t)
+            match led_kinds[t.kind] if buffered else led_key(t.peek(None)):
+                case "(":
+                    advance()
                     (ast, tS) = parse_display(tS)
                     match t.peek(None):
                         case RightParenToken():
-                            next(t)
+                            advance()
                             return ast
                         case _:
                             raise SyntaxError(f"Expected ')' got {t.peek(None)}")
@@ -765,121 +885,232 @@ def parse(s: str) -> List[AST]:
     def call_vartoks(tS): #handles all calls related to vartokens
         ast =parse_atom(tS)
         while True:
-            match t.peek(None):
-                case VarToken(v):
-                    next(t)
-                    category = tS.lookup(v,cat=True)
-                    match category:
-                        case SymbolCategory.VARIABLE:
-                            ast=Variable(v)
-                        case SymbolCategory.ARRAY:
-                            if isinstance(t.peek(None), LeftSquareToken):
-                                next(t)
-                                index = parse_var(tS)[0]
-                                expect(RightSquareToken())
-                                if (isinstance(t.peek(None),OperatorToken) 
-                                    and t.peek(None).o == "="): # assigning a new value
-                                    next(t)
-                                    value=parse_var(tS)[0]
-                                    ast=AssigntoArr(v,index,value)
-                                else: #calling a given index
-                                    ast= CallArr(v, index)
-                            elif (isinstance(t.peek(None),DotToken)):
-                                 next(t)
-                                 match t.peek(None):
-                                    case KeywordToken("PushFront"):
-                                        next(t)
-                                        expect(LeftParenToken())
-                                        val = parse_var(tS)[0]
-                                        expect(RightParenToken())
-                                        ast=PushFront(v,val)
-                                    case KeywordToken("PushBack"):
-                                        next(t)
-                                        expect(LeftParenToken())
-                                        val = parse_var(tS)[0]
-                                        expect(RightParenToken())
-                                        ast=PushBack(v,val)
-                                    case KeywordToken("PopFront"):
-                                        next(t)
-                                        ast=PopFront(v)
-                                    case KeywordToken("PopBack"):
-                                        next(t)
-                                        ast=PopBack(v)
-                                    case KeywordToken("Length"):
-                                        next(t)
-                                        ast=GetLength(v)
-                                    case KeywordToken("Clear"):
-                                        next(t)
-                                        ast=ClearArray(v)
-                                    case KeywordToken("Insert"):
-                                        next(t)
-                                        expect(LeftParenToken())
-                                        index = parse_var(tS)[0]
-                                        expect(CommaToken())
-                                        val = parse_var(tS)[0]
-                                        expect(RightParenToken())
-                                        ast=InsertAt(v,index,val)    
-                                    case KeywordToken("Remove"):
-                                        next(t)
-                                        expect(LeftParenToken())
-                                        index = parse_var(tS)[0]
-                                        expect(RightParenToken())
-                                        ast=RemoveAt(v,index)
-                                    case _:
-                                        return ast
-                            else: #calling whole array
-                                ast = Variable(v)
-                        case SymbolCategory.HASH:
-                            if isinstance(t.peek(None), LeftSquareToken):
-                                next(t)
-                                key = parse_var(tS)[0]
-                                expect(RightSquareToken())
-                                if (isinstance(t.peek(None),OperatorToken) 
-                                    and t.peek(None).o == "="): # assigning a new value
-                                    next(t)
-                                    value=parse_var(tS)[0]
-                                    ast = AssignHashVal(v,key,value)
-                                else:
-                                    ast=CallHashVal(v,key)
-                            elif (isinstance(t.peek(None),DotToken)):
-                                next(t)
-                                match t.peek(None):
-                                    case KeywordToken("Add"):
-                                        next(t)
-                                        expect(LeftParenToken())
-                                        key=parse_var(tS)[0]
-                                        expect(CommaToken())
-                                        val=parse_var(tS)[0]
-                                        expect(RightParenToken())
-                                        ast=AddHashPair(v,key,val)
-                                    case KeywordToken("Remove"):
-                                        next(t)
-                                        expect(LeftParenToken())
-                                        key=parse_var(tS)[0]
-                                        expect(RightParenToken())
-                                        ast = RemoveHashPair(v,key)
-                                    case _:
-                                        return ast
-                            else:
-                                ast = Variable(v)
-                        case _:
-                            ast = Variable(v)
-                case _:
-                    return ast    
+            if buffered:
+                if t.kind != VAR_KIND:
+                    return ast
+                v = t.take()  # the name, without a VarToken
+            else:
+                match t.peek(None):
+                    case VarToken(v):
+                        advance()
+                    case _:
+                        return ast
+            named = parse_name(tS, v)
+            if named is None:
+                return ast
+            ast = named
     
+    def parse_name(tS, v): # what identifier `v` refers to, by its category in scope
+        category = tS.lookup(v,cat=True)
+        match category:
+            case SymbolCategory.VARIABLE:
+                return Variable(v)
+            case SymbolCategory.ARRAY:
+                if isinstance(t.peek(None), LeftSquareToken):
+                    advance()
+                    index = parse_var(tS)[0]
+                    expect(RightSquareToken())
+                    if (isinstance(t.peek(None),OperatorToken) 
+                        and t.peek(None).o == "="): # assigning a new value
+                        advance()
+                        value=parse_var(tS)[0]
+                        return AssigntoArr(v,index,value)
+                    else: #calling a given index
+                        return CallArr(v, index)
+                elif (isinstance(t.peek(None),DotToken)):
+                     advance()
+                     match t.peek(None):
+                        case KeywordToken("PushFront"):
+                            advance()
+                            expect(LeftParenToken())
+                            val = parse_var(tS)[0]
+                            expect(RightParenToken())
+                            return PushFront(v,val)
+                        case KeywordToken("PushBack"):
+                            advance()
+                            expect(LeftParenToken())
+                            val = parse_var(tS)[0]
+                            expect(RightParenToken())
+                            return PushBack(v,val)
+                        case KeywordToken("PopFront"):
+                            advance()
+                            return PopFront(v)
+                        case KeywordToken("PopBack"):
+                            advance()
+                            return PopBack(v)
+                        case KeywordToken("Length"):
+                            advance()
+                            return GetLength(v)
+                        case KeywordToken("Clear"):
+                            advance()
+                            return ClearArray(v)
+                        case KeywordToken("Insert"):
+                            advance()
+                            expect(LeftParenToken())
+                            index = parse_var(tS)[0]
+                            expect(CommaToken())
+                            val = parse_var(tS)[0]
+                            expect(RightParenToken())
+                            return InsertAt(v,index,val)    
+                        case KeywordToken("Remove"):
+                            advance()
+                            expect(LeftParenToken())
+                            index = parse_var(tS)[0]
+                            expect(RightParenToken())
+                            return RemoveAt(v,index)
+                        case _:
+                            return None # unknown method: call_vartoks keeps its previous ast
+                else: #calling whole array
+                    return Variable(v)
+            case SymbolCategory.HASH:
+                if isinstance(t.peek(None), LeftSquareToken):
+                    advance()
+                    key = parse_var(tS)[0]
+                    expect(RightSquareToken())
+                    if (isinstance(t.peek(None),OperatorToken) 
+                        and t.peek(None).o == "="): # assigning a new value
+                        advance()
+                        value=parse_var(tS)[0]
+                        return AssignHashVal(v,key,value)
+                    else:
+                        return CallHashVal(v,key)
+                elif (isinstance(t.peek(None),DotToken)):
+                    advance()
+                    match t.peek(None):
+                        case KeywordToken("Add"):
+                            advance()
+                            expect(LeftParenToken())
+                            key=parse_var(tS)[0]
+                            expect(CommaToken())
+                            val=parse_var(tS)[0]
+                            expect(RightParenToken())
+                            return AddHashPair(v,key,val)
+                        case KeywordToken("Remove"):
+                            advance()
+                            expect(LeftParenToken())
+                            key=parse_var(tS)[0]
+                            expect(RightParenToken())
+                            return RemoveHashPair(v,key)
+                        case _:
+                            return None # unknown method: call_vartoks keeps its previous ast
+                else:
+                    return Variable(v)
+            case _:
+                return Variable(v)
+
+    def parse_expr(tS, level=IF_LEVEL):
+        """
+        Pratt version of the descent chain: `parse_expr(tS, L)` parses what the chain
+        function at level L would. `cur` is the deepest level whose loop would still be
+        running, so a token is handled only if its level lies in [level, cur].
+        """
+        nud = nud_kinds[t.kind] if buffered else nud_key(t.peek(None))
+        if nud == "if":
+            if level != IF_LEVEL:
+                return None # the chain only reaches parse_if from the top
+            return parse_if(tS)
+        if nud == "<string>" and level <= STRING_LEVEL:
+            ast, cur = String(t.take() if buffered else next(t).val), INPUT_LEVEL
+        elif (nud == "True" or nud == "False") and level <= STRING_LEVEL:
+            advance()
+            ast, cur = Boolean(nud=="True"), INPUT_LEVEL
+        elif nud == "(" and level <= BRACKETS_LEVEL:
+            ast, cur = parse_brackets(tS), FUNC_LEVEL
+        elif nud == "<number>":
+            n = t.take()
+            ast, cur = Number(float(n) if '.' in n else int(n)), VARTOK_LEVEL
+        elif nud == "<name>": # read by the loop below
+            ast, cur = None, VARTOK_LEVEL
+        else:
+            ast, cur = parse_atom(tS), VARTOK_LEVEL
+
+        while True:
+            key = led_kinds[t.kind] if buffered else led_key(t.peek(None))
+            op_level = led_levels.get(key)
+            if op_level is None or not level <= op_level <= cur:
+                return ast
+            if key in binary_levels:
+                advance()
+                ast = BinOp(key, ast, parse_expr(tS, op_level + 1))
+                cur = op_level
+                continue
+            match key:
+                case "not":
+                    advance()
+                    ast = UnaryOp("not", parse_expr(tS, BITWISE_LEVEL))
+                case "~":
+                    advance()
+                    ast = UnaryOp("~", parse_expr(tS, CMP_LEVEL))
+                case "**": # right-associative, parse_exp does not loop
+                    advance()
+                    ast = BinOp("**", ast, parse_expr(tS, EXP_LEVEL))
+                    op_level = DIV_DOT_LEVEL
+                case "char" | "ascii":
+                    advance()
+                    expect(LeftParenToken())
+                    value = parse_expr(tS)
+                    expect(RightParenToken())
+                    ast = UnaryOp(key, value)
+                case "[":
+                    advance()
+                    elements = []
+                    while not isinstance(t.peek(None), RightSquareToken):
+                        elements.append(parse_expr(tS, INPUT_LEVEL))
+                        if isinstance(t.peek(None), CommaToken):
+                            advance()
+                    expect(RightSquareToken())
+                    ast = Array(elements)
+                case "{":
+                    advance()
+                    elements = []
+                    while not isinstance(t.peek(None), RightBraceToken):
+                        k = parse_expr(tS, INPUT_LEVEL)
+                        expect(ColonToken())
+                        elements.append((k, parse_expr(tS, INPUT_LEVEL)))
+                        if isinstance(t.peek(None), CommaToken):
+                            advance()
+                    expect(RightBraceToken())
+                    ast = Hash(elements)
+                case "feed":
+                    advance()
+                    expect(LeftParenToken())
+                    msg = parse_expr(tS, STRING_LEVEL)
+                    if msg is None:
+                        msg = String("FEED:")
+                    expect(RightParenToken())
+                    ast = Feed(msg)
+                case "fn" | "fnrec" | "fnmemo":
+                    ast = parse_func_def(tS)
+                case "(": # a call returns out of parse_func
+                    ast = parse_func_call(tS, ast.var_name)
+                    op_level = STRING_LEVEL
+                case "<name>":
+                    named = parse_name(tS, t.take() if buffered else next(t).var_name)
+                    if named is None:
+                        op_level = FUNC_LEVEL
+                    else:
+                        ast = named
+            cur = op_level
+
     def parse_atom(tS): #! while True may be included in future
+        if buffered:
+            if t.kind == NUMBER_KIND:  # the digits, without a NumberToken
+                n = t.take()
+                return Number(float(n) if '.' in n else int(n))
+            if t.kind == VAR_KIND:  # names are for the caller to read
+                return None
         match t.peek(None):
             case NumberToken(n):
-                next(t)
-                return Number(n)
+                advance()
+                return Number(float(n) if '.' in n else int(n))
             case BreakToken():
-                next(t)
+                advance()
                 return Break()
             case BreakOutToken():
-                next(t)
+                advance()
                 return BreakOut()
             case MoveOnToken():
-                next(t)
+                advance()
                 return MoveOn()
 
     return parse_program()
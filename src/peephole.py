@@ -0,0 +1,208 @@
+from array import array
+
+from bytecode_gen import *
+
+# ==========================================================================================
+# ==================================== PEEPHOLE OPTIMIZER ==================================
+# Runs between codegen and the VM and rewrites short instruction sequences of each code
+# object in place:
+#   PUSH_CONST/LOAD/LOAD_OUTER/DUP, POP      -> (nothing)
+#   NOT, JUMP_IF_FALSE t                     -> JUMP_IF_TRUE t (and the other way round)
+#   PUSH_CONST a, PUSH_CONST b, <binary op>  -> PUSH_CONST (a op b)
+#   PUSH_CONST a, <unary op>                 -> PUSH_CONST (op a)
+#   PUSH_CONST c, JUMP_IF_FALSE t            -> JUMP t, or nothing (and JUMP_IF_TRUE)
+#   JUMP t, where t is the next instruction  -> (nothing)
+# drops the instructions no path from the start reaches, and points jumps to jumps at
+# their final target. A sequence is only rewritten when no
+# jump lands inside it. The rewrites repeat until nothing changes, then the jumps and the
+# line table are re-encoded to the new code positions.
+
+FOLDABLE = (int, float, str)  # bool is an int
+FOLD_LIMIT = 256              # largest string or int (in bits) a fold may produce
+
+
+def fold(fn, *values):
+    """(`fn(*values)`,) for constant operands, or None when it is left for run time."""
+    if not all(isinstance(v, FOLDABLE) for v in values):
+        return None
+    try:
+        result = fn(*values)
+    except Exception:  # the error is raised when the code runs, if it ever does
+        return None
+    if isinstance(result, str) and len(result) > FOLD_LIMIT:
+        return None
+    if isinstance(result, int) and result.bit_length() > FOLD_LIMIT:
+        return None
+    return (result,)
+
+
+def decode(code, consts):
+    """[opcode, argument] pairs, with jump targets as instruction indices and the operand
+    tuple of a superinstruction in place of its constant index."""
+    instrs = []
+    for _, op, arg in instructions(code):
+        if op in FUSED:
+            arg = consts[arg]
+            if op in FUSED_JUMPS:
+                arg = (*arg[:-1], arg[-1] // 2)
+        instrs.append([op, arg // 2 if op in JUMPS else arg])
+    return instrs
+
+
+def encode(instrs, const):
+    """The words of `instrs`; `const(value)` pools the operand tuple of a superinstruction."""
+    words = array('i')
+    for op, arg in instrs:
+        if op in FUSED_JUMPS:
+            arg = const((*arg[:-1], arg[-1] * 2))
+        elif op in FUSED:
+            arg = const(arg)
+        words.extend((op, arg * 2 if op in JUMPS else arg))
+    return words
+
+
+def target(instr):
+    """The instruction index `instr` may jump to, or None."""
+    op, arg = instr
+    return arg if op in JUMPS else arg[-1] if op in FUSED_JUMPS else None
+
+
+def retarget(instr, index):
+    instr[1] = index if instr[0] in JUMPS else (*instr[1][:-1], index)
+
+
+class Peephole:
+    def __init__(self, code_object):
+        self.consts = code_object.consts
+        self.const_index = {}
+        for index, value in enumerate(self.consts):
+            if isinstance(value, FOLDABLE):
+                self.const_index.setdefault((type(value), repr(value)), index)
+
+    def const(self, value):
+        key = (type(value), repr(value))
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def thread(self, instrs):
+        """Point every jump that lands on a JUMP at where that JUMP goes."""
+        for instr in instrs:
+            index, seen = target(instr), set()
+            while index is not None and instrs[index][0] == JUMP and index not in seen:
+                seen.add(index)
+                index = instrs[index][1]
+                retarget(instr, index)
+
+    def reachable(self, instrs):
+        """Indices of the instructions some path from the first one reaches."""
+        seen, pending = set(), [0]
+        while pending:
+            i = pending.pop()
+            if i in seen or i >= len(instrs):
+                continue
+            seen.add(i)
+            op, arg = instrs[i]
+            if target(instrs[i]) is not None:
+                pending.append(target(instrs[i]))
+            if op not in (JUMP, RETURN, HALT):
+                pending.append(i + 1)
+        return seen
+
+    def rewrite(self, instrs, i):
+        """(replacement, length) for a sequence starting at `i`, or None."""
+        op, arg = instrs[i]
+        next_op, next_arg = instrs[i + 1] if i + 1 < len(instrs) else (None, None)
+        if op == JUMP and arg == i + 1:
+            return [], 1
+        if op in (PUSH_CONST, LOAD, LOAD_OUTER, DUP) and next_op == POP:
+            return [], 2
+        if op == NOT and next_op in (JUMP_IF_FALSE, JUMP_IF_TRUE):
+            return [[JUMP_IF_TRUE if next_op == JUMP_IF_FALSE else JUMP_IF_FALSE, next_arg]], 2
+        if op != PUSH_CONST:
+            return None
+        value = self.consts[arg]
+        if next_op in (JUMP_IF_FALSE, JUMP_IF_TRUE) and isinstance(value, FOLDABLE + (type(None),)):
+            return ([[JUMP, next_arg]] if bool(value) == (next_op == JUMP_IF_TRUE) else []), 2
+        if next_op in UNARY_FUNCTIONS:
+            folded = fold(UNARY_FUNCTIONS[next_op], value)
+            if folded:
+                return [[PUSH_CONST, self.const(folded[0])]], 2
+        if next_op == PUSH_CONST and i + 2 < len(instrs) and instrs[i + 2][0] in BINARY_FUNCTIONS:
+            folded = fold(BINARY_FUNCTIONS[instrs[i + 2][0]], value, self.consts[next_arg])
+            if folded:
+                return [[PUSH_CONST, self.const(folded[0])]], 3
+        return None
+
+    def run(self, instrs):
+        """One round of rewrites; returns the new instructions."""
+        self.thread(instrs)
+        targets = {target(instr) for instr in instrs}
+        live = self.reachable(instrs)
+        out, new_index = [], []
+        i = 0
+        while i < len(instrs):
+            found = self.rewrite(instrs, i)
+            if i not in live:
+                replacement, length = [], 1
+            elif found and not any(j in targets for j in range(i + 1, i + found[1])):
+                replacement, length = found
+            else:
+                replacement, length = [instrs[i]], 1
+            new_index.extend([len(out)] * length)  # a jump into a removed sequence goes on after it
+            out.extend(list(instr) for instr in replacement)
+            i += length
+        new_index.append(len(out))
+        self.new_index = new_index
+        for instr in out:
+            if target(instr) is not None:
+                retarget(instr, new_index[target(instr)])
+        return out
+
+
+def optimize(code_object, rewriter=Peephole):
+    """Rewrite `code_object` in place; returns how many instructions were removed."""
+    instrs = decode(code_object.code, code_object.consts)
+    lines = {ip // 2: line for ip, line in code_object.lines}
+    before = len(instrs)
+    peephole = rewriter(code_object)
+    while True:
+        optimized = peephole.run([list(instr) for instr in instrs])
+        if optimized == instrs:
+            break
+        lines = {peephole.new_index[i]: line for i, line in sorted(lines.items())}  # a later line wins
+        instrs = optimized
+    code_object.code = encode(instrs, peephole.const)
+    code_object.lines = [(i * 2, line) for i, line in sorted(lines.items()) if i < len(instrs)]
+    return before - len(instrs)
+
+
+def code_objects(program, top):
+    """The code object of the top level and those of every function of the program."""
+    lines, _ = program
+    found = {id(top): top}
+    funcDefs = [*lines.hoisted, *(const for const in top.consts if isinstance(const, FuncDef))]
+    while funcDefs:
+        funcDef = funcDefs.pop()
+        code_object = funcDef.bytecode
+        if code_object is None or id(code_object) in found:
+            continue
+        found[id(code_object)] = code_object
+        funcDefs.extend(funcDef.hoisted)
+        funcDefs.extend(const for const in code_object.consts if isinstance(const, FuncDef))
+    return list(found.values())
+
+
+def optimize_program(program, top):
+    """Optimize every code object codegen made for `program`; returns [(name, removed)]."""
+    return [(code_object.name, optimize(code_object)) for code_object in code_objects(program, top)]
+
+
+if __name__ == "__main__":
+    import sys
+    from resolver import resolve
+
+    program = resolve(parse(open(sys.argv[1]).read()))
+    for name, removed in optimize_program(program, codegen(program)):
+        print(f"{name}: {removed} instructions removed")
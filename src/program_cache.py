@@ -0,0 +1,107 @@
+import hashlib
+import os
+import pickle
+import sys
+
+from parser import parse
+from resolver import resolve
+
+# ==========================================================================================
+# ==================================== PROGRAM CACHE =======================================
+# Parsed and resolved programs are pickled to `__nxcache__/<sha256>.nxc` so later runs of
+# the same source skip the front end. Each file starts with a stamp of the cache format,
+# the Python version and the front-end sources, so an interpreter change is a miss.
+
+CACHE_DIR_NAME = "__nxcache__"
+CACHE_SUFFIX = ".nxc"
+CACHE_FORMAT = 2
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+FRONT_END_MODULES = ("tokens.py", "lexer.py", "parser.py", "scope.py", "resolver.py", "optimizer.py", "runtime.py",
+                     "program_cache.py")
+
+_stamp = None
+
+
+def version_stamp() -> str:
+    """Hash of everything a cached program depends on besides its source."""
+    global _stamp
+    if _stamp is None:
+        h = hashlib.sha256(f"{CACHE_FORMAT}:{sys.version}".encode())
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in FRONT_END_MODULES:
+            with open(os.path.join(src_dir, name), "rb") as f:
+                h.update(f.read())
+        _stamp = h.hexdigest()
+    return _stamp
+
+
+def cache_path(cache_dir: str, source: str, pratt: bool = False) -> str:
+    key = hashlib.sha256(f"{version_stamp()}:{pratt}:".encode() + source.encode()).hexdigest()
+    return os.path.join(cache_dir, key + CACHE_SUFFIX)
+
+
+def read_cached(path: str):
+    """The program stored at `path`, or None if it is missing, stale or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            stamp, program = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError, ImportError):
+        return None
+    if stamp != version_stamp():
+        return None
+    try:
+        os.utime(path)  # mtime doubles as last use for eviction
+    except OSError:  # evicted by another run since: a miss, like any vanished entry
+        return None
+    return program
+
+
+def write_cached(path: str, program) -> bool:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            pickle.dump((version_stamp(), program), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)  # readers never see a half-written file
+    except (OSError, pickle.PicklingError, RecursionError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def evict(cache_dir: str, max_bytes: int = MAX_CACHE_BYTES):
+    """
+    Delete least recently used entries until the cache fits in `max_bytes`. Other runs
+    may evict the same entries at the same time, so an entry that has vanished is skipped.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(CACHE_SUFFIX):
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            pass  # gone already, which frees the space all the same
+        total -= size
+
+
+def load_program(source: str, cache_dir: str, pratt: bool = False, max_bytes: int = MAX_CACHE_BYTES):
+    """Return ((Statements, global scope), hit) for `source`, resolving and caching it on a miss."""
+    path = cache_path(cache_dir, source, pratt)
+    program = read_cached(path)
+    if program is not None:
+        return program, True
+    program = resolve(parse(source, pratt=pratt))
+    if write_cached(path, program):
+        evict(cache_dir, max_bytes)
+    return program, False
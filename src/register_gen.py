@@ -0,0 +1,453 @@
+from parser import *
+from bytecode_gen import DISCARD, Loop, drops, outer_arg
+from optimizer import may_signal
+from runtime import BREAKOUT_SIGNAL, MOVEON_SIGNAL
+
+# ==========================================================================================
+# ==================================== REGISTER CODE =======================================
+# A register instruction set for the same resolved programs as bytecode_gen.py. The
+# registers of a call are its frame: the resolver's slots hold the locals, and the slots
+# after them hold the temporaries of the code, so `x = x + 1` is one `ADDK x, x, k`.
+# Every instruction is four ints: opcode, a, b, c. A binary opcode computes
+# `r[a] = r[b] op r[c]`; the same opcode + CONST_OPERAND takes the constant `consts[c]`
+# as its right operand.
+
+HALT, RETURN, MOVE, LOADK, GETOUTER, SETOUTER, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE = range(9)
+TEST_SIGNAL, DISPLAY, DISPLAYL, FEED, FUNC_DEF, CALL, TAIL_CALL, LABEL = range(9, 17)
+NEW_ARRAY, NEW_HASH, GET_ITEM, SET_ITEM, PUSH_FRONT, PUSH_BACK, POP_FRONT, POP_BACK = range(17, 25)
+LENGTH, CLEAR, INSERT, REMOVE_AT, REMOVE_KEY, NOT, BNOT, ASCII, CHAR = range(25, 34)
+ADD, SUB, MUL, DIV, MOD, POW, LT, GT, EQ, NEQ, LE, GE, BAND, BOR, BXOR, SHL, SHR = range(34, 51)
+CONST_OPERAND = 17  # ADD + CONST_OPERAND is ADDK, and so on
+
+OPNAMES = """HALT RETURN MOVE LOADK GETOUTER SETOUTER JUMP JUMP_IF_FALSE JUMP_IF_TRUE TEST_SIGNAL
+DISPLAY DISPLAYL FEED FUNC_DEF CALL TAIL_CALL LABEL NEW_ARRAY NEW_HASH GET_ITEM SET_ITEM PUSH_FRONT
+PUSH_BACK POP_FRONT POP_BACK LENGTH CLEAR INSERT REMOVE_AT REMOVE_KEY NOT BNOT ASCII CHAR ADD SUB MUL
+DIV MOD POW LT GT EQ NEQ LE GE BAND BOR BXOR SHL SHR""".split()
+OPNAMES += [name + "K" for name in OPNAMES[ADD:]]
+
+# A comparison that only decides a jump is fused with it: JUMP_IF_NOT_LT a b t jumps to t
+# unless r[a] < r[b], JUMP_IF_LT a b t jumps if it holds, and the K forms compare with
+# consts[b].
+COMPARE_JUMPS = {}  # (comparison opcode, jumps if it holds, constant operand) -> opcode
+for holds in (False, True):
+    for const in (False, True):
+        for compare in range(LT, GE + 1):
+            COMPARE_JUMPS[compare, holds, const] = len(OPNAMES)
+            OPNAMES.append(("JUMP_IF_" if holds else "JUMP_IF_NOT_") + OPNAMES[compare] + "K" * const)
+
+# What a, b and c mean ("r" register, "k" constant index, "n" count, "o" outer address,
+# "t" code position):
+#   MOVE r r            LOADK r k          GETOUTER r o        SETOUTER o r
+#   JUMP t              JUMP_IF_* r t      JUMP_IF_[NOT_]<comparison>[K] r r|k t
+#   TEST_SIGNAL r t t   jump to b if r[a] is a breakout, to c if it is a moveon
+#   DISPLAY(L) r        FEED r r           FUNC_DEF k          RETURN r
+#   CALL r n k          function in r, arguments in the n registers after it, result in r
+#   TAIL_CALL r n k     CALL, or the running function called again in the same registers
+#   NEW_ARRAY r r n     NEW_HASH r r n     elements / key, value pairs in the registers from b
+#   GET_ITEM r r r      r[a] = r[b][r[c]]  SET_ITEM r r r      r[a][r[b]] = r[c]
+#   PUSH_FRONT/BACK r r, INSERT r r r, CLEAR r                  change the array in r[a]
+#   POP_FRONT/BACK r r k, LENGTH r r       read the array in r[b] into r[a]
+#   REMOVE_AT r r k, REMOVE_KEY r r k      r[a] = remove r[b] from r[a]; k is the name
+#   unary ops r r       binary ops r r r, or r r k with CONST_OPERAND
+WIDTH = 4
+JUMP_OPERANDS = {JUMP: (1,), JUMP_IF_FALSE: (2,), JUMP_IF_TRUE: (2,), TEST_SIGNAL: (2, 3)}
+JUMP_OPERANDS.update(dict.fromkeys(COMPARE_JUMPS.values(), (3,)))
+
+BINARY_OPCODES = {
+    "+": ADD, "-": SUB, "*": MUL, "/": DIV, "÷": DIV, "%": MOD, "**": POW,
+    "<": LT, ">": GT, "==": EQ, "!=": NEQ, "<=": LE, ">=": GE,
+    "&": BAND, "|": BOR, "^": BXOR, "<<": SHL, ">>": SHR,
+}
+UNARY_OPCODES = {"not": NOT, "!": NOT, "~": BNOT, "ascii": ASCII, "char": CHAR}
+
+
+@dataclass
+class RegisterCode:
+    """The register code of one function body, or of the program's top level."""
+    name: str
+    code: list     # opcode, a, b, c, opcode, ...: a list, as reading an array('i') boxes every int
+    consts: list
+    size: int      # registers: the resolver's slots, then the temporaries
+
+
+def literal(t):
+    return isinstance(t, (Number, String, Boolean))
+
+
+def pure(t):
+    """Whether evaluating `t` cannot change a variable."""
+    match t:
+        case Number() | String() | Boolean() | Variable():
+            return True
+        case BinOp(_, l, r):
+            return pure(l) and (r is None or pure(r))
+        case UnaryOp(_, val):
+            return pure(val)
+        case _:
+            return False
+
+
+class RegisterGenerator:
+    """
+    Generates the register code of one function body (or of the program). Temporaries are
+    allocated upwards from `locals` and given back at the end of every statement.
+    """
+    def __init__(self, locals):
+        self.code = []
+        self.consts = []
+        self.const_index = {}
+        self.labels = 0
+        self.locals = locals
+        self.top = self.size = locals
+
+    def emit(self, opcode, a=0, b=0, c=0):
+        self.code.extend((opcode, a, b, c))
+
+    def const(self, value):
+        if isinstance(value, (int, float, str, type(None))):
+            key = (type(value), repr(value))  # keeps 1, 1.0 and True apart
+            if key not in self.const_index:
+                self.const_index[key] = len(self.consts)
+                self.consts.append(value)
+            return self.const_index[key]
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def alloc(self, n=1):
+        """The first of `n` fresh consecutive temporaries."""
+        reg = self.top
+        self.top += n
+        self.size = max(self.size, self.top)
+        return reg
+
+    def label(self):
+        self.labels += 1
+        return self.labels
+
+    def place(self, label):
+        self.emit(LABEL, label)
+
+    def target(self, dst):
+        return self.alloc() if dst is None else dst
+
+    def move(self, dst, reg):
+        """Puts the value of `reg` in `dst`, if there is one; returns where the value is."""
+        if dst is None or dst == reg:
+            return reg
+        self.emit(MOVE, dst, reg)
+        return dst
+
+    def stable(self, reg, *later):
+        """`reg`, or a copy of it if evaluating the `later` trees could assign to it first."""
+        if reg < self.locals and not all(pure(t) for t in later):
+            return self.move(self.alloc(), reg)
+        return reg
+
+    def named(self, t, dst=None):
+        """Register holding the variable `t` refers to."""
+        if t.depth == 0:
+            return self.move(dst, t.slot)
+        reg = self.target(dst)
+        self.emit(GETOUTER, reg, outer_arg(t))
+        return reg
+
+    def generate(self, name, body, end):
+        if end == RETURN:
+            self.emit(RETURN, self.expr(body))
+        else:
+            self.stmt(body, DISCARD)
+            self.emit(HALT)
+        return RegisterCode(name, resolve_labels(self.code), self.consts, self.size)
+
+    def stmt(self, t, sink):
+        """Code for statement `t`, whose value is dropped or checked by the enclosing loop."""
+        mark = self.top
+        match t:
+            case Statements(statements):
+                for stmt in statements[:-1]:  # in a loop body, any of them may break out
+                    self.stmt(stmt, sink if isinstance(sink, Loop) else DISCARD)
+                if statements:
+                    self.stmt(statements[-1], sink)
+            case If(cond, then_body, None, _):
+                end = self.label()
+                self.branch(cond, False, end)
+                self.stmt(then_body, sink)
+                self.place(end)
+            case If(cond, then_body, else_body, _):
+                otherwise, end = self.label(), self.label()
+                self.branch(cond, False, otherwise)
+                self.stmt(then_body, sink)
+                self.emit(JUMP, end)
+                self.place(otherwise)
+                self.stmt(else_body, sink)
+                self.place(end)
+            case WhileLoop(cond, body, _):  # the condition is tested at the bottom, one jump a turn
+                top, test, exit = self.label(), self.label(), self.label()
+                self.emit(JUMP, test)
+                self.place(top)
+                for stmt in body.statements:
+                    self.stmt(stmt, Loop(exit, test))
+                self.place(test)
+                self.branch(cond, True, top)
+                self.place(exit)
+            case ForLoop(init, cond, incr, body, _):
+                top, step, test, exit = self.label(), self.label(), self.label(), self.label()
+                self.stmt(init, DISCARD)
+                self.emit(JUMP, test)
+                self.place(top)
+                for stmt in body.statements:
+                    self.stmt(stmt, Loop(exit, step))
+                self.place(step)
+                self.stmt(incr, DISCARD)
+                self.place(test)
+                self.branch(cond, True, top)
+                self.place(exit)
+            case BreakOut() if isinstance(sink, Loop):
+                self.emit(JUMP, sink.exit)
+            case MoveOn() if isinstance(sink, Loop):
+                self.emit(JUMP, sink.next)
+            case None | Break() | BreakOut() | MoveOn():
+                pass
+            case FuncDef():
+                self.emit(FUNC_DEF, self.const(t))
+            case Display(val) | DisplayL(val):
+                self.emit(DISPLAY if isinstance(t, Display) else DISPLAYL, self.expr(val))
+            case _:
+                reg = self.expr(t)
+                if not drops(sink, t):
+                    self.emit(TEST_SIGNAL, reg, sink.exit, sink.next)
+        self.top = mark
+
+    def branch(self, cond, holds, label):
+        """Code jumping to `label` if `cond` is true (`holds`) or false (not `holds`)."""
+        mark = self.top
+        match cond:
+            case BinOp(op, l, r) if BINARY_OPCODES.get(op) in range(LT, GE + 1):
+                compare = BINARY_OPCODES[op]
+                left = self.stable(self.expr(l), r)
+                if literal(r):
+                    self.emit(COMPARE_JUMPS[compare, holds, True], left, self.const(r.val), label)
+                else:
+                    self.emit(COMPARE_JUMPS[compare, holds, False], left, self.expr(r), label)
+            case _:
+                self.emit(JUMP_IF_TRUE if holds else JUMP_IF_FALSE, self.expr(cond), label)
+        self.top = mark
+
+    def expr(self, t, dst=None):
+        """Code computing the value of `t`; returns its register, which is `dst` if given."""
+        match t:
+            case Number(v) | String(v) | Boolean(v):
+                reg = self.target(dst)
+                self.emit(LOADK, reg, self.const(v))
+                return reg
+            case Variable():
+                return self.named(t, dst)
+            case Array(val) | Hash(val):
+                reg = self.target(dst)
+                items = [part for item in val for part in (item if isinstance(t, Hash) else (item,))]
+                base = self.alloc(len(items))
+                for i, item in enumerate(items):
+                    self.expr(item, base + i)
+                self.emit(NEW_HASH if isinstance(t, Hash) else NEW_ARRAY, reg, base, len(val))
+                return reg
+
+            case BinOp("and" | "or", l, r):  # short-circuits, and gives an operand back
+                end = self.label()
+                reg = dst if dst is not None and dst >= self.locals else self.alloc()
+                self.expr(l, reg)
+                self.emit(JUMP_IF_FALSE if t.op == "and" else JUMP_IF_TRUE, reg, end)
+                self.expr(r, reg)
+                self.place(end)
+                return self.move(dst, reg)
+            case BinOp("not" | "~", l, _):  # unary forms the parser builds as BinOp
+                val = self.expr(l)
+                reg = self.target(dst)
+                self.emit(UNARY_OPCODES[t.op], reg, val)
+                return reg
+            case BinOp(op, l, r) if op in BINARY_OPCODES:
+                left = self.stable(self.expr(l), r)
+                return self.binary(BINARY_OPCODES[op], left, r, dst)
+            case UnaryOp(op, val) if op in UNARY_OPCODES:
+                val = self.expr(val)
+                reg = self.target(dst)
+                self.emit(UNARY_OPCODES[op], reg, val)
+                return reg
+            case Feed(msg):
+                msg = self.expr(msg)
+                reg = self.target(dst)
+                self.emit(FEED, reg, msg)
+                return reg
+
+            case FuncCall(funcName, funcArgs):
+                base = self.alloc(1 + len(funcArgs))
+                self.named(t, base)  # the function is looked up before its arguments run, as in e()
+                for i, arg in enumerate(funcArgs):
+                    self.expr(arg, base + 1 + i)
+                self.emit(TAIL_CALL if t.tail else CALL, base, len(funcArgs), self.const(funcName))
+                return self.move(dst, base)
+
+            case Statements(statements):
+                for stmt in statements[:-1]:
+                    self.stmt(stmt, DISCARD)
+                if statements:
+                    return self.expr(statements[-1], dst)
+                return self.expr(None, dst)
+            case If(cond, then_body, else_body, _):
+                otherwise, end = self.label(), self.label()
+                self.branch(cond, False, otherwise)
+                reg = self.target(dst)
+                self.expr(then_body, reg)
+                self.emit(JUMP, end)
+                self.place(otherwise)
+                self.expr(else_body, reg)
+                self.place(end)
+                return reg
+            case WhileLoop() | ForLoop() | FuncDef() | Display() | DisplayL():
+                self.stmt(t, DISCARD)
+                return self.expr(None, dst)
+
+            case VarBind(_, _, value, _):
+                self.expr(value, t.slot)
+                return self.move(dst, t.slot)
+            case AssignToVar(_, value) if t.depth == 0:
+                self.expr(value, t.slot)
+                return self.move(dst, t.slot)
+            case AssignToVar(_, value):
+                reg = self.expr(value, dst)
+                self.emit(SETOUTER, outer_arg(t), reg)
+                return reg
+            case CompoundAssignment(_, op, value) if op[0] in BINARY_OPCODES and t.depth == 0:
+                self.binary(BINARY_OPCODES[op[0]], self.stable(t.slot, value), value, t.slot)
+                return self.move(dst, t.slot)
+            case CompoundAssignment(_, op, value) if op[0] in BINARY_OPCODES:
+                reg = self.named(t, self.alloc())
+                self.binary(BINARY_OPCODES[op[0]], reg, value, reg)
+                self.emit(SETOUTER, outer_arg(t), reg)
+                return self.move(dst, reg)
+            case BreakOut() | MoveOn():
+                reg = self.target(dst)
+                self.emit(LOADK, reg, self.const(BREAKOUT_SIGNAL if isinstance(t, BreakOut) else MOVEON_SIGNAL))
+                return reg
+
+            case PushFront(_, value) | PushBack(_, value):
+                arr = self.stable(self.named(t), value)
+                self.emit(PUSH_FRONT if isinstance(t, PushFront) else PUSH_BACK, arr, self.expr(value))
+                return self.move(dst, arr)
+            case InsertAt(_, index, value):
+                arr = self.stable(self.named(t), index, value)
+                index = self.stable(self.expr(index), value)
+                self.emit(INSERT, arr, index, self.expr(value))
+                return self.move(dst, arr)
+            case PopFront(name) | PopBack(name):
+                arr = self.named(t)
+                reg = self.target(dst)
+                self.emit(POP_FRONT if isinstance(t, PopFront) else POP_BACK, reg, arr, self.const(name))
+                return reg
+            case GetLength(_):
+                arr = self.named(t)
+                reg = self.target(dst)
+                self.emit(LENGTH, reg, arr)
+                return reg
+            case ClearArray(_):
+                arr = self.named(t)
+                self.emit(CLEAR, arr)
+                return self.move(dst, arr)
+            case RemoveAt(name, index) | RemoveHashPair(name, index):
+                reg = self.named(t, self.alloc())
+                self.emit(REMOVE_AT if isinstance(t, RemoveAt) else REMOVE_KEY, reg, self.expr(index), self.const(name))
+                return self.move(dst, reg)
+            case CallArr(_, index) | CallHashVal(_, index):
+                container = self.stable(self.named(t), index)
+                index = self.expr(index)
+                reg = self.target(dst)
+                self.emit(GET_ITEM, reg, container, index)
+                return reg
+            case AssigntoArr(_, index, value) | AssignHashVal(_, index, value):
+                val = self.stable(self.expr(value), index)  # the value is evaluated before the index, as in e()
+                container = self.stable(self.named(t), index)
+                self.emit(SET_ITEM, container, self.expr(index), val)
+                return self.move(dst, val)
+            case AddHashPair(_, key, value):
+                container = self.stable(self.named(t), key, value)
+                key = self.stable(self.expr(key), value)
+                self.emit(SET_ITEM, container, key, self.expr(value))
+                return self.expr(None, dst)
+
+            case _:  # what the tree-walker does not match evaluates to None there too
+                reg = self.target(dst)
+                self.emit(LOADK, reg, self.const(None))
+                return reg
+
+    def binary(self, opcode, left, right, dst):
+        """`dst = left op right` for a register `left` and a tree `right`."""
+        if literal(right):
+            reg = self.target(dst)
+            self.emit(opcode + CONST_OPERAND, reg, left, self.const(right.val))
+            return reg
+        right = self.expr(right)
+        reg = self.target(dst)
+        self.emit(opcode, reg, left, right)
+        return reg
+
+
+def instructions(code):
+    """(position, opcode, a, b, c) of every instruction in a list or array of words."""
+    for ip in range(0, len(code), WIDTH):
+        yield ip, code[ip], code[ip + 1], code[ip + 2], code[ip + 3]
+
+
+def resolve_labels(code):
+    """Drop the LABEL placeholders and point every jump at its label's code position."""
+    positions, size = {}, 0
+    for _, opcode, a, _, _ in instructions(code):
+        if opcode == LABEL:
+            positions[a] = size
+        else:
+            size += WIDTH
+    resolved = []
+    for _, *instruction in instructions(code):
+        for operand in JUMP_OPERANDS.get(instruction[0], ()):
+            instruction[operand] = positions[instruction[operand]]
+        if instruction[0] != LABEL:
+            resolved.extend(instruction)
+    return resolved
+
+
+def function(funcDef, codes):
+    """
+    Generate `funcDef`'s body, and the functions inside it, once per body (the resolver
+    gives a function's hoisted FuncDef and its statement separate nodes). The FuncDef's
+    frame_size grows by the temporaries, so calls get a frame that holds them; a FuncDef
+    that already has its registers has been widened before and is left alone.
+    """
+    if funcDef.registers is not None:
+        return
+    funcBody = funcDef.funcBody
+    if id(funcBody) not in codes:
+        codes[id(funcBody)] = RegisterGenerator(funcDef.frame_size).generate(funcDef.funcName, funcBody, RETURN)
+        for inner in (*funcDef.hoisted, *nested(funcBody)):
+            function(inner, codes)
+    funcDef.registers = codes[id(funcBody)]
+    funcDef.frame_size = funcDef.registers.size
+
+
+def nested(tree):
+    """FuncDefs anywhere inside `tree`, without looking into their bodies."""
+    match tree:
+        case FuncDef():
+            yield tree
+        case AST() | Statements():
+            for value in vars(tree).values():
+                yield from nested(value)
+        case list() | tuple():
+            for item in tree:
+                yield from nested(item)
+
+
+def register_codegen(program):
+    """Register code of a resolved program's top level; function bodies go on their FuncDefs."""
+    lines, _ = program
+    codes = {}  # id(function body) -> register code
+    for funcDef in nested(lines):
+        function(funcDef, codes)
+    return RegisterGenerator(lines.frame_size).generate("<program>", lines, HALT)
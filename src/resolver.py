@@ -0,0 +1,205 @@
+from parser import *
+from optimizer import optimize, owners, impurities, frames, nodes, may_signal
+from runtime import MemoStats
+
+# ==========================================================================================
+# ==================================== RESOLVER ============================================
+# Runs between parse() and the evaluator. Every scope table the parser built belongs to a
+# frame: the global one or that of the function it sits in (while/for/if blocks are
+# flattened into the enclosing frame). Each name a table declares gets a slot in its frame;
+# slot 0 holds the static link to the frame the function was defined in. Nodes that refer
+# to a name are annotated with `depth` (static links to follow) and `slot`.
+#
+# Names are resolved against the tables as they are after parsing, the same tables the
+# tree-walker used to search at run time, so a name binds to the same declaration.
+# Functions are taken from the tables too: the parser stores (params, body, scope, isRec,
+# isMemo) for every `fn`, including ones whose FuncDef statement a following expression
+# replaced, and they are hoisted into their frame so they can be called before the
+# definition runs.
+#
+# An fnmemo function must be pure (see optimizer.impurities); its FuncDefs get the
+# MemoStats that every value of it counts its lookups in. Then calls an fnrec function
+# makes to itself in tail position (the last statement of its body, through if branches
+# and blocks) are marked `tail`: the tree-walker and the stack VM run them as a jump back
+# to the start of the body instead of a nested call.
+#
+# Last, each loop is marked with whether its body may break out or move on (may_signal),
+# and so is each block of the body, through if branches, that may do so before its last
+# statement; the backends run the others without looking at statement values.
+
+
+class Resolver:
+    def __init__(self):
+        self.slots = {}     # id(table) -> {name: slot}
+        self.level = {}     # id(table) -> function nesting level, 0 for globals
+        self.sizes = []     # next free slot of each frame being laid out
+        self.hoisted = []   # FuncDefs of each frame being laid out
+        self.funcs = {}     # id(function body) -> (frame size, hoisted FuncDefs)
+
+    def enter(self, table):
+        """Lay out `table`'s names in the innermost frame and resolve its functions."""
+        if id(table) in self.slots:
+            return
+        slots = {}
+        for name in table.table:
+            slots[name] = self.sizes[-1]
+            self.sizes[-1] += 1
+        self.slots[id(table)] = slots
+        self.level[id(table)] = len(self.sizes) - 1
+        for name, (value, category) in table.table.items():
+            if category == SymbolCategory.FUNCTION and isinstance(value, tuple):
+                funcParams, funcBody, funcScope, isRec, isMemo = value
+                funcDef = FuncDef(name, funcParams, funcBody, funcScope, isRec, isMemo)
+                funcDef.slot = slots[name]
+                funcDef.frame_size, funcDef.hoisted = self.frame(funcBody, funcScope)
+                self.funcs[id(funcBody)] = (funcDef.frame_size, funcDef.hoisted)
+                self.hoisted[-1].append(funcDef)
+
+    def bind(self, node, name, table):
+        owner = table
+        while owner is not None and name not in owner.table:
+            owner = owner.parent
+        if owner is None:
+            raise NameError(f"Variable '{name}' nhi mila!")
+        node.depth = self.level[id(table)] - self.level[id(owner)]
+        node.slot = self.slots[id(owner)][name]
+
+    def frame(self, body, table):
+        """Lay out a new frame for `body`; returns (size, hoisted FuncDefs)."""
+        self.sizes.append(1)
+        self.hoisted.append([])
+        self.enter(table)
+        self.walk(body, table)
+        return self.sizes.pop(), tuple(self.hoisted.pop())
+
+    def walk(self, tree, tS):
+        match tree:
+            case None | Number() | String() | Boolean() | Break() | BreakOut() | MoveOn():
+                pass
+            case Statements(statements):
+                for stmt in statements:
+                    self.walk(stmt, tS)
+            case Variable(v):
+                self.bind(tree, v, tS)
+            case BinOp(_, l, r):
+                self.walk(l, tS)
+                self.walk(r, tS)
+            case UnaryOp(_, val) | Feed(val) | Display(val) | DisplayL(val):
+                self.walk(val, tS)
+            case Array(val):
+                for x in val:
+                    self.walk(x, tS)
+            case Hash(val):
+                for k, v in val:
+                    self.walk(k, tS)
+                    self.walk(v, tS)
+            case VarBind(name, _, value, _):
+                self.walk(value, tS)
+                self.bind(tree, name, tS)
+            case AssignToVar(name, value) | CompoundAssignment(name, _, value):
+                self.walk(value, tS)
+                self.bind(tree, name, tS)
+            case If(cond, then_body, else_body, tS_cond):
+                self.enter(tS_cond)
+                self.walk(cond, tS_cond)
+                self.walk(then_body, tS_cond)
+                self.walk(else_body, tS_cond)
+            case WhileLoop(cond, body, tS_while):
+                self.enter(tS_while)
+                self.walk(cond, tS_while)
+                self.walk(body, tS_while)
+            case ForLoop(init, cond, incr, body, tS_for):
+                self.enter(tS_for)
+                for part in (init, cond, incr, body):
+                    self.walk(part, tS_for)
+            case FuncDef(funcName, _, funcBody, _, _):
+                self.bind(tree, funcName, tS)
+                tree.frame_size, tree.hoisted = self.funcs[id(funcBody)]
+            case FuncCall(funcName, funcArgs):
+                self.bind(tree, funcName, tS)
+                for arg in funcArgs:
+                    self.walk(arg, tS)
+            case PopFront(name) | PopBack(name) | GetLength(name) | ClearArray(name):
+                self.bind(tree, name, tS)
+            case PushFront(name, val) | PushBack(name, val) | CallArr(name, val) | RemoveAt(name, val) \
+                    | CallHashVal(name, val) | RemoveHashPair(name, val):
+                self.bind(tree, name, tS)
+                self.walk(val, tS)
+            case AssigntoArr(name, a, b) | InsertAt(name, a, b) | AddHashPair(name, a, b) \
+                    | AssignHashVal(name, a, b):
+                self.bind(tree, name, tS)
+                self.walk(a, tS)
+                self.walk(b, tS)
+            case _:
+                raise TypeError(f"Resolver does not handle {type(tree).__name__}")
+
+
+def mark_memo_functions(lines):
+    found = [funcDefs for funcDefs in owners(lines).values() 
+             if isinstance(funcDefs[0], FuncDef) and funcDefs[0].isMemo]
+    if not found:
+        return
+    reasons = impurities(lines)
+    for funcDefs in found:  # the hoisted FuncDef and the FuncDef statement
+        reason = reasons[id(funcDefs[0].funcBody)]
+        if reason is not None:
+            raise ValueError(f"fnmemo function {funcDefs[0].funcName} is not pure: {reason}.")
+        stats = MemoStats(funcDefs[0].funcName)
+        for funcDef in funcDefs:
+            funcDef.memo = stats
+
+
+def mark_tail_calls(funcDef, tree):
+    """Mark the calls `funcDef` makes to itself where `tree`, in tail position, ends."""
+    match tree:
+        case Statements(statements) if statements:
+            mark_tail_calls(funcDef, statements[-1])
+        case If(_, then_body, else_body, _):
+            mark_tail_calls(funcDef, then_body)
+            mark_tail_calls(funcDef, else_body)
+        case FuncCall() if tree.depth == 1 and tree.slot == funcDef.slot:
+            tree.tail = True
+
+
+def mark_functions(hoisted):
+    for funcDef in hoisted:  # every FuncDef is hoisted into some frame
+        if funcDef.isRec:
+            mark_tail_calls(funcDef, funcDef.funcBody)
+        mark_functions(funcDef.hoisted)
+
+
+def mark_signals(tree):
+    """Mark the blocks of loop body statement `tree` that may break out or move on before
+    their last statement; returns whether `tree` may."""
+    match tree:
+        case Statements(statements):
+            signals = [mark_signals(stmt) for stmt in statements]
+            tree.signals = any(signals[:-1])
+            return any(signals)
+        case If(_, then_body, else_body, _):
+            return mark_signals(then_body) | mark_signals(else_body)
+        case _:
+            return may_signal(tree)
+
+
+def mark_loops(lines):
+    for body, _, _ in frames(lines, lines.hoisted):
+        for node in nodes(body):
+            if isinstance(node, (WhileLoop, ForLoop)):
+                node.signals = any([mark_signals(stmt) for stmt in node.body.statements])
+
+
+def resolve(program, optimized=True):
+    """
+    Annotate a parsed program (Statements, global scope) in place and return it. The
+    global frame's size and hoisted FuncDefs are stored on the Statements node. Unless
+    `optimized` is false, the AST optimizer (optimizer.py) then rewrites the program.
+    """
+    lines, tS = program
+    lines.frame_size, lines.hoisted = Resolver().frame(lines, tS)
+    mark_memo_functions(lines)
+    if optimized:
+        optimize(program)
+    mark_functions(lines.hoisted)
+    mark_loops(lines)
+    return program
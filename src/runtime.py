@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from parser import BreakOut, MoveOn
+
+# ==========================================================================================
+# ==================================== RUNTIME =============================================
+# What every execution backend shares: function values, activation frames and the
+# operations whose checks and error messages must not differ between backends.
+#
+# A frame is a list: slot 0 is the static link to the enclosing frame and the other slots
+# hold the names the resolver laid out (see resolver.py). Every call gets a frame of its
+# own, a copy of a template the function keeps. Copying a list is cheaper than keeping
+# finished frames to reuse: clearing them on the way back costs more than it saves.
+#
+# `breakout` and `moveon` evaluate to BREAKOUT_SIGNAL and MOVEON_SIGNAL on every backend,
+# so loops tell them apart from other statement values by identity.
+#
+# Every value of an fnmemo function keeps the results of its calls in a Memo, looked up
+# by the arguments before the body runs. The resolver only accepts fnmemo functions
+# whose value depends on the arguments alone (see optimizer.impurities).
+
+MEMO_SIZE = 1024      # results kept per fnmemo function value, least recently used dropped
+MEMO_RESULTS = {int, float, str, bool, type(None)}  # results no caller can change
+MISSING = object()    # a result not in the memo
+BREAKOUT_SIGNAL = BreakOut()
+MOVEON_SIGNAL = MoveOn()
+
+
+class Function:
+    """A FuncDef closed over the frame it was defined in."""
+    __slots__ = ("node", "env", "template", "memo")
+
+    def __init__(self, node, env):
+        self.node = node
+        self.env = env
+        # the frame of a function with nested functions needs Functions of its own
+        self.template = None if node.hoisted else [env] + [None] * (node.frame_size - 1)
+        self.memo = None if node.memo is None else Memo(node.memo)
+
+    def call_frame(self):
+        """A fresh frame for a call, its parameter and local slots None."""
+        if self.template is not None:
+            return self.template.copy()
+        return new_frame(self.node.frame_size, self.env, self.node.hoisted)
+
+
+class TailCall:
+    """A call left for the FuncCall whose body ends in it to make."""
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+
+class MemoStats:
+    """Lookups in the memos of one fnmemo function, all of its values together."""
+    __slots__ = ("name", "hits", "misses")
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = self.misses = 0
+
+
+class Memo:
+    __slots__ = ("results", "stats")
+
+    def __init__(self, stats):
+        self.results = OrderedDict()  # argument tuple -> result, least recently used first
+        self.stats = stats
+
+    def lookup(self, args):
+        """(key, result) of a call with `args`: the key is None for arguments that are not
+        looked up, the result MISSING when the call has not been made."""
+        for arg in args:  # 1, 1.0 and True are equal keys, but not equal results
+            if type(arg) is not int and type(arg) is not str:
+                return None, MISSING
+        key = tuple(args)
+        result = self.results.get(key, MISSING)
+        if result is MISSING:
+            self.stats.misses += 1
+        else:
+            self.results.move_to_end(key)
+            self.stats.hits += 1
+        return key, result
+
+    def store(self, key, result):
+        if key is not None and type(result) in MEMO_RESULTS:
+            self.results[key] = result
+            if len(self.results) > MEMO_SIZE:
+                self.results.popitem(last=False)
+
+
+def memoized_call(func, args, call):
+    """The result of `func`, an fnmemo function value, for `args`: from its memo, or
+    made by call(func, args)."""
+    key, result = func.memo.lookup(args)
+    if result is MISSING:
+        result = call(func, args)
+        func.memo.store(key, result)
+    return result
+
+
+def memoized(function, stats):
+    """A transpiled fnmemo function, `function`, with a memo of its own."""
+    memo = Memo(stats)
+
+    def call(*args):
+        key, result = memo.lookup(args)
+        if result is MISSING:
+            result = function(*args)
+            memo.store(key, result)
+        return result
+    call.__wrapped__ = function  # what transpiler.call_value counts the parameters of
+    return call
+
+
+def memo_stats(hoisted):
+    """The MemoStats of the fnmemo functions among `hoisted` and the functions in them."""
+    for funcDef in hoisted:
+        if funcDef.memo is not None:
+            yield funcDef.memo
+        yield from memo_stats(funcDef.hoisted)
+
+
+def format_memo_stats(hoisted):
+    """The table `nexus --memostats` prints."""
+    lines = [f"{'function':<16} {'hits':>10} {'misses':>10}"]
+    for stats in memo_stats(hoisted):
+        lines.append(f"{stats.name:<16} {stats.hits:>10} {stats.misses:>10}")
+    if len(lines) == 1:
+        return "No fnmemo functions."
+    return "\n".join(lines)
+
+
+def new_frame(size, link, hoisted):
+    frame = [None] * size
+    frame[0] = link
+    for funcDef in hoisted:  # functions can be called before their definition runs
+        frame[funcDef.slot] = Function(funcDef, frame)
+    return frame
+
+
+def outer(frame, depth):
+    while depth:
+        frame = frame[0]
+        depth -= 1
+    return frame
+
+
+def nexus_pow(base, exponent):
+    # Rule 1: Zero to the power of a negative number
+    if base == 0 and exponent < 0:
+        raise ValueError("Math error: Zero cannot be raised to a negative power.")
+
+    # Rule 2: Negative number to the power of a decimal
+    if base < 0 and not float(exponent).is_integer():
+        raise ValueError("Math error: Negative numbers cannot be raised to a decimal power.")
+
+    return base ** exponent
+
+
+def pop_front(arr, arr_name):
+    if len(arr) > 0:
+        return arr.pop(0)
+    raise IndexError(f"Cannot PopFront from an empty array: {arr_name}")
+
+
+def pop_back(arr, arr_name):
+    if len(arr) > 0:
+        return arr.pop()
+    raise IndexError(f"Cannot PopBack from an empty array: {arr_name}")
+
+
+def remove_at(arr, index, arr_name):
+    if 0 <= index < len(arr):
+        return arr.pop(index)
+    raise IndexError(f"Index {index} out of bounds for array: {arr_name}")
+
+
+def remove_key(hash_table, key, name):
+    if key in hash_table:
+        del hash_table[key]
+    else:
+        raise KeyError(f"Key {key} not found in hash {name}")
@@ -0,0 +1,410 @@
+from parser import *
+from runtime import *
+import operator
+
+# ==========================================================================================
+# ==================================== STACK EVALUATOR =====================================
+# The tree-walker (evaluator.e) without the Python recursion: nodes still to evaluate and
+# what to do with their values are entries on a work stack, and values wait on a value
+# stack, so neither nested expressions nor nested calls use the Python stack and depth
+# is only bounded by memory. It evaluates the same resolved tree as e(), in the same
+# order and with the same quirks (x op= v evaluates BinOp(op[0], x, v), a hash
+# assignment evaluates its key twice, unknown operators give None).
+#
+# An entry is (step, a, b): the loop pops it and calls step(a, b). To evaluate a node the
+# step is the handler of its type and (a, b) the node and its frame; a handler pushes
+# the value, or pushes its own continuation and then entries for its children, last child
+# first. A call pushes a `ret` entry under the function body; `ret` makes a tail call
+# (runtime.TailCall) in a loop like e() does, and stores fnmemo results.
+# A loop iteration pushes the next iteration and then its body statements, each followed
+# by a check if the loop may signal: breakout drops the entries of the loop, moveon those
+# of the iteration, and either ends a block of the body that it is in.
+
+BINARY = {
+    "+": operator.add, "*": operator.mul, "-": operator.sub, "÷": operator.truediv,
+    "/": operator.truediv, "**": nexus_pow, "<": operator.lt, ">": operator.gt,
+    "==": operator.eq, "!=": operator.ne, "<=": operator.le, ">=": operator.ge,
+    "%": operator.mod, "&": operator.and_, "|": operator.or_, "^": operator.xor,
+    "<<": operator.lshift, ">>": operator.rshift,
+}
+UNARY = {"~": operator.invert, "not": operator.not_, "!": operator.not_, "ascii": ord, "char": chr}
+CONSTANTS = {Number, String, Boolean}
+
+
+def machine():
+    """A fresh evaluate(tree, frame), with its own work and value stacks."""
+    todo = []    # (step, a, b) entries, the next one last
+    values = []  # values of the nodes evaluated, the latest last
+
+    def evaluate(tree, frame):
+        base = len(values)
+        todo.append((HANDLERS.get(type(tree)) or handler(type(tree)), tree, frame))
+        while todo:
+            step, a, b = todo.pop()
+            step(a, b)
+        assert len(values) == base + 1
+        return values.pop()
+
+    def push(node, frame):
+        todo.append((HANDLERS.get(type(node)) or handler(type(node)), node, frame))
+
+    def children(step, a, b, frame, nodes):
+        """Evaluate `nodes` in order, then step(a, b) with their values on the stack."""
+        todo.append((step, a, b))
+        for node in reversed(nodes):
+            todo.append((HANDLERS.get(type(node)) or handler(type(node)), node, frame))
+
+    def drop(a, b):
+        values.pop()
+
+    def constant(node, frame):
+        values.append(node.val)
+
+    def variable(node, frame):
+        values.append(frame[node.slot] if not node.depth else outer(frame, node.depth)[node.slot])
+
+    def nothing(node, frame):
+        values.append(None)
+
+    # ===== OPERATORS =====
+
+    def binop(node, frame):
+        op, l, r = node.op, node.left, node.right
+        fn = BINARY.get(op)
+        if fn is not None:
+            tl, tr = type(l), type(r)
+            if tl is Variable:
+                left = frame[l.slot] if not l.depth else outer(frame, l.depth)[l.slot]
+            elif tl in CONSTANTS:
+                left = l.val
+            else:
+                children(apply2, fn, None, frame, (l, r))
+                return
+            if tr is Variable:
+                values.append(fn(left, frame[r.slot] if not r.depth else outer(frame, r.depth)[r.slot]))
+            elif tr in CONSTANTS:
+                values.append(fn(left, r.val))
+            else:
+                values.append(left)
+                todo.append((apply2, fn, None))
+                push(r, frame)
+        elif op == "and" or op == "or":
+            todo.append((logic, op == "and", (r, frame)))
+            push(l, frame)
+        elif op == "not" or op == "~":
+            children(apply1, UNARY[op], None, frame, (l,))
+        else:
+            values.append(None)
+
+    def apply2(fn, _):
+        right = values.pop()
+        values[-1] = fn(values[-1], right)
+
+    def apply1(fn, _):
+        values[-1] = fn(values[-1])
+
+    def logic(is_and, right):
+        if bool(values[-1]) == is_and:  # `l and r` and `l or r` go on to r
+            values.pop()
+            push(*right)
+
+    def unaryop(node, frame):
+        fn = UNARY.get(node.op)
+        if fn is None:
+            values.append(None)
+        else:
+            children(apply1, fn, None, frame, (node.val,))
+
+    def feed(node, frame):
+        children(apply1, input, None, frame, (node.msg,))
+
+    def array(node, frame):
+        children(collect, len(node.val), None, frame, node.val)
+
+    def collect(count, _):
+        items = values[len(values) - count:]
+        del values[len(values) - count:]
+        values.append(items)
+
+    def hash_(node, frame):
+        children(pairs, len(node.val), None, frame, [item for pair in node.val for item in pair])
+
+    def pairs(count, _):
+        items = values[len(values) - 2 * count:]
+        del values[len(values) - 2 * count:]
+        values.append({items[i]: items[i + 1] for i in range(0, len(items), 2)})
+
+    # ===== FUNCTIONS =====
+
+    def func_def(node, frame):
+        frame[node.slot] = Function(node, frame)
+        values.append(None)
+
+    def func_call(node, frame):
+        func = frame[node.slot] if not node.depth else outer(frame, node.depth)[node.slot]
+        if not isinstance(func, Function):
+            raise ValueError(f"Function {node.funcName} is not defined correctly.")
+        count, args = len(func.node.funcParams), node.funcArgs
+        todo.append((invoke, node, func))
+        if count > len(args):  # e() gets that far before the IndexError
+            todo.append((fail, IndexError("list index out of range"), None))
+        for arg in reversed(args[:count]):
+            push(arg, frame)
+
+    def fail(error, _):
+        raise error
+
+    def invoke(node, func):
+        count = len(func.node.funcParams)
+        args = values[len(values) - count:]
+        del values[len(values) - count:]
+        if node.tail:
+            values.append(TailCall(func, args))
+            return
+        memo = func.memo
+        key = None
+        if memo is not None:
+            key, ans = memo.lookup(args)
+            if ans is not MISSING:
+                values.append(ans)
+                return
+        start(func, args, memo, key)
+
+    def start(func, args, memo, key):
+        funcFrame = func.call_frame()
+        funcFrame[1:len(args) + 1] = args
+        todo.append((ret, (func, memo, key), funcFrame))
+        statements(func.node.funcBody, funcFrame)
+
+    def ret(call, funcFrame):
+        func, memo, key = call
+        ans = values[-1]
+        if type(ans) is TailCall:
+            values.pop()
+            start(ans.func, ans.args, memo, key)
+        elif memo is not None:
+            memo.store(key, ans)
+
+    # ===== STATEMENTS =====
+
+    def statements(node, frame):
+        stmts = node.statements
+        if not stmts:
+            values.append(None)
+            return
+        end = len(todo)
+        for i in range(len(stmts) - 1, 0, -1):
+            push(stmts[i], frame)
+            todo.append((stop, end, None) if node.signals else (drop, None, None))
+        push(stmts[0], frame)
+
+    def stop(end, _):
+        """After a statement of a block in a loop body: a breakout or moveon ends the block."""
+        if values[-1] is BREAKOUT_SIGNAL or values[-1] is MOVEON_SIGNAL:
+            del todo[end:]
+        else:
+            values.pop()
+
+    def if_(node, frame):
+        todo.append((branch, node, frame))
+        push(node.c, frame)
+
+    def branch(node, frame):
+        if values.pop():
+            push(node.t, frame)
+        elif node.e is not None:
+            push(node.e, frame)
+        else:
+            values.append(None)
+
+    def display(node, frame):
+        children(show, "", None, frame, (node.val,))
+
+    def displayl(node, frame):
+        children(show, "\n", None, frame, (node.val,))
+
+    def show(end, _):
+        values[-1] = print(values[-1], end=end)
+
+    def var_bind(node, frame):
+        children(store, frame, node.slot, frame, (node.val,))
+
+    def assign(node, frame):
+        children(store, outer(frame, node.depth), node.slot, frame, (node.val,))
+
+    def store(owner, slot):
+        owner[slot] = values[-1]
+
+    def compound(node, frame):
+        owner = outer(frame, node.depth)
+        todo.append((store, owner, node.slot))
+        binop(BinOp(node.op[0], Number(owner[node.slot]), node.val), frame)
+
+    # ===== ARRAYS AND HASHES =====
+    # The container is read before anything is evaluated, as in e().
+
+    def container(node, frame):
+        return outer(frame, node.depth)[node.slot]
+
+    def push_front(node, frame):
+        children(insert_front, container(node, frame), None, frame, (node.val,))
+
+    def insert_front(arr, _):
+        arr.insert(0, values[-1])
+        values[-1] = arr
+
+    def push_back(node, frame):
+        children(append, container(node, frame), None, frame, (node.val,))
+
+    def append(arr, _):
+        arr.append(values[-1])
+        values[-1] = arr
+
+    def pop_front_(node, frame):
+        values.append(pop_front(container(node, frame), node.xname))
+
+    def pop_back_(node, frame):
+        values.append(pop_back(container(node, frame), node.xname))
+
+    def get_length(node, frame):
+        values.append(len(container(node, frame)))
+
+    def clear_array(node, frame):
+        arr = container(node, frame)
+        arr.clear()
+        values.append(arr)
+
+    def insert_at(node, frame):
+        children(insert, container(node, frame), None, frame, (node.index, node.val))
+
+    def insert(arr, _):
+        value = values.pop()
+        arr.insert(values[-1], value)
+        values[-1] = arr
+
+    def remove_at_(node, frame):
+        children(remove, container(node, frame), node.xname, frame, (node.index,))
+
+    def remove(arr, name):
+        values[-1] = remove_at(arr, values[-1], name)
+
+    def call_item(node, frame):
+        children(item, container(node, frame), None, frame, (node.index if type(node) is CallArr else node.key,))
+
+    def item(items, _):
+        values[-1] = items[values[-1]]
+
+    def assign_item(node, frame):
+        todo.append((store_item, node, frame))
+        push(node.val, frame)
+
+    def store_item(node, frame):
+        children(stored_item, container(node, frame), None, frame, (node.index,))
+
+    def stored_item(arr, _):
+        index = values.pop()
+        arr[index] = values[-1]
+
+    def add_pair(node, frame):
+        children(put, container(node, frame), False, frame, (node.val, node.key))
+
+    def assign_val(node, frame):
+        children(put, container(node, frame), True, frame, (node.new_val, node.key))
+
+    def put(hash_table, keep_value):
+        key = values.pop()
+        hash_table[key] = values[-1]
+        if not keep_value:
+            values[-1] = None
+
+    def remove_pair(node, frame):
+        children(remove_hash_key, container(node, frame), node.name, frame, (node.key,))
+
+    def remove_hash_key(hash_table, name):
+        remove_key(hash_table, values[-1], name)
+        values[-1] = None
+
+    # ===== LOOPS =====
+
+    def body(node, frame, base):
+        """Run the body of loop `node`, whose next iteration is the entry at `base`."""
+        after = (check, base, None) if node.signals else (drop, None, None)
+        for stmt in reversed(node.body.statements):
+            todo.append(after)
+            push(stmt, frame)
+
+    def check(base, _):
+        result = values.pop()
+        if result is BREAKOUT_SIGNAL:
+            del todo[base:]
+            values.append(None)
+        elif result is MOVEON_SIGNAL:
+            del todo[base + 1:]
+
+    def while_loop(node, frame):
+        todo.append((while_test, node, frame))
+        push(node.condition, frame)
+
+    def while_test(node, frame):
+        if values.pop():
+            base = len(todo)
+            todo.append((while_loop, node, frame))
+            body(node, frame, base)
+        else:
+            values.append(None)
+
+    def for_loop(node, frame):
+        todo.append((for_cond, node, frame))
+        todo.append((drop, None, None))
+        push(node.initialization, frame)
+
+    def for_cond(node, frame):
+        todo.append((for_test, node, frame))
+        push(node.condition, frame)
+
+    def for_test(node, frame):
+        if values.pop():
+            base = len(todo)
+            todo.append((for_next, node, frame))
+            body(node, frame, base)
+        else:
+            values.append(None)
+
+    def for_next(node, frame):
+        todo.append((for_cond, node, frame))
+        todo.append((drop, None, None))
+        push(node.increment, frame)
+
+    def breakout(node, frame):
+        values.append(BREAKOUT_SIGNAL)
+
+    def moveon(node, frame):
+        values.append(MOVEON_SIGNAL)
+
+    HANDLERS = {
+        Number: constant, String: constant, Boolean: constant, Variable: variable,
+        BinOp: binop, UnaryOp: unaryop, Feed: feed, Array: array, Hash: hash_,
+        FuncDef: func_def, FuncCall: func_call, Statements: statements, If: if_,
+        Display: display, DisplayL: displayl, VarBind: var_bind, AssignToVar: assign,
+        CompoundAssignment: compound, PushFront: push_front, PushBack: push_back,
+        PopFront: pop_front_, PopBack: pop_back_, GetLength: get_length, ClearArray: clear_array,
+        InsertAt: insert_at, RemoveAt: remove_at_, CallArr: call_item, CallHashVal: call_item,
+        AssigntoArr: assign_item, AddHashPair: add_pair, RemoveHashPair: remove_pair,
+        AssignHashVal: assign_val, WhileLoop: while_loop, ForLoop: for_loop,
+        BreakOut: breakout, MoveOn: moveon,
+    }
+
+    def handler(cls):
+        """The handler of a node type, found through its bases as a `case` would."""
+        for base in cls.__mro__[1:]:
+            if base in HANDLERS:
+                HANDLERS[cls] = HANDLERS[base]
+                return HANDLERS[cls]
+        return nothing  # None, Break, AssignFullArray: e() gives None
+
+    return evaluate
+
+
+def run(program):
+    lines, _ = program
+    machine()(lines, new_frame(lines.frame_size, None, lines.hoisted))
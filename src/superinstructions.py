@@ -0,0 +1,127 @@
+from collections import Counter
+
+from bytecode_gen import *
+from peephole import Peephole, optimize, code_objects
+
+# ==========================================================================================
+# ==================================== SUPERINSTRUCTIONS ===================================
+# Runs after the peephole optimizer and fuses the shapes the loops of the Euler scripts
+# spend their time in into one instruction each, so the VM dispatches once instead of
+# four to six times:
+#   LOAD s, PUSH_CONST k, ADD, ASSIGN s                    -> INC_LOCAL (s, k)       i += 1
+#   LOAD s, PUSH_CONST k, SUB, ASSIGN s                    -> DEC_LOCAL (s, k)       i -= 1
+#   LOAD s, LOAD t, ADD, ASSIGN s                          -> ADD_LOCAL (s, t)       x = x + y
+#   LOAD s, PUSH_CONST k, <compare>, JUMP_IF_FALSE t       -> LOAD_LOCAL_CMP_CONST_JUMP (s, op, k, t)
+#   LOAD s, LOAD u, <compare>, JUMP_IF_FALSE t             -> LOAD_LOCAL_CMP_LOCAL_JUMP (s, op, u, t)
+#   LOAD s, PUSH_CONST k | LOAD d, MOD, PUSH_CONST 0, EQ,
+#   JUMP_IF_FALSE t                                        -> MOD_EQ_ZERO_JUMP (s, d or 0, k, t)
+# The operands go into the constant pool as a tuple and the instruction's argument is its
+# index; slot 0 (the static link) is never a variable, so MOD_EQ_ZERO_JUMP uses it to say
+# the divisor is the constant. `profile` counts which sequences a corpus actually runs.
+
+STEPS = (int, float)  # bool is an int
+
+
+class Fuser(Peephole):
+    def rewrite(self, instrs, i):
+        ops = tuple(op for op, _ in instrs[i:i + 6])
+        args = [arg for _, arg in instrs[i:i + 6]]
+        if not ops or ops[0] != LOAD:
+            return None
+        slot, consts = args[0], self.consts
+        if ops[1:] in ((PUSH_CONST, MOD, PUSH_CONST, EQ, JUMP_IF_FALSE), (LOAD, MOD, PUSH_CONST, EQ, JUMP_IF_FALSE)) \
+                and self.zero(args[3]):
+            divisor = (args[1], None) if ops[1] == LOAD else (0, consts[args[1]])
+            return [[MOD_EQ_ZERO_JUMP, (slot, *divisor, args[5])]], 6
+        if ops[1:4] in ((PUSH_CONST, ADD, ASSIGN), (PUSH_CONST, SUB, ASSIGN)) and args[3] == slot \
+                and type(consts[args[1]]) in STEPS:
+            return [[INC_LOCAL if ops[2] == ADD else DEC_LOCAL, (slot, consts[args[1]])]], 4
+        if ops[1:4] == (LOAD, ADD, ASSIGN) and args[3] == slot:
+            return [[ADD_LOCAL, (slot, args[1])]], 4
+        if len(ops) >= 4 and ops[2] in COMPARISONS and ops[3] == JUMP_IF_FALSE:
+            if ops[1] == PUSH_CONST:
+                return [[LOAD_LOCAL_CMP_CONST_JUMP, (slot, ops[2], consts[args[1]], args[3])]], 4
+            if ops[1] == LOAD:
+                return [[LOAD_LOCAL_CMP_LOCAL_JUMP, (slot, ops[2], args[1], args[3])]], 4
+        return None
+
+    def zero(self, index):
+        return type(self.consts[index]) is int and self.consts[index] == 0
+
+
+def fuse(code_object):
+    """Fuse the instructions of `code_object` in place; returns how many instructions that
+    removed."""
+    return optimize(code_object, Fuser)
+
+
+def fuse_program(program, top):
+    """Fuse every code object of `program`; returns [(name, saved)]."""
+    return [(code_object.name, fuse(code_object)) for code_object in code_objects(program, top)]
+
+
+# ===== PROFILE =====
+# Runs programs on the stack VM with every handler wrapped to count the opcode sequences
+# executed back to back. A taken jump, a call and a return end a sequence, since a fused
+# instruction can only cover straight-line code. By default the code is fused first, so
+# what it lists is what the existing superinstructions leave on the table.
+
+def profile(programs, lengths=(2, 3, 4), fused=True):
+    """Counter of (opcode names) -> times executed, over the sequences of `lengths`."""
+    import bytecode_eval
+
+    counts, recent = Counter(), []
+    longest = max(lengths)
+
+    def counting(opcode, handler):
+        def run(stack, push, pop, frame, consts, arg):
+            recent.append(OPNAMES[opcode])
+            del recent[:-longest]
+            for n in lengths:
+                if len(recent) >= n:
+                    counts[tuple(recent[-n:])] += 1
+            result = handler(stack, push, pop, frame, consts, arg)
+            if result is not None or opcode in (FUNC_CALL, TAIL_CALL, RETURN):
+                recent.clear()
+            return result
+        return run
+
+    original = bytecode_eval.HANDLERS[:]
+    bytecode_eval.HANDLERS[:] = [counting(opcode, handler) for opcode, handler in enumerate(original)]
+    try:
+        for program in programs:
+            code = codegen(program)
+            for code_object in code_objects(program, code):
+                optimize(code_object)
+                if fused:
+                    fuse(code_object)
+            bytecode_eval.execute_bytecode(code, bytecode_eval.new_frame(program[0].frame_size, None, program[0].hoisted))
+    finally:
+        bytecode_eval.HANDLERS[:] = original
+    return counts
+
+
+def candidates(counts, top=20):
+    """The `top` sequences by dispatches a fused instruction would save: (saved, count, ops)."""
+    ranked = sorted(((count * (len(ops) - 1), count, ops) for ops, count in counts.items()), reverse=True)
+    return ranked[:top]
+
+
+if __name__ == "__main__":
+    import sys
+    import contextlib
+    import io
+    from resolver import resolve
+
+    paths = [arg for arg in sys.argv[1:] if arg != "--unfused"]
+    if not paths:
+        print("usage: python superinstructions.py [--unfused] FILE.nx...")
+        sys.exit(1)
+    programs = [resolve(parse(open(path).read())) for path in paths]
+    with contextlib.redirect_stdout(io.StringIO()):  # the programs' own output
+        counts = profile(programs, fused="--unfused" not in sys.argv)
+    total = sum(count for ops, count in counts.items() if len(ops) == 2)
+    print(f"{'saved':>10} {'count':>10}  sequence")
+    for saved, count, ops in candidates(counts):
+        print(f"{saved:>10} {count:>10}  {' '.join(ops)}")
+    print(f"({total} instruction pairs executed)")
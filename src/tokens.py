@@ -32,6 +32,7 @@ keyword_tokens = (
     "char",
     "fn",
     "fnrec",
+    "fnmemo",
     "or",
     "not",
     "and",
@@ -0,0 +1,494 @@
+import functools
+import math
+import re
+from types import FunctionType
+
+from parser import *
+from runtime import *
+from optimizer import may_signal, known_functions
+import closure_compiler
+
+# ==========================================================================================
+# ==================================== TRANSPILER ==========================================
+# A backend that translates a resolved program into Python source and runs it with
+# compile()/exec(). Every Nexus frame becomes a Python function (the global frame is
+# `nexus_main`) and every slot a local of it, named `<name>_<level>_<slot>`; names from
+# enclosing frames become closure variables, declared `nonlocal` where they are assigned.
+# Functions are hoisted as nested `def`s, loops become `while` loops, arrays lists and
+# hashes dicts. The `def` of an fnmemo function is wrapped by runtime.memoized.
+#
+# Statement values follow the tree-walker: a function returns the value of its last
+# statement, and a loop stops or skips ahead when one of its body statements, or of the
+# blocks and if branches in its body, evaluates to BreakOut or MoveOn. Statements are
+# emitted towards a sink that says what happens to their value: dropped, returned,
+# stored, printed or checked by the enclosing loop.
+# Programs the translation does not cover run on the closure compiler instead.
+
+BINARY_OPS = {"+", "*", "-", "/", "<", ">", "==", "!=", "<=", ">=", "%", "and", "or",
+              "&", "|", "^", "<<", ">>"}
+
+
+class Untranslatable(Exception):
+    pass
+
+
+# Expression forms of the statements that mutate arrays and hashes; arguments are
+# evaluated in the same order as in the tree-walker.
+def push_front(arr, value):
+    arr.insert(0, value)
+    return arr
+
+
+def push_back(arr, value):
+    arr.append(value)
+    return arr
+
+
+def clear_array(arr):
+    arr.clear()
+    return arr
+
+
+def insert_at(arr, index, value):
+    arr.insert(index, value)
+    return arr
+
+
+def assign_item(value, arr, index):
+    arr[index] = value
+    return value
+
+
+def add_pair(hash_table, value, key):
+    hash_table[key] = value
+
+
+def assign_val(hash_table, value, key):
+    hash_table[key] = value
+    return hash_table[key]
+
+
+# Calls evaluate their arguments in order and then go on as on the other backends:
+# arguments past a function's parameters are dropped, too few of them are an IndexError.
+# `f(a, *dropped(b))` and too_few() are for a call by a name that only ever holds one
+# function, call_value() for a function value whose definition the translation does not see.
+def dropped(*args):
+    return ()
+
+
+def too_few(*args):
+    raise IndexError("list index out of range")
+
+
+def call_value(name, func, *args):
+    if not isinstance(func, FunctionType):
+        raise ValueError(f"Function {name} is not defined correctly.")
+    count = getattr(func, "__wrapped__", func).__code__.co_argcount
+    if len(args) < count:
+        too_few()
+    return func(*args[:count])
+
+
+NAMESPACE = {
+    "BREAKOUT_SIGNAL": BREAKOUT_SIGNAL, "MOVEON_SIGNAL": MOVEON_SIGNAL, "nexus_pow": nexus_pow,
+    "pop_front": pop_front, "pop_back": pop_back, "remove_at": remove_at, "remove_key": remove_key,
+    "push_front": push_front, "push_back": push_back, "clear_array": clear_array,
+    "insert_at": insert_at, "assign_item": assign_item, "add_pair": add_pair, "assign_val": assign_val,
+    "memoized": memoized, "dropped": dropped, "too_few": too_few, "call_value": call_value,
+}
+
+
+# ==================================== SINKS ===============================================
+
+def signal_code(tree):
+    """Code for the value of a breakout or moveon."""
+    return "BREAKOUT_SIGNAL" if isinstance(tree, BreakOut) else "MOVEON_SIGNAL"
+
+
+class Discard:
+    def ignores(self, tree):
+        return True
+
+    def value(self, t, code, tree):
+        if not (code.isidentifier() or code == "None"):
+            t.emit(code)
+
+    def none(self, t):
+        pass
+
+    def signal(self, t, tree):
+        pass
+
+
+class Return:
+    def ignores(self, tree):
+        return False
+
+    def value(self, t, code, tree):
+        t.emit(f"return {code}")
+
+    def none(self, t):
+        t.emit("return None")
+
+    def signal(self, t, tree):
+        t.emit(f"return {signal_code(tree)}")
+
+
+class Assign:
+    def ignores(self, tree):
+        return False
+
+    def __init__(self, target):
+        self.target = target
+
+    def value(self, t, code, tree):
+        t.emit(f"{self.target} = {code}")
+
+    def none(self, t):
+        t.emit(f"{self.target} = None")
+
+    def signal(self, t, tree):
+        t.emit(f"{self.target} = {signal_code(tree)}")
+
+
+class Print:
+    def ignores(self, tree):
+        return False
+
+    def __init__(self, end):
+        self.end = end
+
+    def value(self, t, code, tree):
+        t.emit(f"print({code}{self.end})")
+
+    def none(self, t):
+        t.emit(f"print(None{self.end})")
+
+    def signal(self, t, tree):
+        t.emit(f"print({signal_code(tree)}{self.end})")
+
+
+class Loop:
+    """Top-level statements of a loop body; `incr` is the for loop's increment."""
+    def __init__(self, incr=None):
+        self.incr = incr
+
+    def ignores(self, tree):
+        return not may_signal(tree)
+
+    def value(self, t, code, tree):
+        if self.ignores(tree):
+            DISCARD.value(t, code, tree)
+            return
+        if not code.isidentifier():
+            t.emit(f"_r = {code}")
+            code = "_r"
+        t.emit(f"if {code} is BREAKOUT_SIGNAL:")
+        t.emit("    break")
+        t.emit(f"if {code} is MOVEON_SIGNAL:")
+        t.indent += 1
+        self.next(t)
+        t.indent -= 1
+
+    def none(self, t):
+        pass
+
+    def signal(self, t, tree):
+        if isinstance(tree, BreakOut):
+            t.emit("break")
+        else:
+            self.next(t)
+
+    def next(self, t):
+        if self.incr is not None:
+            t.stmt(self.incr, DISCARD)
+        t.emit("continue")
+
+
+DISCARD = Discard()
+RETURN = Return()
+
+
+# ==================================== TRANSLATION =========================================
+
+class Frame:
+    """The Python function being generated for one Nexus frame."""
+    def __init__(self, body):
+        self.body = id(body)  # what known_functions() tells the frame by
+        self.params = []
+        self.locals = {}      # every local the body uses, in first-use order
+        self.nonlocals = {}   # enclosing frames' locals the body assigns
+
+
+class Transpiler:
+    def __init__(self, memos, functions):
+        self.functions = functions  # (id(body), slot) -> FuncDef, from known_functions()
+        self.frames = []  # enclosing frames, index == nesting level
+        self.out = []     # (indent, line) of the function being generated
+        self.indent = 0
+        self.memos = memos  # MemoStats of the fnmemo functions, MEMOS in the source
+
+    def emit(self, line):
+        self.out.append((self.indent, line))
+
+    def ident(self, name, depth, slot, store=False):
+        level = len(self.frames) - 1 - depth
+        name = f"{re.sub(r'[^A-Za-z0-9]', '_', name)}_{level}_{slot}"
+        self.frames[level].locals.setdefault(name)
+        if store and depth:
+            self.frames[-1].nonlocals.setdefault(name)
+        return name
+
+    def function(self, name, params, hoisted, body, tail):
+        """Lines of `def name(params)` running `body` in a new frame, def at indent 0."""
+        frame = Frame(body)
+        self.frames.append(frame)
+        out, indent = self.out, self.indent
+        self.out, self.indent = [], 1
+        frame.params = [self.ident(p, 0, i + 1) for i, p in enumerate(params)]
+        for funcDef in hoisted:
+            self.define(funcDef)
+        self.stmt(body, tail)
+        lines = self.out
+        self.frames.pop()
+        self.out, self.indent = out, indent
+
+        head = [(0, f"def {name}({', '.join(frame.params)}):")]
+        if frame.nonlocals:
+            head.append((1, f"nonlocal {', '.join(frame.nonlocals)}"))
+        slots = [local for local in frame.locals if local not in frame.params]
+        if slots:  # unassigned slots read as None, as in a fresh frame
+            head.append((1, " = ".join(slots) + " = None"))
+        return head + (lines or [(1, "pass")])
+
+    def define(self, funcDef):
+        name = self.ident(funcDef.funcName, 0, funcDef.slot)
+        lines = self.function(name, funcDef.funcParams, funcDef.hoisted, funcDef.funcBody, RETURN)
+        self.out.extend((self.indent + indent, line) for indent, line in lines)
+        if funcDef.memo is not None:
+            self.emit(f"{name} = memoized({name}, MEMOS[{len(self.memos)}])")
+            self.memos.append(funcDef.memo)
+
+    def block(self, body, sink):
+        """Emit `body` one level deeper, never leaving the block empty."""
+        self.indent += 1
+        start = len(self.out)
+        self.stmt(body, sink)
+        if len(self.out) == start:
+            self.emit("pass")
+        self.indent -= 1
+
+    def loop_body(self, body, sink):
+        self.indent += 1
+        start = len(self.out)
+        for stmt in body.statements:  # each one checked for BreakOut / MoveOn
+            self.stmt(stmt, sink)
+        if sink.incr is not None:
+            self.stmt(sink.incr, DISCARD)
+        if len(self.out) == start:
+            self.emit("pass")
+        self.indent -= 1
+
+    def stmt(self, tree, sink):
+        match tree:
+            case Statements(statements):
+                if not statements:
+                    sink.none(self)
+                for stmt in statements[:-1]:  # in a loop body, any of them may break out
+                    self.stmt(stmt, sink if isinstance(sink, Loop) else DISCARD)
+                if statements:
+                    self.stmt(statements[-1], sink)
+            case If(cond, then_body, else_body, _):
+                self.emit(f"if {self.expr(cond)}:")
+                self.block(then_body, sink)
+                start = len(self.out)
+                self.emit("else:")
+                self.block(else_body, sink)
+                if self.out[start + 1:] == [(self.indent + 1, "pass")]:
+                    del self.out[start:]
+            case WhileLoop(cond, body, _):
+                self.emit(f"while {self.expr(cond)}:")
+                self.loop_body(body, Loop())
+                sink.none(self)
+            case ForLoop(init, cond, incr, body, _):
+                self.stmt(init, DISCARD)
+                self.emit(f"while {self.expr(cond)}:")
+                self.loop_body(body, Loop(incr))
+                sink.none(self)
+            case None | Break() | FuncDef():  # functions are already defined: hoisted
+                sink.none(self)
+            case BreakOut() | MoveOn():
+                sink.signal(self, tree)
+            case VarBind(name, _, value, _):
+                target = self.ident(name, 0, tree.slot)
+                self.stmt(value, Assign(target))
+                sink.value(self, target, value)
+            case AssignToVar(name, value):
+                target = self.ident(name, tree.depth, tree.slot, store=True)
+                self.stmt(value, Assign(target))
+                sink.value(self, target, value)
+            case Display(val):
+                self.stmt(val, Print(', end=""'))
+                sink.none(self)
+            case DisplayL(val):
+                self.stmt(val, Print(""))
+                sink.none(self)
+            case CompoundAssignment(name, op, value) if sink.ignores(tree):
+                target = self.ident(name, tree.depth, tree.slot, store=True)
+                self.emit(f"{target} = {self.binop(op[0], target, self.expr(value))}")
+            case AssigntoArr(name, index, value) if sink.ignores(tree):
+                arr = self.ident(name, tree.depth, tree.slot)
+                self.emit(f"{arr}[{self.expr(index)}] = {self.expr(value)}")
+            case AssignHashVal(name, key, value) | AddHashPair(name, key, value) if sink.ignores(tree):
+                hash_table = self.ident(name, tree.depth, tree.slot)
+                self.emit(f"{hash_table}[{self.expr(key)}] = {self.expr(value)}")
+            case PushBack(name, value) if sink.ignores(tree):
+                self.emit(f"{self.ident(name, tree.depth, tree.slot)}.append({self.expr(value)})")
+            case _:
+                sink.value(self, self.expr(tree), tree)
+
+    def binop(self, op, l, r):
+        match op:
+            case "**":
+                return f"nexus_pow({l}, {r})"
+            case "÷":
+                return f"({l} / {r})"
+            case _ if op in BINARY_OPS:
+                return f"({l} {op} {r})"
+            case _:
+                return "None"
+
+    def expr(self, tree) -> str:
+        match tree:
+            case None | Break() | FuncDef():
+                return "None"
+            case Number(float(v)) if not math.isfinite(v):  # inf and nan have no literal
+                return f"float({str(v)!r})"
+            case Number(v) if v < 0:
+                return f"({v!r})"
+            case Number(v) | String(v) | Boolean(v):
+                return repr(v)
+            case Variable(name):
+                return self.ident(name, tree.depth, tree.slot)
+            case Array(val):
+                return f"[{', '.join(self.expr(x) for x in val)}]"
+            case Hash(val):
+                return "{" + ", ".join(f"{self.expr(k)}: {self.expr(v)}" for k, v in val) + "}"
+
+            case BinOp("not", l, _) | UnaryOp("not" | "!", l):
+                return f"(not {self.expr(l)})"
+            case BinOp("~", l, _) | UnaryOp("~", l):
+                return f"(~{self.expr(l)})"
+            case BinOp(op, l, r):
+                if op not in BINARY_OPS | {"÷", "**"}:
+                    return "None"
+                return self.binop(op, self.expr(l), self.expr(r))
+            case UnaryOp("ascii", val):
+                return f"ord({self.expr(val)})"
+            case UnaryOp("char", val):
+                return f"chr({self.expr(val)})"
+            case UnaryOp():
+                return "None"
+            case Feed(msg):
+                return f"input({self.expr(msg)})"
+
+            case FuncCall(name, funcArgs):
+                func = self.ident(name, tree.depth, tree.slot)
+                args = [self.expr(arg) for arg in funcArgs]
+                level = len(self.frames) - 1 - tree.depth
+                funcDef = self.functions.get((self.frames[level].body, tree.slot))
+                if funcDef is None:  # a function value, or not: known when called
+                    return f"call_value({', '.join([repr(name), func] + args)})"
+                count = len(funcDef.funcParams)
+                if len(args) < count:
+                    return f"too_few({', '.join(args)})"
+                if len(args) > count:
+                    args[count:] = [f"*dropped({', '.join(args[count:])})"]
+                return f"{func}({', '.join(args)})"
+
+            case Statements(statements):
+                if not statements:
+                    return "None"
+                if len(statements) == 1:
+                    return self.expr(statements[0])
+                # `(s or True) and ...` runs s and goes on whatever its value: no tuple to build
+                firsts = " and ".join(f"({self.expr(stmt)} or True)" for stmt in statements[:-1])
+                return f"({firsts} and {self.expr(statements[-1])})"
+            case If(cond, then_body, else_body, _):
+                return f"({self.expr(then_body)} if {self.expr(cond)} else {self.expr(else_body)})"
+
+            case Display(val):
+                return f'print({self.expr(val)}, end="")'
+            case DisplayL(val):
+                return f"print({self.expr(val)})"
+
+            case VarBind(name, _, value, _):
+                return f"({self.ident(name, 0, tree.slot)} := {self.expr(value)})"
+            case AssignToVar(name, value):
+                return f"({self.ident(name, tree.depth, tree.slot, store=True)} := {self.expr(value)})"
+            case CompoundAssignment(name, op, value):
+                target = self.ident(name, tree.depth, tree.slot, store=True)
+                return f"({target} := {self.binop(op[0], target, self.expr(value))})"
+
+            case BreakOut() | MoveOn():
+                return signal_code(tree)
+
+            case PushFront(name, value):
+                return f"push_front({self.ident(name, tree.depth, tree.slot)}, {self.expr(value)})"
+            case PushBack(name, value):
+                return f"push_back({self.ident(name, tree.depth, tree.slot)}, {self.expr(value)})"
+            case PopFront(name):
+                return f"pop_front({self.ident(name, tree.depth, tree.slot)}, {name!r})"
+            case PopBack(name):
+                return f"pop_back({self.ident(name, tree.depth, tree.slot)}, {name!r})"
+            case GetLength(name):
+                return f"len({self.ident(name, tree.depth, tree.slot)})"
+            case ClearArray(name):
+                return f"clear_array({self.ident(name, tree.depth, tree.slot)})"
+            case InsertAt(name, index, value):
+                arr = self.ident(name, tree.depth, tree.slot)
+                return f"insert_at({arr}, {self.expr(index)}, {self.expr(value)})"
+            case RemoveAt(name, index):
+                return f"remove_at({self.ident(name, tree.depth, tree.slot)}, {self.expr(index)}, {name!r})"
+            case CallArr(name, index) | CallHashVal(name, index):
+                return f"{self.ident(name, tree.depth, tree.slot)}[{self.expr(index)}]"
+            case AssigntoArr(name, index, value):
+                arr = self.ident(name, tree.depth, tree.slot)
+                return f"assign_item({self.expr(value)}, {arr}, {self.expr(index)})"
+            case AddHashPair(name, key, value):
+                hash_table = self.ident(name, tree.depth, tree.slot)
+                return f"add_pair({hash_table}, {self.expr(value)}, {self.expr(key)})"
+            case RemoveHashPair(name, key):
+                return f"remove_key({self.ident(name, tree.depth, tree.slot)}, {self.expr(key)}, {name!r})"
+            case AssignHashVal(name, key, value):
+                hash_table = self.ident(name, tree.depth, tree.slot)
+                return f"assign_val({hash_table}, {self.expr(value)}, {self.expr(key)})"
+
+            case _:  # loops have no expression form
+                raise Untranslatable(type(tree).__name__)
+
+
+def transpile(program, memos=None) -> str:
+    """Python source of a resolved program; calling its `nexus_main()` runs it, with the
+    MemoStats of its fnmemo functions, appended to `memos`, as MEMOS."""
+    lines, _ = program
+    t = Transpiler([] if memos is None else memos, known_functions(lines))
+    source = t.function("nexus_main", (), lines.hoisted, lines, DISCARD)
+    return "\n".join("    " * indent + line for indent, line in source) + "\n"
+
+
+@functools.lru_cache(maxsize=256)
+def compile_source(source):
+    """Code object for `source`; cached so a program run again skips compile()."""
+    return compile(source, "<nexus>", "exec")
+
+
+def run(program):
+    memos = []
+    try:
+        source = transpile(program, memos)
+    except Untranslatable:
+        return closure_compiler.run(program)
+    namespace = dict(NAMESPACE, MEMOS=memos)
+    exec(compile_source(source), namespace)
+    namespace["nexus_main"]()
@@ -21,6 +21,6 @@ def test_arithmetic_operations(expression, expected, capfd):
     captured = capfd.readouterr()
     assert captured.out.strip() == expected
 
-    # execute_all(f"displayl({expression})")
-    # captured_all = capfd.readouterr()
-    # assert captured_all.out.strip() == expected
+    execute_all(f"displayl({expression})")
+    captured_all = capfd.readouterr()
+    assert captured_all.out.strip() == expected
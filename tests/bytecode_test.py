@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from bytecode_eval import execute_all
+from bytecode_gen import *
+
+programs = [
+    """
+    var total = 0;
+    var i = 0;
+    while (i < 10) {
+        i += 1;
+        if i % 2 == 0 then moveon end;
+        if i > 7 then breakout end;
+        total += i;
+    };
+    for (var j = 0; j < 5; j += 1) { if j == 1 then moveon end; total *= 2; };
+    displayl total;
+    """,
+    """
+    fnrec gcd(a, b) { if b == 0 then a else gcd(b, a % b) end; };
+    fn mk(a) { fn add(b) { a + b; }; add; };
+    var ten = mk(10);
+    fn stop(x) { breakout; };
+    var n = 0;
+    while (n < 10) { n += 1; if n == 4 then stop(n) else n end; };
+    displayl gcd(1071, 462) + ten(n);
+    """,
+    """
+    var arr = [3, 1, 2];
+    var h = {"a": 1, "b": 2};
+    arr.PushFront(0);
+    arr.Insert(2, 9);
+    arr[0] = arr.PopBack + arr.Length;
+    arr.Remove(1);
+    h.Add("c", 3);
+    h["a"] = h["b"] * 10;
+    h.Remove("b");
+    displayl arr;
+    displayl h;
+    """,
+    """
+    var x = 0;
+    displayl (x == 0) or (1 / x);
+    displayl (x != 0) and (1 / x);
+    displayl if x then "yes" else "no" end;
+    displayl 2 ** 10 ÷ 4;
+    displayl 6 ^ 3;
+    """,
+]
+
+
+@pytest.mark.parametrize("prog", programs)
+def test_vm_matches_tree_walker(prog, capfd):
+    execute(prog, backend="tree")
+    expected = capfd.readouterr().out
+    execute_all(prog)
+    assert capfd.readouterr().out == expected
+
+
+def test_jumps_point_at_instructions():
+    code = codegen(resolve(parse("""
+    var i = 0;
+    while (i < 3) { if i == 1 then breakout end; i += 1; };
+    """))).code
+    starts = {ip for ip, _, _ in instructions(code)}
+    ops = [(op, arg) for _, op, arg in instructions(code)]
+    assert LABEL not in [op for op, _ in ops]
+    assert all(arg in starts for op, arg in ops if op in JUMPS)
+    assert ops[-1][0] == HALT
+
+
+def test_function_bodies_return_their_last_value():
+    lines, _ = program = resolve(parse("fn twice(x) { x; x * 2; };"))
+    codegen(program)
+    body = lines.hoisted[0].bytecode
+    ops = [op for _, op, _ in instructions(body.code)]
+    assert body.name == "twice"
+    assert ops[-2:] == [MUL, RETURN] and POP in ops
+
+
+def test_constants_are_pooled_per_function():
+    lines, _ = program = resolve(parse("""
+    fn greet(n) { displayl "héllo"; n * 2.5 + 1; };
+    displayl "héllo";
+    displayl 1; displayl 1.0; displayl True; displayl 1;
+    """))
+    top = codegen(program)
+    body = lines.hoisted[0].bytecode
+    assert top.code.typecode == "i" and len(top.code) % 2 == 0
+    assert [c for c in top.consts if not isinstance(c, FuncDef)] == ["héllo", 1, 1.0, True]
+    assert body.consts == ["héllo", 2.5, 1]
+    pushed = [body.consts[arg] for _, op, arg in instructions(body.code) if op == PUSH_CONST]
+    assert pushed == ["héllo", 2.5, 1]
+
+
+def test_vm_errors_match_the_tree_walker():
+    with pytest.raises(IndexError, match="Cannot PopBack from an empty array: arr"):
+        execute_all("var arr = []; arr.PopBack;")
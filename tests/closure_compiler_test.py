@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from closure_compiler import Compiler
+
+programs = [
+    """
+    var total = 0;
+    for (var i = 0; i < 10; i += 1) {
+        if i == 3 then moveon end;
+        if i == 7 then breakout end;
+        total += i;
+    };
+    displayl total;
+    """,
+    """
+    fn mk(a) { fn add(b) { a + b; }; add; };
+    var ten = mk(10);
+    fnrec fact(n) { if n <= 1 then 1 else n * fact(n - 1) end; };
+    displayl ten(5) + fact(10);
+    """,
+    """
+    var arr = [1, 2, 3];
+    arr.PushBack(4);
+    arr.PushFront(0);
+    arr[2] = 20;
+    display arr.PopBack;
+    display arr.Length;
+    displayl arr;
+    """,
+    """
+    var x = 7;
+    x *= 3;
+    x %= 4;
+    displayl (-2) ** 3;
+    displayl x << 2 | 1;
+    displayl not (x == 1) or False;
+    """,
+]
+
+
+@pytest.mark.parametrize("prog", programs)
+def test_backends_agree(prog, capfd):
+    execute(prog, backend="tree")
+    expected = capfd.readouterr().out
+    execute(prog, backend="closure")
+    assert capfd.readouterr().out == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_raise_the_same_errors(backend):
+    with pytest.raises(IndexError, match="Cannot PopFront from an empty array: arr"):
+        execute("var arr = []; arr.PopFront;", backend=backend)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_assigned_keys_are_evaluated_once(backend, capfd):
+    execute("""fn k(x) { display x; x; }; var h = {1: 2}; var a = [0, 0];
+    h[k(1)] = k(3); displayl h; a[k(1)] = k(5); displayl a;
+    fn f() { h[k(2)] = k(4); }; displayl f();""", backend=backend)
+    assert capfd.readouterr().out == "31{1: 3}\n51[0, 5]\n424\n"
+
+
+def test_function_bodies_are_compiled_once():
+    lines, _ = resolve(parse("fn sq(x) { x * x; }; var a = sq(3);"))
+    compiler = Compiler()
+    stmts = compiler.body(lines)
+    sq = lines.statements[0]
+    assert len(stmts) == 2 and len(compiler.bodies) == 1
+    compiler.function(sq)
+    assert sq.compiled is compiler.bodies[id(sq.funcBody)]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        execute("displayl 1;", backend="jit")
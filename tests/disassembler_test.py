@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+import bytecode_eval
+from bytecode_gen import *
+import nxb
+from disassembler import dis, format_opstats
+
+prog = """var total = 0;
+fn add(a, b) { a + b; };
+for (var i = 0; i < 3; i += 1) {
+    total = add(total, i);
+};
+displayl total;
+"""
+
+
+def build(src=prog):
+    return nxb.build(resolve(parse(src, buffered=True), optimized=False))  # keeps the call to add
+
+
+def test_listing_shows_opcodes_operands_constants_and_source():
+    listing = dis(build(), prog)
+    assert listing.startswith("== <program> (")
+    assert "== add (" in listing
+    assert "    3| for (var i = 0; i < 3; i += 1) {" in listing
+    assert "unless slot 3 < 3: to 32" in listing
+    assert "FUNC_CALL" in listing and "add, 2 args" in listing
+    assert "<fn add> -> slot 2" in listing
+    assert "constants: 0: 0" in listing
+
+
+def test_listing_of_a_loaded_file_has_line_numbers(tmp_path):
+    nxb.compile_file(resolve(parse(prog, buffered=True), optimized=False), str(tmp_path / "p.nxb"))
+    listing = dis(nxb.load(str(tmp_path / "p.nxb")))
+    assert "    6|" in listing and "DISPLAYL" in listing
+
+
+def test_opstats_counts_every_execution(capfd):
+    compiled = build()
+    stats = bytecode_eval.OpStats()
+    plain = bytecode_eval.HANDLERS[FUNC_CALL]
+    bytecode_eval.run_profiled(compiled.code, new_frame(compiled.frame_size, None, compiled.hoisted), stats)
+    assert capfd.readouterr().out == "3\n"
+    assert bytecode_eval.HANDLERS[FUNC_CALL] is plain
+    assert stats.counts[FUNC_CALL] == 3
+    assert stats.counts[RETURN] == 3
+    assert stats.counts[LOAD_LOCAL_CMP_CONST_JUMP] == 4
+    _, counts, times = stats.code_objects[id(compiled.hoisted[0].bytecode)]
+    assert counts == [3] * len(counts)
+    assert sum(stats.times) == sum(sum(times) for _, _, times in stats.code_objects.values())
+    report = format_opstats(stats)
+    assert report.splitlines()[0].split() == ["opcode", "count", "total", "ms", "ns/exec", "time"]
+    assert "add" in report and "FUNC_CALL add, 2 args" in report
@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import re
+import pytest
+from lexer import *
+
+
+@pytest.mark.parametrize("prog", [
+    "var integer x = 3 + 7 - 1; display x;",
+    "x - 3",
+    "a-b",
+    "display -3 - 4",
+    "displayl (a * b) - a + (a % b);",
+    "f(2) - x",
+    "x -= 2; y = - x; z = - (3);",
+    "1.2.3 + 1.. ;",
+    "a**=2; b = 3**-2; c <<= 1; d >= e != f;",
+    "if x then -1 else 2 end;",
+    "var s = 'single' + \"double\";",
+    "/> line comment\n1 /~ block\ncomment ~/ + 2 /~ unterminated",
+    "arr.PushBack(4); h = {\"k\": [1, 2]}; breakout; moveon; break;",
+    "True and False or not x; integer decimal uinteger; 10 ÷ 2;",
+])
+def test_lex_matches_legacy(prog):
+    assert list(lex(prog)) == list(lex_legacy(prog))
+
+
+def test_lex_unary_minus_rewriting():
+    assert list(lex("x - y")) == [
+        VarToken("x"), OperatorToken("+"), NumberToken("-1"), OperatorToken("*"), VarToken("y")
+    ]
+    assert list(lex("-5 + 2")) == [NumberToken("-5"), OperatorToken("+"), NumberToken("2")]
+
+
+@pytest.mark.parametrize("prog, message", [
+    ("var a = 2++3;", "Invalid operator '++'"),
+    ("displayl 'open", "Expected '"),
+    ("var is_prime = 1;", "Unexpected character '_'"),
+])
+def test_lex_errors(prog, message):
+    with pytest.raises(SyntaxError, match=re.escape(message)):
+        list(lex(prog))
+
+
+@pytest.mark.parametrize("prog", [
+    "var integer x = 3 + 7 - 1; display x;",
+    "x - y; z = -  5; w = -(2); s = \"ab\" + 'c'; x -= 1;",
+    "/~ comment ~/ fn f(a, b) { a ** b; }; displayl f(2, 10);",
+])
+def test_token_buffer_matches_lex(prog):
+    buf = lex_buffer(prog)
+    assert [buf.token(i) for i in range(len(buf))] == list(lex(prog))
+    assert list(TokenCursor(buf)) == list(lex(prog))
+
+
+def test_token_buffer_lexemes_are_source_slices():
+    prog = "var name = 'text';\nx -42;"
+    buf = lex_buffer(prog)
+    assert buf.kinds[1] == VAR_KIND and buf.lexeme(1) == "name"
+    assert buf.kinds[3] == STRING_KIND and buf.lexeme(3) == "text"
+    assert buf.lexeme(7) == "-42" and buf.line(7) == 2
+    assert not buf.synthetic
+
+
+def test_token_cursor_peek_and_next():
+    cursor = TokenCursor(lex_buffer("a;"))
+    assert cursor.peek(None) == VarToken("a")
+    assert next(cursor) == VarToken("a")
+    assert next(cursor) == SemicolonToken()
+    assert cursor.peek(None) is None
+    with pytest.raises(StopIteration):
+        next(cursor)
+
+
+def test_token_cursor_reads_kinds_and_lexemes():
+    cursor = TokenCursor(lex_buffer("abc = abc + 42;"))
+    assert cursor.kind == VAR_KIND
+    first = cursor.take()
+    assert first == "abc" and cursor.peek(None) == OperatorToken("=")
+    cursor.advance()
+    assert cursor.take() is first  # one str per spelling, as lex() gives
+    cursor.advance()
+    assert cursor.kind == NUMBER_KIND and cursor.take() == "42"
+    cursor.advance()
+    assert cursor.kind == END_KIND and cursor.peek(None) is None
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from optimizer import nodes
+import nxb
+
+
+def loops(src):
+    lines, _ = resolve(parse(src))
+    return [node.signals for node in nodes(lines) if isinstance(node, (WhileLoop, ForLoop))]
+
+
+@pytest.mark.parametrize("src, marks", [
+    ("var i = 0; while (i < 3) { i += 1; displayl i; };", [False]),
+    ("var i = 0; while (i < 3) { i += 1; if i == 2 then breakout end; };", [True]),
+    ("fn f() { displayl 1; }; var i = 0; while (i < 3) { i += 1; f(); };", [True]),
+    ("for (var i = 0; i < 3; i = i + 1) { for (var j = 0; j < 3; j = j + 1) { if j == i then moveon end; }; };",
+     [False, True]),
+])
+def test_loops_are_marked_with_whether_they_may_signal(src, marks):
+    assert loops(src) == marks
+
+
+def test_only_blocks_that_may_signal_before_their_end_are_marked():
+    lines, _ = resolve(parse("""var i = 0;
+    while (i < 5) { i += 1; if i == 2 then { breakout; displayl i; } else { displayl i; breakout; } end; };"""))
+    then_body, else_body = [node for node in nodes(lines) if isinstance(node, Statements)][-2:]
+    assert then_body.signals and not else_body.signals
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_signals_inside_blocks_leave_the_loop(backend, capfd):
+    execute("""var i = 0;
+    while (i < 5) { i += 1; if i == 2 then { moveon; displayl "skipped"; } end;
+        if i == 4 then { if True then breakout end; displayl "skipped"; } end; displayl i; };
+    for (var j = 0; j < 5; j = j + 1) { if j > 0 then { breakout; displayl "skipped"; } end; displayl j; };""",
+            backend=backend)
+    assert capfd.readouterr().out == "1\n3\n0\n"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_signals_are_values(backend, capfd):
+    execute("""fn stop() { breakout; }; var i = 0;
+    while (i < 5) { i += 1; stop(); displayl i; }; displayl i; displayl stop();""", backend=backend)
+    assert capfd.readouterr().out == "1\nBreakOut()\n"
+
+
+def test_compiled_programs_keep_signal_values(tmp_path, capfd):
+    src = "fn stop() { breakout; }; var i = 0; while (i < 5) { i += 1; stop(); }; displayl i;"
+    nxb.compile_file(resolve(parse(src, buffered=True)), str(tmp_path / "p.nxb"))
+    nxb.run(nxb.load(str(tmp_path / "p.nxb")))
+    assert capfd.readouterr().out == "1\n"
@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from optimizer import nodes
+import runtime
+import nxb
+
+paths = """fnmemo paths(r, c) { if r == 0 or c == 0 then 1 else paths(r - 1, c) + paths(r, c - 1) end; };
+displayl paths(12, 12);"""
+
+
+def lookups(program):
+    return [(stats.name, stats.hits, stats.misses) for stats in memo_stats(program[0].hoisted)]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_results_are_looked_up(backend, capfd):
+    program = resolve(parse(paths))
+    BACKENDS[backend](program)
+    assert capfd.readouterr().out == "2704156\n"
+    assert lookups(program) == [("paths", 121, 168)]
+
+
+@pytest.mark.parametrize("pratt", [False, True])
+def test_fnmemo_parses_like_fn(pratt):
+    funcDef = resolve(parse(paths, pratt=pratt))[0].hoisted[0]
+    assert funcDef.isMemo and not funcDef.isRec and funcDef.memo.name == "paths"
+
+
+@pytest.mark.parametrize("src, reason", [
+    ("fnmemo f(n) { displayl n; n; };", "it prints"),
+    ("fnmemo f(n) { feed(\"n?\"); };", "it reads input"),
+    ("fnmemo f(n) { var a = [n]; a.PushBack(n); a; };", "it changes an array or hash"),
+    ("fnmemo f(n) { fn g() { n; }; g(); };", "it defines a function"),
+    ("var k = 2; fnmemo f(n) { n * k; };", "it reads k, outside its frame"),
+    ("var c = 0; fnmemo f(n) { c += n; };", "it assigns c, outside its frame"),
+    ("fn g(n) { display n; }; fn h(n) { g(n); }; fnmemo f(n) { h(n) + 1; };", "it calls h, which is not pure"),
+    ("fn g(n) { n; }; g = 3; fnmemo f(n) { g(n); };", "it calls g, which may hold any function"),
+    ("fnmemo f(g, n) { g(n); };", "it calls g, which may hold any function"),
+])
+def test_impure_functions_are_rejected(src, reason):
+    with pytest.raises(ValueError, match=f"fnmemo function f is not pure: {reason}."):
+        resolve(parse(src))
+
+
+def test_pure_functions_may_call_pure_functions(capfd):
+    src = """fn half(n) { n >> 1; }; fn third(n) { half(n) * 2 / 3; };
+    fnmemo f(n) { if n < 2 then n else f(half(n)) + f(n - 1) + third(n) end; };
+    displayl f(40);
+    """
+    program = resolve(parse(src))
+    run(program)
+    expected = capfd.readouterr().out
+    assert lookups(program) == [("f", 39, 40)]
+    run(resolve(parse(src.replace("fnmemo", "fn")), optimized=False))
+    assert capfd.readouterr().out == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_what_is_not_stored(backend, capfd):
+    src = """fnmemo twice(x) { x * 2; };
+    fnmemo pair(n) { [n, n]; };
+    displayl twice(1); displayl twice(1.0); displayl twice(True); displayl twice(1);
+    displayl pair(1); displayl pair(1);
+    """
+    program = resolve(parse(src))
+    BACKENDS[backend](program)
+    assert capfd.readouterr().out == "2\n2.0\n2\n2\n[1, 1]\n[1, 1]\n"
+    assert lookups(program) == [("twice", 1, 1), ("pair", 0, 2)]
+
+
+def test_least_recently_used_results_go_first(monkeypatch, capfd):
+    monkeypatch.setattr(runtime, "MEMO_SIZE", 2)
+    program = resolve(parse("fnmemo sq(n) { n * n; }; sq(1); sq(2); sq(1); sq(3); sq(1); sq(2);"))
+    run(program)
+    assert lookups(program) == [("sq", 2, 4)]
+
+
+def test_memo_functions_are_not_inlined():
+    lines, _ = resolve(parse("fnmemo sq(n) { n * n; }; displayl sq(3);"))
+    assert any(isinstance(node, FuncCall) for node in nodes(lines.statements[-1]))
+
+
+def test_compiled_programs_keep_their_memos(tmp_path, capfd):
+    nxb.compile_file(resolve(parse(paths, buffered=True)), str(tmp_path / "p.nxb"))
+    compiled = nxb.load(str(tmp_path / "p.nxb"))
+    nxb.run(compiled)
+    assert capfd.readouterr().out == "2704156\n"
+    assert format_memo_stats(compiled.hoisted) == ("function               hits     misses\n"
+                                                   "paths                   121        168")
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from bytecode_gen import line_of
+import nxb
+
+prog = """
+var big = 123456789012345678901234567890;
+var h = {"k": 2.5, "n": "x"};
+fn counter(start) {
+    var n = start;
+    fn step(by) { n += by; n; };
+    step(1) + step(2);
+};
+fnrec fact(n) { if n <= 1 then 1 else n * fact(n - 1) end; };
+for (var i = 0; i < 6; i += 1) {
+    if i % 2 == 0 then moveon end;
+    displayl counter(i);
+};
+displayl fact(20) + big;
+displayl h["k"];
+displayl [True, False, "sé"];
+"""
+
+
+def compile_to(path, src=prog):
+    return nxb.compile_file(resolve(parse(src, buffered=True)), str(path))
+
+
+def test_compiled_program_runs_like_the_source(tmp_path, capfd):
+    execute(prog, backend="bytecode")
+    expected = capfd.readouterr().out
+    compile_to(tmp_path / "p.nxb")
+    nxb.run(nxb.load(str(tmp_path / "p.nxb")))
+    assert capfd.readouterr().out == expected
+
+
+def test_code_is_read_in_place(tmp_path):
+    compile_to(tmp_path / "p.nxb")
+    compiled = nxb.load(str(tmp_path / "p.nxb"))
+    assert isinstance(compiled.code.code, memoryview)
+    assert all(isinstance(funcDef.bytecode.code, memoryview) for funcDef in compiled.hoisted)
+
+
+def test_line_tables_survive(tmp_path):
+    compile_to(tmp_path / "p.nxb")
+    loaded = nxb.load(str(tmp_path / "p.nxb")).code
+    assert list(loaded.lines)[0] == (0, 2)
+    assert line_of(loaded, len(loaded.code) - 2) == 16  # HALT follows the last statement
+
+
+@pytest.mark.parametrize("src", ["var x = 2 ** 2040; displayl x + 1;", f"displayl {'7' * 700};"])
+def test_wide_int_constants_survive(tmp_path, capfd, src):
+    execute(src)
+    expected = capfd.readouterr().out
+    compile_to(tmp_path / "p.nxb", src)
+    nxb.run(nxb.load(str(tmp_path / "p.nxb")))
+    assert capfd.readouterr().out == expected
+
+
+def test_version_mismatch_is_refused(tmp_path):
+    path = tmp_path / "p.nxb"
+    compile_to(path)
+    data = bytearray(path.read_bytes())
+    nxb.HEADER.pack_into(data, 0, nxb.MAGIC, nxb.FORMAT_VERSION + 1, *nxb.HEADER.unpack_from(data)[2:])
+    with pytest.raises(ValueError, match="recompile"):
+        nxb.loads(bytes(data))
+    with pytest.raises(ValueError, match="Not a .nxb file"):
+        nxb.loads(b"#!/usr/bin/env nexus\n" + bytes(data))
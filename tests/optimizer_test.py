@@ -0,0 +1,240 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import re
+import pytest
+from evaluator import *
+from optimizer import nodes, optimize, explain
+
+
+def statements(src):
+    lines, _ = resolve(parse(src))
+    return lines.statements
+
+
+def test_constant_subtrees_are_folded():
+    limit, f = statements("var limit = 4 * 10 ** 6; fn f(x) { x < 2 * 3 and \"a\" + \"b\" == \"ab\"; };")[:2]
+    assert limit.val == Number(4000000)
+    assert f.funcBody.statements[0] == BinOp("and", BinOp("<", Variable("x"), Number(6)), Boolean(True))
+
+
+@pytest.mark.parametrize("expr, error", [
+    ("0 ** -1", ValueError),
+    ("(0 - 2) ** 0.5", ValueError),
+    ("1 / 0", ZeroDivisionError),
+    ("\"a\" + 1", TypeError),
+])
+def test_errors_are_left_for_run_time(expr, error):
+    assert isinstance(statements(f"var x = {expr};")[0].val, BinOp)
+    with pytest.raises(error):
+        execute(f"var x = {expr};")
+
+
+@pytest.mark.parametrize("src, node", [
+    ("var i = 0; i += 1; displayl i * 1 + 0;", Variable),
+    ("var f = 1.5; f /= 2; displayl 1 * f;", Variable),
+    ("var i = 3; displayl not (not (i > 1));", BinOp),
+    ("var s = \"ab\"; displayl s * 1;", BinOp),   # "ab" * 1 is "ab", but "ab" + 0 is an error
+    ("var b = True; displayl b + 0;", BinOp),     # 1, not True
+    ("var i = 3; displayl not (not i);", UnaryOp),  # True, not 3
+    ("fn f(i) { displayl i * 1; }; f(2);", Variable),
+    ("fn f(i) { displayl i * 1; }; f(2); f(\"a\");", BinOp),
+    ("fn f(i) { displayl i * 1; }; var g = f; f(2);", BinOp),  # g(...) could pass anything
+    ("fn f(i) { i = \"s\"; displayl i * 1; }; f(2);", BinOp),
+    ("var i = 0; i = \"s\"; displayl i + 0;", BinOp),
+])
+def test_identities_need_the_type(src, node, capfd):
+    display = [stmt for stmt in statements(src) if isinstance(stmt, (DisplayL, FuncDef))][0]
+    display = display.funcBody.statements[-1] if isinstance(display, FuncDef) else display
+    assert type(display.val) is node
+    try:
+        execute(src)
+        output = capfd.readouterr().out
+    except TypeError:
+        output = "TypeError"
+    program = resolve(parse(src), optimized=False)
+    try:
+        run(program)
+        assert capfd.readouterr().out == output
+    except TypeError:
+        assert output == "TypeError"
+
+
+@pytest.mark.parametrize("src, reduced", [
+    ("var x = 0 - 3; displayl x ** 2;", True),
+    ("var x = 12345678901234567; x += 1; displayl x ** 2;", True),
+    ("fnrec f(n) { if n < 1 then 0 else n ** 2 + f(n - 1) end; }; displayl f(5);", True),
+    ("var x = 1.5; displayl x ** 2;", False),
+    ("var x = 3; displayl x ** 3;", False),
+    ("var x = 3; displayl x ** 2.0;", False),
+    ("fn f(n) { n ** 2; }; displayl f(2); displayl f(0.5);", False),
+])
+def test_integer_squares_are_multiplied(src, reduced, capfd):
+    lines, _ = optimize(resolve(parse(src), optimized=False), inline_depth=0)
+    squares = [node for stmt in lines.statements + [s for f in lines.hoisted for s in f.funcBody.statements]
+               for node in nodes(stmt) if isinstance(node, BinOp) and node.op in ("*", "**")]
+    assert [node.op for node in squares] == ["*" if reduced else "**"]
+    if reduced:
+        assert squares[0].left == squares[0].right == Variable(squares[0].left.var_name)
+    run(resolve(parse(src), optimized=False))
+    expected = capfd.readouterr().out
+    for backend in BACKENDS:
+        execute(src, backend=backend)
+        assert capfd.readouterr().out == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_float_squares_stay_floats(backend, capfd):
+    execute("var z = 3; displayl z ** 2.0;", backend=backend)
+    assert capfd.readouterr().out == "9.0\n"
+
+
+def test_double_negation_in_a_condition_goes():
+    loop = statements("var i = 0; while (not (not i)) { i = 0; };")[1]
+    assert loop.condition == Variable("i")
+
+
+def test_optimized_runs_match(capfd):
+    src = """var limit = 2 ** 10 - 1; var total = 0;
+    for (var i = 0; i < limit % 100; i += 1 * 1) {
+        if (i % (1 + 2) == 0 + 0) or not (not (i % 5 == 0)) then total += i * 1 end;
+    };
+    displayl total; displayl limit / 2; displayl "ab" * (1 + 1);
+    """
+    run(resolve(parse(src), optimized=False))
+    expected = capfd.readouterr().out
+    for backend in BACKENDS:
+        execute(src, backend=backend)
+        assert capfd.readouterr().out == expected
+
+
+def optimized(src, **limits):
+    report = []
+    return optimize(resolve(parse(src, buffered=True), optimized=False), report, **limits), report
+
+
+def moved(src, **limits):
+    program, report = optimized(src, **limits)
+    return program, [(where, line, match[1]) for where, line, what in report
+                     if (match := re.fullmatch(r"@\d+ = (.*) \(moved out of the loop\)", what))]
+
+
+def same_output(src, capfd):
+    run(resolve(parse(src), optimized=False))
+    expected = capfd.readouterr().out
+    for backend in BACKENDS:
+        execute(src, backend=backend)
+        assert capfd.readouterr().out == expected
+
+
+def test_invariants_move_out_of_loops(capfd):
+    src = """var n = 10; var i = 0; var total = 0;
+    while (i * i <= n * 3) {
+        for (var j = 0; j < n - 1; j += 1) { total += j % (n + i); };
+        i += 1;
+    };
+    displayl total;
+    fnrec f(m) { var k = 0; var t = 0; while (k < m * m) { t += k; k += 1; }; if m > 0 then t + f(m - 1) else t end; };
+    displayl f(5);
+    """
+    (lines, _), report = moved(src)
+    assert report == [("<program>", 2, "n * 3"), ("<program>", 2, "n - 1"), ("<program>", 3, "n + i"),
+                      ("f", 7, "m * m")]
+    assert [stmt.var_name for stmt in lines.statements[3:5]] == ["@1", "@2"]
+    loop = lines.statements[5]
+    assert isinstance(loop, WhileLoop) and loop.condition.right == Variable("@1")
+    assert lines.hoisted[0].frame_size == resolve(parse(src), optimized=False)[0].hoisted[0].frame_size + 1
+    same_output(src, capfd)
+
+
+@pytest.mark.parametrize("src", [
+    "var n = 3; var i = 0; while (i < n * 2) { n -= 1; i += 1; }; displayl i;",
+    "var n = 3; fn bump() { n += 1; }; var i = 0; while (i < n * 2) { if i < 3 then bump() end; i += 1; }; displayl i;",
+    "var n = 0; var i = 0; while (i < 0) { displayl 10 % n; displayl 1 / n; i += 1; }; displayl i;",
+    "var n = 2.5; var i = 0; while (i < 3) { displayl n * i; i += 1; };",  # int * float can overflow
+    "var s = \"ab\"; var i = 0; while (i < 2) { displayl s * 2; i += 1; };",
+    "var a = [1, 2]; var i = 0; while (i < 2) { displayl a[0] + 1; a[0] = i; i += 1; };",
+])
+def test_what_may_change_or_raise_stays_in_the_loop(src, capfd):
+    assert moved(src)[1] == []
+    same_output(src, capfd)
+
+
+def test_calls_that_write_elsewhere_do_not_stop_motion(capfd):
+    src = "var n = 3; var c = 0; fn g(x) { var y = x; y += 1; }; for (var i = 0; i < n * 2; i += 1) { c += g(i); }; displayl c;"
+    assert moved(src, inline_depth=0)[1] == [("<program>", 1, "n * 2")]
+    same_output(src, capfd)
+
+
+def test_explain_lists_moved_operations():
+    _, report = moved("var n = 4; var i = 0; while (i < n + 1) { i += 1; };")
+    assert report == [("<program>", 1, "n + 1")]
+    _, report = optimized("var n = 4; var i = 0; while (i < n + 1) { i += 1; };")
+    assert explain(report) == "<program>:1: @1 = n + 1 (moved out of the loop)"
+    assert explain([]) == "No calls inlined and no loop-invariant operations."
+
+
+def calls(lines):
+    return [node.funcName for stmt in lines.statements + [s for f in lines.hoisted for s in f.funcBody.statements]
+            for node in nodes(stmt) if isinstance(node, FuncCall)]
+
+
+def test_small_functions_are_inlined(capfd):
+    src = """fn square(x) { x * x; };
+    fn between(x, lo, hi) { var y = x % 100; y >= lo and y <= hi; };
+    var total = 0;
+    for (var i = 0; i < 300; i += 1) {
+        if between(square(i), 10, 50) then total += square(i % 7) end;
+    };
+    displayl total;
+    """
+    (lines, _), report = optimized(src)
+    assert calls(lines) == []
+    assert report == [("<program>", 5, "inlined call to square"), ("<program>", 5, "inlined call to between"),
+                      ("<program>", 5, "inlined call to square")]
+    same_output(src, capfd)
+
+
+@pytest.mark.parametrize("src", [
+    "fnrec f(n) { if n < 1 then 0 else f(n - 1) end; }; displayl f(3);",
+    "fn f(n) { displayl n; }; f(3);",
+    "fn f(n) { var k = 0; while (k < n) { k += 1; }; k; }; displayl f(3);",
+    "var c = 0; fn f(n) { c += n; }; f(3); f(4); displayl c;",
+    "fn f(n) { fn g() { n; }; g(); }; displayl f(2);",
+])
+def test_what_is_not_inlined(src, capfd):
+    (lines, _), report = optimized(src)
+    assert "f" in calls(lines) and ("<program>", 1, "inlined call to f") not in report
+    same_output(src, capfd)
+
+
+def test_arguments_are_evaluated_once_and_in_order(capfd):
+    src = """fn show(v) { display v; v; };
+    fn twice(x) { x + x; };
+    fn sub(a, b) { a - b; };
+    displayl twice(show(5)); displayl sub(show(1), show(2)); displayl sub(10, 4);
+    """
+    (lines, _), _ = optimized(src)
+    assert calls(lines) == ["show", "show", "show"]
+    assert lines.statements[-1] == DisplayL(Number(6))
+    same_output(src, capfd)
+
+
+def test_outer_variables_of_an_inlined_body_are_found(capfd):
+    src = """var base = 100;
+    fn outer(n) { fn scale(x) { x * n + base; }; fn go(m) { scale(m) + 1; }; go(3) + scale(1); };
+    displayl outer(2);
+    """
+    (lines, _), report = optimized(src)
+    assert [what for _, _, what in report] == ["inlined call to go", "inlined call to scale",
+                                               "inlined call to scale", "inlined call to scale"]
+    same_output(src, capfd)
+
+
+def test_inlining_limits(capfd):
+    src = "fn inc(x) { x + 1; }; fn twice(x) { inc(inc(x)) * 1; }; var n = 1; displayl twice(n);"
+    assert calls(optimized(src)[0][0]) == []
+    assert calls(optimized(src, inline_depth=1)[0][0]) == ["inc", "inc"]
+    assert calls(optimized(src, inline_depth=0)[0][0]) == ["twice", "inc", "inc"]
+    assert calls(optimized(src, inline_size=4)[0][0]) == ["twice"]
+    same_output(src, capfd)
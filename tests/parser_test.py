@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from parser import *
+
+programs = [
+    "display(2 + 3 * 4 - 1);",
+    """
+    var x = 999;
+    var res = 0;
+    while (x > 0) {
+        if (x % 3 == 0 or x % 5 == 0) then { res += x; } end;
+        x -= 1;
+    };
+    displayl res;
+    """,
+    """
+    fn fact(n) { if n <= 1 then 1 else n * fact(n - 1) end; };
+    var arr = [1, 2, "three"];
+    var h = {"k": 1};
+    arr.PushBack(fact(5));
+    h.Add("j", arr.Length);
+    for (var i = 0; i < 3; i += 1) { displayl arr[i]; };
+    displayl not (h["k"] == 1) and char(65) == "A";
+    """,
+]
+
+
+@pytest.mark.parametrize("pratt", [False, True])
+@pytest.mark.parametrize("prog", programs)
+def test_buffered_parse_matches(prog, pratt):
+    assert parse(prog, buffered=True, pratt=pratt) == parse(prog)
+
+
+@pytest.mark.parametrize("src, val", [
+    ("42;", 42),
+    ("2.5;", 2.5),
+    ("3.;", 3.0),
+    ("x - 7;", -7),
+])
+def test_number_literals_are_decoded(src, val):
+    lines, _ = parse(("var x = 1;" if "x" in src else "") + src)
+    node = lines.statements[-1]
+    if isinstance(node, BinOp):
+        node = node.right
+    assert node == Number(val) and type(node.val) is type(val)
+
+
+@pytest.mark.parametrize("prog", programs + [
+    "displayl 2 ** 3 ** 2 - 10 / 5 ÷ 2 % 3;",
+    "displayl not 1 < 2 and ~ 3 | 4 ^ 5 & 6 or 7 >> 1 << 2;",
+    "displayl char(65 + 1) == \"B\" and ascii(\"a\") >= 97;",
+    "var h = {\"a\": 1, \"b\": True}; displayl h[\"a\"];",
+    "var v = if 1 == 1 then 2 else 3 end; displayl (v + 1) * 2;",
+])
+def test_pratt_parse_matches(prog):
+    assert parse(prog, pratt=True) == parse(prog)
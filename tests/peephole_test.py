@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from bytecode_gen import *
+from peephole import optimize, optimize_program
+
+
+def optimized(src):
+    program = resolve(parse(src), optimized=False)  # leave the folding to the peephole pass
+    code = codegen(program)
+    return program, code, optimize_program(program, code)
+
+
+def ops(code_object):
+    return [(OPNAMES[op], code_object.consts[arg] if op == PUSH_CONST else arg)
+            for _, op, arg in instructions(code_object.code)]
+
+
+def test_constant_arithmetic_is_folded():
+    _, code, report = optimized("displayl 2 + 3 * 4 - 10 / 4;")
+    assert ops(code) == [("PUSH_CONST", 11.5), ("DISPLAYL", 0), ("HALT", 0)]
+    assert report == [("<program>", 8)]
+
+
+def test_errors_are_left_for_run_time():
+    _, code, _ = optimized("fn f() { 1 / 0; };")
+    assert "DIV" in [name for name, _ in ops(code.consts[0].bytecode)]
+
+
+def test_not_before_a_jump_flips_the_jump():
+    _, code, _ = optimized("var x = 1; if not (x > 5) then displayl x end;")
+    names = [name for name, _ in ops(code)]
+    assert "NOT" not in names and "JUMP_IF_TRUE" in names
+
+
+def test_pushes_that_are_popped_are_removed():
+    (lines, _), _, report = optimized("fn f(a) { 1; a; a * 2; };")
+    body = lines.hoisted[0].bytecode
+    assert [name for name, _ in ops(body)] == ["LOAD", "PUSH_CONST", "MUL", "RETURN"]
+    assert ("f", 4) in report
+
+
+def test_jumps_are_threaded_and_stay_on_instructions():
+    _, code, _ = optimized("""
+    var i = 0;
+    while (True) {
+        i += 1;
+        if i == 3 then breakout else if i == 1 then moveon end end;
+    };
+    displayl i;
+    """)
+    starts = {ip for ip, _, _ in instructions(code.code)}
+    jumps = [(op, arg) for _, op, arg in instructions(code.code) if op in JUMPS]
+    assert all(arg in starts for _, arg in jumps)
+    assert all(code.code[arg] != JUMP for _, arg in jumps)
+    assert not any(value is True for _, value in ops(code))  # `while (True)` tests nothing
+
+
+def test_unreachable_code_is_dropped():
+    (lines, _), _, _ = optimized("fn f(n) { while (True) { n += 1; if n > 9 then breakout end; }; };")
+    body = lines.hoisted[0].bytecode
+    names = [name for name, _ in ops(body)]
+    assert names == ["LOAD", "PUSH_CONST", "ADD", "ASSIGN", "LOAD", "PUSH_CONST", "GT",
+                     "JUMP_IF_FALSE", "PUSH_CONST", "RETURN"]
+
+
+def test_optimized_programs_behave_the_same(capfd):
+    prog = """
+    var total = 0;
+    for (var j = 0; j < 10; j += 1) {
+        if not (j % 2 == 0) then moveon end;
+        if j > 2 * 3 then breakout end;
+        total += j * (1 + 1);
+        5;
+    };
+    displayl total;
+    displayl if 1 > 2 then "a" else "b" end;
+    """
+    execute(prog, backend="tree")
+    expected = capfd.readouterr().out
+    execute(prog, backend="bytecode")
+    assert capfd.readouterr().out == expected
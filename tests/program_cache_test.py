@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from program_cache import *
+
+prog = """
+fn square(x) { x * x; }
+var total = 0;
+for (var i = 1; i <= 4; i += 1) { total += square(i); };
+displayl total;
+"""
+
+
+def test_cache_miss_then_hit(tmp_path, capfd):
+    program, hit = load_program(prog, str(tmp_path))
+    assert not hit
+    cached, hit = load_program(prog, str(tmp_path))
+    assert hit and cached == program
+    run(cached)
+    assert capfd.readouterr().out == "30\n"
+
+
+def test_cache_keys_on_source_and_parser(tmp_path):
+    load_program(prog, str(tmp_path))
+    assert not load_program(prog + "displayl 1;", str(tmp_path))[1]
+    assert not load_program(prog, str(tmp_path), pratt=True)[1]
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_stale_stamp_is_a_miss(tmp_path):
+    path = cache_path(str(tmp_path), prog)
+    load_program(prog, str(tmp_path))
+    with open(path, "wb") as f:
+        pickle.dump(("old interpreter", parse("displayl 1;")), f)
+    program, hit = load_program(prog, str(tmp_path))
+    assert not hit and program == resolve(parse(prog))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    sources = [f"displayl {n};" for n in range(3)]
+    for n, src in enumerate(sources):
+        load_program(src, str(tmp_path))
+        os.utime(cache_path(str(tmp_path), src), (n, n))
+    size = os.path.getsize(cache_path(str(tmp_path), sources[0]))
+    load_program(sources[0], str(tmp_path))  # hit, now the most recent
+    load_program("displayl 3;", str(tmp_path), max_bytes=3 * size)
+    remaining = set(os.listdir(tmp_path))
+    assert os.path.basename(cache_path(str(tmp_path), sources[0])) in remaining
+    assert os.path.basename(cache_path(str(tmp_path), sources[1])) not in remaining
+    assert len(remaining) == 3
+
+
+def test_entries_evicted_by_another_run_are_misses(tmp_path, monkeypatch):
+    load_program(prog, str(tmp_path))
+    path = cache_path(str(tmp_path), prog)
+
+    def evicted(p, *args):
+        os.remove(p)
+        raise FileNotFoundError(p)
+
+    monkeypatch.setattr(os, "utime", evicted)  # removed between the read and the touch
+    program, hit = load_program(prog, str(tmp_path))
+    assert not hit and program == resolve(parse(prog))
+    assert os.path.exists(path)  # written again
+
+
+def test_eviction_skips_vanished_entries(tmp_path, monkeypatch):
+    for n in range(3):
+        load_program(f"displayl {n};", str(tmp_path))
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda d: listdir(d) + ["gone" + CACHE_SUFFIX])
+    remove = os.remove
+
+    def racing_remove(p):
+        remove(p)
+        remove(p)  # another run got there first
+
+    monkeypatch.setattr(os, "remove", racing_remove)
+    evict(str(tmp_path), max_bytes=0)
+    assert listdir(tmp_path) == []
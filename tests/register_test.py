@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from register_gen import *
+
+programs = [
+    """
+    var total = 0;
+    for (var j = 0; j < 10; j += 1) {
+        if j % 2 == 0 then moveon end;
+        if j > 7 then breakout end;
+        total = total + j * j;
+    };
+    displayl total;
+    """,
+    """
+    fnrec gcd(a, b) { if b == 0 then a else gcd(b, a % b) end; };
+    fn mk(a) { fn add(b) { a + b; }; add; };
+    var ten = mk(10);
+    fn stop(x) { breakout; };
+    var n = 0;
+    while (n < 10) { n += 1; if n == 4 then stop(n) else n end; };
+    displayl gcd(1071, 462) + ten(n);
+    """,
+    """
+    var arr = [3, 1, 2];
+    var h = {"a": 1, "b": 2};
+    arr.PushFront(0);
+    arr.Insert(2, 9);
+    arr[0] = arr.PopBack + arr.Length;
+    arr.Remove(1);
+    h.Add("c", 3);
+    h["a"] = h["b"] * 10;
+    h.Remove("b");
+    displayl arr;
+    displayl h;
+    """,
+    """
+    var g = 1;
+    fn bump(n) { g += n; g; };
+    displayl g + bump(10);
+    var x = 5;
+    x += bump(1);
+    x = x * bump(1) + x;
+    displayl x;
+    var a = 1;
+    var b = 2;
+    a = b and a;
+    displayl a;
+    """,
+]
+
+
+@pytest.mark.parametrize("prog", programs)
+def test_register_vm_matches_tree_walker(prog, capfd):
+    execute(prog, backend="tree")
+    expected = capfd.readouterr().out
+    execute(prog, backend="register")
+    assert capfd.readouterr().out == expected
+
+
+def test_locals_are_registers():
+    lines, _ = program = resolve(parse("var x = 0; x = x + 1; x += 1;"))
+    code = register_codegen(program)
+    ops = [(op, a, b) for _, op, a, b, _ in instructions(code.code)]
+    x = lines.statements[0].slot
+    assert ops == [(LOADK, x, 0), (ADD + CONST_OPERAND, x, x), (ADD + CONST_OPERAND, x, x), (HALT, 0, 0)]
+
+
+def test_calls_get_room_for_temporaries():
+    lines, _ = program = resolve(parse("fn f(a, b) { (a + b) * (a - b); }; displayl f(3, 2);"))
+    register_codegen(program)
+    funcDef = lines.hoisted[0]
+    assert funcDef.registers.size == funcDef.frame_size > 3
+    register_codegen(program)
+    assert funcDef.registers.size == funcDef.frame_size  # generating again does not widen twice
+
+
+def test_register_vm_errors_match_the_tree_walker():
+    with pytest.raises(IndexError, match="Cannot PopBack from an empty array: arr"):
+        execute("var arr = []; arr.PopBack;", backend="register")
+
+
+def test_loop_conditions_are_one_jump_at_the_bottom():
+    lines, _ = program = resolve(parse("var i = 0; while (i < 10) { i += 1; }; displayl i;"))
+    code = register_codegen(program)
+    ops = [OPNAMES[op] for _, op, _, _, _ in instructions(code.code)]
+    assert ops == ["LOADK", "JUMP", "ADDK", "JUMP_IF_LTK", "DISPLAYL", "HALT"]
+
+
+def test_tail_calls_reuse_the_registers(capfd):
+    execute("fnrec total(n, acc) { if n == 0 then acc else total(n - 1, acc + n) end; }; displayl total(100000, 0);",
+            backend="register")
+    assert capfd.readouterr().out == "5000050000\n"
@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+
+
+def test_blocks_share_the_function_frame():
+    lines, _ = resolve(parse("""
+    var total = 0;
+    fn work(n) {
+        while (n > 0) {
+            for (var j = 0; j < 2; j += 1) { total += n; };
+            n -= 1;
+        };
+    };
+    """))
+    work = lines.statements[1]
+    loop = work.funcBody.statements[0]
+    inner = loop.body.statements[0]
+    init, update = inner.initialization, inner.body.statements[0]
+    assert (loop.condition.left.depth, loop.condition.left.slot) == (0, 1)  # n, parameter 1
+    assert init.depth == 0 and init.slot == 2                              # j, flattened
+    assert (update.depth, update.slot) == (1, lines.statements[0].slot)    # total, global
+    assert work.frame_size == 3
+
+
+def test_shadowing_binds_to_the_innermost_declaration(capfd):
+    execute("""
+    var x = 1;
+    var i = 0;
+    while (i < 2) {
+        var x = i + 10;
+        displayl x;
+        i += 1;
+    };
+    displayl x;
+    """)
+    assert capfd.readouterr().out == "10\n11\n1\n"
+
+
+def test_nested_function_reads_enclosing_frames(capfd):
+    execute("""
+    var g = 1000;
+    fn outer(a) {
+        var b = a + 1;
+        fn inner(c) { a + b + c + g; };
+        inner(100);
+    };
+    displayl outer(5);
+    """)
+    assert capfd.readouterr().out == "1111\n"
+
+
+def test_function_without_semicolon_is_hoisted(capfd):
+    execute("""
+    fn twice(x) { x * 2; }
+    displayl twice(21);
+    """)
+    assert capfd.readouterr().out == "42\n"
+
+
+def test_each_call_gets_its_own_frame(capfd):
+    execute("""
+    fn fib(n) {
+        if n < 2 then n else fib(n - 1) + fib(n - 2) end;
+    };
+    fn mk(a) { fn add(b) { a + b; }; add; };
+    var one = mk(1);
+    var ten = mk(10);
+    displayl fib(15);
+    displayl one(2) + ten(2);
+    """)
+    assert capfd.readouterr().out == "610\n15\n"
+
+
+def test_call_frames_are_fresh():
+    fact = resolve(parse("fnrec fact(n) { if n <= 1 then 1 else n * fact(n - 1) end; };"))
+    lines, _ = fact
+    func = Function(lines.hoisted[0], None)
+    frame = func.call_frame()
+    frame[1] = 5
+    again = func.call_frame()
+    assert again is not frame and again == [None] * len(frame)
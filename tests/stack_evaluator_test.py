@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+
+depth = "fn depth(n) { if n == 0 then 0 else 1 + depth(n - 1) end; }; displayl depth(100000);"
+
+
+def test_recursion_is_not_bounded_by_the_python_stack(capfd):
+    execute(depth, backend="stack")
+    assert capfd.readouterr().out == "100000\n"
+    with pytest.raises(RecursionError):
+        execute(depth, backend="tree")
+
+
+@pytest.mark.parametrize("src", [
+    """fn k(x) { display x; x; }; var h = {k(1): k(2), k(3): k(4)};
+    h[k(1)] = k(5); h.Add(k(6), k(7)); var a = [k(8), k(9)]; a[k(0)] = k(10);
+    displayl h; displayl a; displayl k(1) + k(2) * k(3); displayl k(0) and k(11); displayl k(12) or k(13);""",
+    """var a = [3, 1]; a.Insert(1, 2); a.PushFront(0); a.PushBack(4); displayl a.Remove(2);
+    displayl a; displayl a.PopFront + a.PopBack; var x = 5; x += 2; x *= 3; displayl x;""",
+    """var i = 0; var s = 0;
+    while (i < 10) { i += 1; if i % 2 == 0 then moveon end; for (var j = 0; j < 10; j = j + 1) {
+        if j > i then breakout end; s += j; }; if i > 7 then breakout end; };
+    displayl i; displayl s;""",
+    """fn f(n) { var t = 0; for (var i = 0; i < n; i = i + 1) { if i == 3 then moveon end; t += f(i); }; t + 1; };
+    displayl f(7);""",
+    """fn add(a, b) { a + b; }; displayl add(1, 2, 3); fn empty() { }; displayl empty();
+    displayl if False then 1 end;""",
+])
+def test_values_and_output_match_the_tree_walker(src, capfd):
+    execute(src, backend="tree")
+    expected = capfd.readouterr().out
+    execute(src, backend="stack")
+    assert capfd.readouterr().out == expected
+
+
+def test_errors_match_the_tree_walker():
+    for backend in ("tree", "stack"):
+        with pytest.raises(IndexError):
+            execute("fn add(a, b) { a + b; }; add(1);", backend=backend)
+        with pytest.raises(ValueError, match="Function f is not defined correctly."):
+            execute("fn f() { 1; }; f = 2; f();", backend=backend)
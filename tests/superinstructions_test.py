@@ -0,0 +1,85 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from bytecode_gen import *
+from peephole import optimize_program
+from superinstructions import fuse_program, profile
+
+
+def fused(src):
+    program = resolve(parse(src))
+    code = codegen(program)
+    optimize_program(program, code)
+    fuse_program(program, code)
+    return program, code
+
+
+def ops(code_object):
+    return [(OPNAMES[op], code_object.consts[arg] if op in FUSED else arg)
+            for _, op, arg in instructions(code_object.code)]
+
+
+def test_counting_loop_is_fused():
+    (lines, _), _ = fused("fn f(n) { var i = 0; while (i < 10) { i += 1; }; i; };")
+    names = [name for name, _ in ops(lines.hoisted[0].bytecode)]
+    assert names == ["PUSH_CONST", "VARBIND", "LOAD_LOCAL_CMP_CONST_JUMP", "INC_LOCAL", "JUMP",
+                     "LOAD", "RETURN"]
+
+
+def test_operands_are_pooled_and_the_jump_target_is_a_code_position():
+    (lines, _), _ = fused("fn f(n, k) { if n % k == 0 then 1 else 2 end; };")
+    body = lines.hoisted[0].bytecode
+    (ip, op, arg), *_ = instructions(body.code)
+    assert OPNAMES[op] == "MOD_EQ_ZERO_JUMP"
+    slot, divisor, value, target = body.consts[arg]
+    assert (slot, divisor, value) == (1, 2, None)
+    assert target in {ip for ip, _, _ in instructions(body.code)}
+
+
+@pytest.mark.parametrize("src, name", [
+    ("x = x + y;", "ADD_LOCAL"),
+    ("x -= 2;", "DEC_LOCAL"),
+    ("if x <= y then 1 end;", "LOAD_LOCAL_CMP_LOCAL_JUMP"),
+    ("if x % 3 == 0 then 1 end;", "MOD_EQ_ZERO_JUMP"),
+])
+def test_shapes(src, name):
+    _, code = fused("var x = 9; var y = 4; " + src)
+    assert name in [name for name, _ in ops(code)]
+
+
+def test_non_numeric_steps_and_other_targets_are_left_alone():
+    _, code = fused('var s = "a"; var t = 1; s += "b"; t = s + t; if not (t < 2) then 1 end;')
+    assert not any(op in FUSED for _, op, _ in instructions(code.code))
+
+
+def test_fused_programs_behave_the_same(capfd):
+    prog = """
+    var total = 0;
+    var k = 3;
+    for (var j = 0; j < 30; j += 1) {
+        if j % k == 0 then moveon end;
+        if j % 7 == 0 then total = total + j end;
+        if j >= 25 then breakout end;
+        total -= 1;
+    };
+    displayl total;
+    var s = "x";
+    s += "y";
+    displayl s;
+    """
+    execute(prog, backend="tree")
+    expected = capfd.readouterr().out
+    execute(prog, backend="bytecode")
+    assert capfd.readouterr().out == expected
+
+
+def test_profile_counts_executed_sequences(capfd):
+    program = resolve(parse("var i = 0; while (i < 5) { displayl i * 2; i += 1; };"))
+    counts = profile([program], lengths=(2,))
+    assert counts[("LOAD", "PUSH_CONST")] == 5
+    assert counts[("MUL", "DISPLAYL")] == 5
+    assert ("INC_LOCAL", "JUMP") in counts
+    unfused = profile([program], lengths=(2,), fused=False)
+    assert ("INC_LOCAL", "JUMP") not in unfused
@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from optimizer import nodes
+import nxb
+from disassembler import dis
+
+total = "fnrec total(n, acc) { if n == 0 then acc else total(n - 1, acc + n) end; };"
+
+
+def tails(src):
+    lines, _ = resolve(parse(src))
+    return [(node.funcName, node.tail) for f in lines.hoisted for stmt in f.funcBody.statements
+            for node in nodes(stmt) if isinstance(node, FuncCall)]
+
+
+@pytest.mark.parametrize("src, marks", [
+    (total, [("total", True)]),
+    ("fnrec f(n) { if n < 1 then 0 else n * f(n - 1) end; };", [("f", False)]),
+    ("fnrec f(n) { f(n - 1); n; };", [("f", False)]),
+    ("fnrec f(n) { var m = n; if m > 5 then f(m - 2) else (if m > 0 then f(m - 1) else 0 end) end; };",
+     [("f", True), ("f", True)]),
+    ("fn f(n) { if n < 1 then 0 else f(n - 1) end; };", [("f", False)]),
+    ("fnrec g(n) { n; }; fnrec f(n) { if n < 1 then 0 else g(n - 1) end; };", [("g", False)]),
+])
+def test_only_self_calls_of_fnrec_functions_in_tail_position_are_marked(src, marks):
+    assert tails(src) == marks
+
+
+@pytest.mark.parametrize("backend", ["tree", "bytecode"])
+def test_tail_recursion_runs_in_constant_stack(backend, capfd):
+    execute(f"{total} displayl total(20000, 0);", backend=backend)
+    assert capfd.readouterr().out == "200010000\n"
+
+
+@pytest.mark.parametrize("src", [
+    f"{total} displayl total(10, 0); displayl total(0, 5);",
+    """fnrec gcd(a, b) { if b == 0 then a else gcd(b, a % b) end; };
+    displayl gcd(1071, 462); var g = gcd; displayl g(10, 4);""",
+    """fnrec count(n, step) { fn next() { n - step; }; if n <= 0 then n else count(next(), step) end; };
+    displayl count(10, 3);""",
+    """fnrec outer(n) { fnrec inner(k, acc) { if k == 0 then acc + n else inner(k - 1, acc + 1) end; };
+    if n == 0 then 0 else inner(n, 0) + outer(n - 1) end; };
+    displayl outer(4);""",
+])
+def test_tail_calls_match_on_every_backend(src, capfd):
+    run(resolve(parse(src), optimized=False))
+    expected = capfd.readouterr().out
+    for backend in BACKENDS:
+        execute(src, backend=backend)
+        assert capfd.readouterr().out == expected
+
+
+def test_listing_shows_tail_calls():
+    src = f"{total} displayl total(3, 0);"
+    listing = dis(nxb.build(resolve(parse(src, buffered=True))), src)
+    assert "TAIL_CALL" in listing and "total, 2 args" in listing
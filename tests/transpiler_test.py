@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+import pytest
+from evaluator import *
+from transpiler import Untranslatable, compile_source, transpile
+
+
+def test_program_becomes_python_functions_and_loops():
+    source = transpile(resolve(parse("""
+    fn fib(n) { if n < 2 then n else fib(n - 1) + fib(n - 2) end; };
+    var i = 0;
+    while (i < 3) { displayl fib(i); i += 1; };
+    """)))
+    assert source.startswith("def nexus_main():")
+    assert "    def fib_0_1(n_1_1):" in source
+    assert "            return n_1_1" in source
+    assert "    while (i_0_2 < 3):" in source
+    assert "        i_0_2 = (i_0_2 + 1)" in source
+
+
+def test_loop_signals_follow_statement_values(capfd):
+    execute("""
+    var n = 0;
+    fn stop(x) { breakout; };
+    for (var i = 0; i < 10; i += 1) {
+        if i % 2 == 0 then moveon end;
+        if i == 7 then stop(i) else n += i end;
+    };
+    displayl n;
+    """, backend="python")
+    assert capfd.readouterr().out == "9\n"
+
+
+def test_assigning_enclosing_frames(capfd):
+    execute("""
+    var total = 0;
+    fn counter() { var c = 0; fn tick() { c += 1; total += c; c; }; tick; };
+    var t = counter();
+    t(); t();
+    displayl t() + total;
+    """, backend="python")
+    assert capfd.readouterr().out == "9\n"
+
+
+def test_loop_inside_an_expression_falls_back(capfd):
+    prog = """
+    displayl 1 + (if True then { var k = 0; while (k < 4) { k += 1; }; k; } else 0 end);
+    """
+    with pytest.raises(Untranslatable):
+        transpile(resolve(parse(prog)))
+    execute(prog, backend="python")
+    assert capfd.readouterr().out == "5\n"
+
+
+def test_code_objects_are_cached():
+    prog = "var x = 2; displayl x ** 10;"
+    execute(prog, backend="python")
+    hits = compile_source.cache_info().hits
+    execute(prog, backend="python")
+    assert compile_source.cache_info().hits == hits + 1
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_extra_call_arguments_are_ignored(backend, capfd):
+    execute("""
+    fn pair(a, b) { a * 10 + b; };
+    fnmemo next(n) { n + 1; };
+    var h = pair;
+    displayl pair(1, 2, 3);
+    displayl next(7, 8);
+    displayl h(4, 5, 6);
+    """, backend=backend)
+    assert capfd.readouterr().out == "12\n8\n45\n"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("prog, error, output", [
+    ("var f = 2; f(1);", ValueError, ""),
+    ("var f = 2; f();", ValueError, ""),
+    ("fn f(a) { a; }; f = 2; f(1);", ValueError, ""),
+    ("fn k(x) { display x; x; }; fn add(a, b) { a + b; }; add(k(1));", IndexError, "1"),
+    ("fnmemo add(a, b) { a + b; }; var g = add; g(1);", IndexError, ""),
+])
+def test_bad_calls_raise_the_same_errors(backend, prog, error, output, capfd):
+    with pytest.raises(error):
+        execute(prog, backend=backend)
+    assert capfd.readouterr().out == output
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_float_literals_out_of_range(backend, capfd):
+    execute(f"var x = {'9' * 400}.0; displayl x; displayl -x; displayl x - x;", backend=backend)
+    assert capfd.readouterr().out == "inf\n-inf\nnan\n"